@@ -1,8 +1,13 @@
 import sys
 import os
 import uuid
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
 import torch
 import cv2
+import numpy as np
 import platform
 import pathlib
 from pathlib import Path
@@ -19,57 +24,166 @@ else:
     raise RuntimeError(f"YOLOv5 path not found at: {yolov5_path}")
 
 # ✅ Import from YOLOv5 modules
-from utils.general import non_max_suppression, scale_boxes
+from utils.general import MEMORY, SPANS, batched_non_max_suppression, scale_boxes, span
 from utils.torch_utils import select_device
 from models.common import DetectMultiBackend
+from models.yolo import Detect
+from app.model.quality import QUALITY_MODES, QualityController
+from app.model.shedding import SHED_SIZES, LoadShedder
+
+# ✅ SPANS=1 records nested per-stage timing spans (endpoint -> infer -> decode/forward/nms/...), served at GET /spans
+SPANS.enabled = os.getenv("SPANS", "").lower() in ("1", "true")
 
 # ✅ Load model
 model_path = Path(__file__).parent / "apple_leaf_yolov5.pt"
 device = select_device("cpu")
-model = DetectMultiBackend(str(model_path), device=device)
+# ✅ COMPILE=trace|inductor compiles the model for the single-image serving sizes (once the Detect heads below are
+# configured), other shapes run eagerly
+compile_mode = os.getenv("COMPILE") or False
+# ✅ Opt-in NHWC convolutions (CHANNELS_LAST=1) and bfloat16 autocast on AVX512/AMX CPUs (BF16=1)
+channels_last = os.getenv("CHANNELS_LAST", "").lower() in ("1", "true")
+bf16 = os.getenv("BF16", "").lower() in ("1", "true")
+model = DetectMultiBackend(str(model_path), device=device, channels_last=channels_last, bf16=bf16)
 model.model.eval()
 
-def predict_and_annotate(image_path):
+# ✅ Batched TTA pads every view to full size (~40% more FLOPs), so it only pays off with parallel threads
+tta_batch = os.getenv("TTA_BATCH", str(torch.get_num_threads() > 1)).lower() in ("1", "true")
+model.model.tta_batch = tta_batch
+
+# ✅ Serving sizes are fixed, so decode with cached per-shape grids and skip the raw head outputs nobody reads
+decode_cache = int(os.getenv("DECODE_CACHE", 16))  # shapes per head layer (shed sizes x TTA scales), 0 disables
+for m in model.model.modules():
+    if isinstance(m, Detect):
+        m.decode_cache, m.raw = decode_cache, False
+if compile_mode:
+    model.compile_shapes(compile_mode, [(1, 3, s, s) for s in SHED_SIZES])
+
+# ✅ Optional ensemble for quality="max" (ENSEMBLE_WEIGHTS=a.pt,b.pt or every apple_leaf_yolov5*.pt checkpoint)
+ensemble_weights = [str(model_path.parent / w) for w in os.getenv("ENSEMBLE_WEIGHTS", "").split(",") if w] or sorted(
+    str(p) for p in model_path.parent.glob("apple_leaf_yolov5*.pt")
+)
+ensemble = (
+    DetectMultiBackend(ensemble_weights, device=device, channels_last=channels_last, bf16=bf16)
+    if len(ensemble_weights) > 1
+    else None
+)
+if ensemble is not None:
+    for m in ensemble.model:
+        m.eval().tta_batch = tta_batch
+        m.model[-1].decode_cache, m.model[-1].raw = decode_cache, False
+
+# ✅ MEMORY=1 samples RSS/native heap per stage and request (MEMORY=trace adds tracemalloc), served at GET /memory
+if os.getenv("MEMORY", "").lower() in ("1", "true", "trace"):
+    MEMORY.start(trace=os.getenv("MEMORY").lower() == "trace")  # after loading, so requests are the steady state
+
+# ✅ Startup warmup on the serving threads (WARMUP_THREADS, default INFER_CONCURRENCY); WARMUP=0 skips it and
+# WARMUP=all also warms TTA ("accurate") and the ensemble ("max")
+warmup_mode = os.getenv("WARMUP", "1").lower()
+warmup_threads = int(os.getenv("WARMUP_THREADS", os.getenv("INFER_CONCURRENCY", 1)))
+WARMUP_SHAPES = [(1, 3, s, s) for s in SHED_SIZES] + [(8, 3, 640, 640)]  # single images, analyze_video() batches
+
+def warmup(barrier=None):
+    """Runs the models at every serving shape on the calling thread, so the first requests it serves don't pay
+    one-time costs (oneDNN primitives, allocator growth, the thread's OpenMP team). `barrier` holds concurrent calls
+    until all have started, so each one warms a different pool thread. Returns the thread, total seconds and the
+    first and last inference milliseconds per shape, which should be close once warm."""
+    if barrier is not None:
+        barrier.wait()
+    t = time.perf_counter()
+    runs = {"": model.warmup(shapes=WARMUP_SHAPES, n=2)}
+    if warmup_mode == "all":
+        single = WARMUP_SHAPES[: len(SHED_SIZES)]
+        runs[" tta"] = model.warmup(shapes=single, augment=True, n=2)
+        if ensemble is not None:
+            runs[" ensemble tta"] = ensemble.warmup(shapes=single, augment=True, n=2)
+    shapes = {
+        "x".join(map(str, shape)) + mode: [round(dt[0] * 1e3, 1), round(dt[-1] * 1e3, 1)]
+        for mode, times in runs.items()
+        for shape, dt in times.items()
+    }
+    thread = f"{threading.current_thread().name} {threading.get_native_id()}"
+    return {"thread": thread, "seconds": round(time.perf_counter() - t, 2), "shapes": shapes}
+
+def preprocess(original, imgsz=640):
+    """Converts a BGR image to the (1, 3, imgsz, imgsz) uint8 RGB batch the model runs on."""
+    img = cv2.cvtColor(original, cv2.COLOR_BGR2RGB)
+    img_resized = cv2.resize(img, (imgsz, imgsz))
+    return img_resized.transpose(2, 0, 1)[None]
+
+def forward(im, net, augment=False):
+    """Runs `net` on a preprocessed (n, 3, h, w) uint8 RGB batch and returns its raw predictions."""
+    img_tensor = torch.from_numpy(im).float().to(device) / 255.0
+    with torch.no_grad():
+        return net(img_tensor, augment=augment)
+
+def postprocess(pred, shape, shapes0, names=None):
+    """Runs NMS on raw predictions for (h, w) `shape` inputs; returns the top detection per image, scaled back to its
+    original (h, w) in `shapes0`."""
+    results = []
+    for det, shape0 in zip(batched_non_max_suppression(pred, conf_thres=0.25), shapes0):
+        detections = []
+        if det is not None and len(det):
+            det = det[torch.argmax(det[:, 4])]
+            det = det.unsqueeze(0)
+            det[:, :4] = scale_boxes(shape, det[:, :4], shape0).round()
+
+            for *xyxy, conf, cls in det:
+                detections.append((tuple(map(int, xyxy)), (names or model.names)[int(cls)], float(conf)))
+        results.append(detections)
+    return results
+
+def detect_batch(im, shapes0, quality="fast"):
+    """Runs the model on a preprocessed (n, 3, h, w) uint8 RGB batch; returns the top detection per image, scaled
+    back to its original (h, w) in `shapes0`.
+
+    `quality` is "fast" (single model), "accurate" (test-time augmentation) or "max" (ensemble with TTA).
+    """
+    net = ensemble if quality == "max" and ensemble is not None else model
+    with span("forward"):
+        pred = forward(im, net, augment=quality != "fast")
+    with span("nms"):
+        return postprocess(pred, im.shape[2:], shapes0)
+
+def detect(original, quality="fast", imgsz=640):
+    """Runs the model on a BGR image and returns the top detection as a list of (xyxy, label, confidence)."""
+    with span("preprocess"):
+        im = preprocess(original, imgsz)
+    return detect_batch(im, [original.shape[:2]], quality)[0]
+
+def to_confidence_list(detections):
+    """Formats detections as the API's [{"name", "confidence"}] list, reporting "healthy" when nothing was found."""
+    if not detections:
+        return [{"name": "healthy", "confidence": 1.0}]
+    return [{"name": label, "confidence": round(confidence, 2)} for _, label, confidence in detections]
+
+def draw(original, detections):
+    """Draws detection boxes and labels onto `original` in place."""
+    for (x1, y1, x2, y2), label, confidence in detections:
+        cv2.rectangle(original, (x1, y1), (x2, y2), (0, 255, 100), 3)
+        label_text = f"{label} {confidence:.2f}"
+        (tw, th), _ = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+        cv2.rectangle(original, (x1, y1 - th - 10), (x1 + tw + 6, y1), (0, 255, 100), -1)
+        cv2.putText(original, label_text, (x1 + 3, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+    return original
+
+def predict_and_annotate(image_path, quality="fast", imgsz=640, render=True):
     try:
-        original = cv2.imread(image_path)
-        img = cv2.cvtColor(original, cv2.COLOR_BGR2RGB)
-        img_resized = cv2.resize(img, (640, 640))
-        img_tensor = torch.from_numpy(img_resized).permute(2, 0, 1).float().unsqueeze(0) / 255.0
-        img_tensor = img_tensor.to(device)
-
-        with torch.no_grad():
-            pred = model(img_tensor)
-        pred = non_max_suppression(pred, conf_thres=0.25)[0]
-
-        disease_names = set()
-        disease_conf_list = []
-
-        if pred is not None and len(pred):
-            pred = pred[torch.argmax(pred[:, 4])]
-            pred = pred.unsqueeze(0)
-            pred[:, :4] = scale_boxes((640, 640), pred[:, :4], original.shape[:2]).round()
-
-            for *xyxy, conf, cls in pred:
-                label = model.names[int(cls)]
-                confidence = float(conf)
-                disease_names.add(label)
-                disease_conf_list.append({"name": label, "confidence": round(confidence, 2)})
-
-                x1, y1, x2, y2 = map(int, xyxy)
-                cv2.rectangle(original, (x1, y1), (x2, y2), (0, 255, 100), 3)
-                label_text = f"{label} {confidence:.2f}"
-                (tw, th), _ = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-                cv2.rectangle(original, (x1, y1 - th - 10), (x1 + tw + 6, y1), (0, 255, 100), -1)
-                cv2.putText(original, label_text, (x1 + 3, y1 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
-        else:
-            disease_names.add("healthy")
-            disease_conf_list.append({"name": "healthy", "confidence": 1.0})
+        with span("decode"):
+            original = cv2.imread(image_path)
+        detections = detect(original, quality, imgsz)
+        disease_conf_list = to_confidence_list(detections)
+        if not render:  # ✅ overloaded: skip drawing and encoding the annotated image
+            return None, disease_conf_list
+
+        with span("annotate"):
+            draw(original, detections)
 
         os.makedirs("downloads", exist_ok=True)
         filename = f"result_{uuid.uuid4().hex[:8]}.jpg"
         image_out_path = os.path.join("downloads", filename)
-        cv2.imwrite(image_out_path, original)
+        with span("encode"):
+            cv2.imwrite(image_out_path, original)
 
         return image_out_path, disease_conf_list
 
@@ -77,6 +191,78 @@ def predict_and_annotate(image_path):
         print(f"Error during prediction: {e}")
         raise
 
+def predict_frame(data, imgsz=640):
+    """Decodes an encoded (JPEG/PNG) frame and returns its confidence list, without rendering or saving."""
+    with span("decode"):
+        original = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if original is None:
+        raise ValueError("Could not decode frame")
+    return to_confidence_list(detect(original, imgsz=imgsz))
+
 class Predictor:
     def __init__(self):
-        self.annotate = predict_and_annotate
+        available = QUALITY_MODES if ensemble is not None else QUALITY_MODES[:2]
+        self.quality = QualityController(available=available)
+        self.shedder = LoadShedder()
+        self.inflight = {}  # (image sha256, quality) -> Future shared by identical concurrent requests
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0  # requests answered by another request's in-flight inference
+
+    def annotate(self, image_path, quality="fast"):
+        """Predicts and renders `image_path`; returns (image_out_path, disease_conf_list, info) where `info` reports
+        the quality mode and load-shedding mode (inference size, rendering) actually used. `image_out_path` is None
+        when rendering was shed.
+
+        Concurrent requests for the same image bytes and quality are coalesced: the first one runs the inference and
+        the others wait on its result, so N retried uploads cost one forward pass.
+        """
+        with open(image_path, "rb") as f:
+            key = (hashlib.sha256(f.read()).hexdigest(), quality)
+        with self.lock:
+            self.requests += 1
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._annotate(image_path, quality)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def _annotate(self, image_path, quality):
+        # ✅ The queue behind the shedder counts as load, so expensive modes degrade while requests wait for a slot
+        with self.shedder.slot() as mode, self.quality.run(quality, self.shedder.waiting) as used, span("infer"):
+            image_out_path, disease_conf_list = predict_and_annotate(image_path, used, mode["imgsz"], mode["render"])
+        MEMORY.sample(used)
+        return image_out_path, disease_conf_list, {"quality": {"requested": quality, "used": used}, "mode": mode}
+
+    def stats(self):
+        """Returns request/coalescing counters and the current load-shedding state."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "inflight": len(self.inflight),
+                "shed_level": self.shedder.level,
+                "queue_wait_ms": round(self.shedder.wait * 1e3, 1),
+                "latency_ms": {k: round(v * 1e3, 1) for k, v in self.quality.latency.items()},
+            }
+
+    def predict_frame(self, data):
+        """Predicts one encoded stream frame at the current load-shedding inference size."""
+        with self.shedder.slot() as mode, span("frame"):
+            result = predict_frame(data, mode["imgsz"])
+        MEMORY.sample("frame")
+        return result
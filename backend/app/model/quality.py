@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+QUALITY_MODES = ("fast", "accurate", "max")  # single model, TTA (flips/scales), checkpoint ensemble + TTA
+
+
+class QualityController:
+    """Chooses the quality mode a request actually runs at.
+
+    Each mode has a latency budget in seconds (`fast` has none). The controller keeps an exponentially weighted
+    moving average of observed latency per mode and, before each request, estimates its latency as that average times
+    the number of predictions already in flight or queued behind the load shedder plus one. A request is downgraded
+    (max -> accurate -> fast) until the estimate fits the budget, so expensive modes degrade gracefully under load and
+    come back as it drops.
+
+    A downgraded mode is never observed again, so its average would stay at whatever slow run pushed it over budget.
+    When nothing is in flight or queued and a mode's estimate is at least `probe_interval` seconds old, the request
+    runs at that mode as a probe, and its latency replaces the stale average.
+    """
+
+    def __init__(self, budgets=None, available=QUALITY_MODES, alpha=0.2, probe_interval=None, clock=time.monotonic):
+        self.budgets = budgets or {
+            "fast": None,
+            "accurate": float(os.getenv("ACCURATE_BUDGET", 2.0)),
+            "max": float(os.getenv("MAX_BUDGET", 5.0)),
+        }
+        self.available = available
+        self.alpha = alpha  # EWMA smoothing factor
+        self.latency = {}  # mode -> EWMA seconds
+        self.updated = {}  # mode -> clock() of its last observation
+        if probe_interval is None:
+            probe_interval = float(os.getenv("QUALITY_PROBE_INTERVAL", 1.0))
+        self.probe_interval = probe_interval  # seconds before an over-budget mode is re-measured while idle
+        self.clock = clock
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def _choose(self, requested, queued=0):
+        """Returns (mode, probe): the best available mode at or below `requested` whose estimated latency fits its
+        budget, counting `queued` requests waiting for an inference slot as load too, or a stale over-budget mode to
+        probe while idle."""
+        load = self.inflight + queued
+        for mode in QUALITY_MODES[QUALITY_MODES.index(requested) :: -1]:
+            if mode not in self.available:
+                continue
+            budget = self.budgets.get(mode)
+            if budget is None or self.latency.get(mode, 0.0) * (load + 1) <= budget:
+                return mode, False
+            if load == 0 and self.clock() - self.updated.get(mode, 0.0) >= self.probe_interval:
+                return mode, True
+        return "fast", False
+
+    @contextmanager
+    def run(self, requested, queued=0):
+        """Context manager yielding the mode to run at and recording its latency on exit. `queued` is the number of
+        requests waiting for an inference slot (LoadShedder.waiting), which `inflight` doesn't see when the mode is
+        chosen inside a slot."""
+        with self.lock:
+            mode, probe = self._choose(requested, queued)
+            self.inflight += 1
+        t = time.perf_counter()
+        try:
+            yield mode
+        finally:
+            dt = time.perf_counter() - t
+            with self.lock:
+                self.inflight -= 1
+                prev = self.latency.get(mode)
+                self.latency[mode] = dt if prev is None or probe else prev + self.alpha * (dt - prev)
+                self.updated[mode] = self.clock()
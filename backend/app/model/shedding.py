@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.general import check_img_size
+
+SHED_SIZES = (640, 512, 416)  # inference sizes from full quality to most degraded
+
+
+class LoadShedder:
+    """Bounds concurrent inferences and degrades work per request as the queue in front of them grows.
+
+    Requests wait for one of `concurrency` inference slots. An exponentially weighted moving average of that wait
+    drives a ladder of modes: full size, each smaller size in `sizes`, and finally the smallest size without
+    rendering. The ladder steps down when the average wait exceeds `high` seconds and back up when it falls below
+    `low`, at most once per `cooldown` seconds so it doesn't oscillate.
+    """
+
+    def __init__(self, sizes=SHED_SIZES, concurrency=None, high=None, low=None, cooldown=2.0, alpha=0.3):
+        sizes = [check_img_size(s) for s in sizes]  # stride-32 multiples
+        self.levels = [(s, True) for s in sizes] + [(sizes[-1], False)]  # (imgsz, render)
+        self.level = 0
+        self.high = float(os.getenv("SHED_HIGH_WAIT", 0.5)) if high is None else high
+        self.low = float(os.getenv("SHED_LOW_WAIT", 0.1)) if low is None else low
+        self.cooldown = cooldown
+        self.alpha = alpha  # EWMA smoothing factor
+        self.wait = 0.0  # EWMA queue wait (seconds)
+        self.changed = 0.0  # time of last level change
+        self.waiting = 0  # requests queued for a slot
+        self.slots = threading.BoundedSemaphore(concurrency or int(os.getenv("INFER_CONCURRENCY", 1)))
+        self.lock = threading.Lock()
+
+    def _update(self, wait):
+        """Folds one observed queue wait into the average and moves along the ladder if needed."""
+        self.wait += self.alpha * (wait - self.wait)
+        now = time.monotonic()
+        if now - self.changed < self.cooldown:
+            return
+        if self.wait > self.high and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.changed = now
+        elif self.wait < self.low and self.level > 0:
+            self.level -= 1
+            self.changed = now
+
+    @contextmanager
+    def slot(self):
+        """Waits for an inference slot and yields the mode to run at: {"imgsz", "render", "degraded", ...}."""
+        t = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        try:
+            self.slots.acquire()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        wait = time.perf_counter() - t
+        try:
+            with self.lock:
+                self._update(wait)
+                imgsz, render = self.levels[self.level]
+            yield {"imgsz": imgsz, "render": render, "degraded": self.level > 0, "queue_wait_ms": round(wait * 1e3, 1)}
+        finally:
+            self.slots.release()
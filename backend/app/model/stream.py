@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketDisconnect
+
+
+class FrameStream:
+    """Latest-frame-wins buffer for one scouting connection, like YOLOv5's `LoadStreams.update`.
+
+    The receiver overwrites the pending frame as new ones arrive, so when inference falls behind the stale frames are
+    dropped instead of queueing up; at most one frame is ever waiting per connection.
+    """
+
+    def __init__(self, max_fps=5.0):
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0  # seconds between inferences
+        self.frame = None  # pending (newest) frame as (sequence number, bytes)
+        self.closed = False
+        self.event = asyncio.Event()
+        self.received = 0  # frames received from the client
+        self.processed = 0  # frames run through the model
+        self.dropped = 0  # frames overwritten before they were processed
+        self.failed = 0  # frames that could not be decoded / predicted
+        self.started = time.monotonic()
+        self.infer_time = 0.0  # total seconds spent in inference
+
+    def push(self, data):
+        """Stores `data` as the pending frame, dropping the previous one if it was never picked up."""
+        self.received += 1
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = (self.received, data)
+        self.event.set()
+
+    def close(self):
+        """Marks the stream closed and wakes up the consumer."""
+        self.closed = True
+        self.event.set()
+
+    async def next(self):
+        """Waits for the newest pending (seq, bytes) frame; returns None once the stream is closed and drained."""
+        while self.frame is None:
+            if self.closed:
+                return None
+            self.event.clear()
+            await self.event.wait()
+        frame, self.frame = self.frame, None
+        return frame
+
+    def stats(self):
+        """Returns per-connection counters for the client."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "skip_ratio": round(self.dropped / self.received, 3) if self.received else 0.0,
+            "fps": round(self.processed / elapsed, 2),
+            "avg_inference_ms": round(1000 * self.infer_time / self.processed, 1) if self.processed else 0.0,
+        }
+
+
+async def _receive(websocket, stream):
+    """Reads binary frames from the client into `stream` until it disconnects."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                stream.push(message["bytes"])
+    finally:
+        stream.close()
+
+
+async def serve_stream(websocket, predict_frame, max_fps=5.0):
+    """
+    Runs a scouting session: receives JPEG frames, infers on the newest one at most `max_fps` times per second and
+    sends one JSON message per processed frame with its detections and the connection's frame-skip statistics.
+
+    Inference runs in the threadpool and only one frame per connection is in flight, so a slow model or a slow
+    client naturally applies backpressure: new frames just replace the pending one. Frames that can't be decoded
+    (ValueError) are reported and skipped; any other inference error is reported and closes the connection with code
+    1011 (internal error).
+    """
+    await websocket.accept()
+    stream = FrameStream(max_fps)
+    receiver = asyncio.create_task(_receive(websocket, stream))
+    last = 0.0
+    try:
+        while True:
+            wait = last + stream.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)  # bounded rate, frames keep arriving (and being replaced) meanwhile
+            item = await stream.next()
+            if item is None or stream.closed:  # the client left, nobody is waiting for the pending frame
+                break
+            seq, frame = item
+            last = time.monotonic()
+            try:
+                detections = await run_in_threadpool(predict_frame, frame)
+            except ValueError as e:
+                stream.failed += 1
+                if stream.closed:
+                    break
+                await websocket.send_json({"frame": seq, "error": str(e), "stats": stream.stats()})
+                continue
+            except Exception:
+                logging.exception("Scouting frame failed")
+                stream.failed += 1
+                if not stream.closed:
+                    await websocket.send_json({"frame": seq, "error": "Prediction failed", "stats": stream.stats()})
+                    await websocket.close(code=1011)
+                break
+            stream.infer_time += time.monotonic() - last
+            stream.processed += 1
+            if stream.closed:  # disconnected during inference
+                break
+            await websocket.send_json(
+                {"frame": seq, "detected_diseases": detections, "stats": stream.stats()}
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+    return stream.stats()
@@ -0,0 +1,146 @@
+import contextlib
+import math
+import queue
+import threading
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from app.model.detect import detect_batch, model
+from utils.dataloaders import VID_FORMATS, LoadImages
+
+
+class FrameSampler:
+    """Picks which decoded frames are worth running through the model.
+
+    `stride` mode keeps every frame the loader yields (the loader already skips `vid_stride` frames); `scene` mode
+    additionally drops frames whose downscaled grayscale thumbnail barely differs from the last kept frame, so a
+    scout standing still in front of one tree costs a handful of forward passes instead of hundreds. A frame is
+    always kept after `max_gap` consecutive skips so the timeline never has holes longer than that.
+    """
+
+    def __init__(self, mode="scene", threshold=12.0, max_gap=10):
+        assert mode in ("stride", "scene"), f"Invalid sampling mode {mode}, valid values are 'stride' and 'scene'"
+        self.mode = mode
+        self.threshold = threshold  # mean absolute thumbnail difference (0-255) that counts as a new scene
+        self.max_gap = max_gap
+        self.last = None
+        self.skipped = 0
+
+    def __call__(self, im0):
+        """Returns True if frame `im0` (BGR) should be analyzed."""
+        if self.mode == "stride":
+            return True
+        thumb = cv2.resize(cv2.cvtColor(im0, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+        thumb = thumb.astype(np.int16)
+        if self.last is None or self.skipped >= self.max_gap or np.abs(thumb - self.last).mean() > self.threshold:
+            self.last, self.skipped = thumb, 0
+            return True
+        self.skipped += 1
+        return False
+
+
+def _decode(loader, sampler, frames, stop):
+    """Background decode loop: reads sampled frames from `loader` into the `frames` queue, then a None sentinel."""
+    try:
+        for _, im, im0, _, _ in loader:
+            if stop.is_set():
+                break
+            if sampler(im0):
+                frames.put((loader.frame * loader.vid_stride - 1, im, im0.shape[:2]))  # source frame index
+    except Exception as e:
+        frames.put(e)
+    finally:
+        frames.put(None)
+
+
+def _timeline(results, fps):
+    """Collapses per-frame top detections into consecutive segments of the same label."""
+    segments = []
+    for frame, detections in results:
+        name = detections[0][1] if detections else "healthy"
+        conf = detections[0][2] if detections else 1.0
+        t = round(frame / fps, 2)
+        if segments and segments[-1]["name"] == name:
+            seg = segments[-1]
+            seg["end"], seg["end_frame"] = t, frame
+            seg["frames"] += 1
+            seg["confidence"] = round(max(seg["confidence"], conf), 2)
+        else:
+            segments.append(
+                {"name": name, "start": t, "end": t, "start_frame": frame, "end_frame": frame, "frames": 1,
+                 "confidence": round(conf, 2)}
+            )
+    return segments
+
+
+def analyze_video(path, sample_fps=2.0, mode="scene", batch_size=8, img_size=640, slot=contextlib.nullcontext):
+    """
+    Analyzes a walk-through video and returns a disease timeline plus aggregated counts.
+
+    Frames are decoded and letterboxed by `LoadImages` in a background thread with `vid_stride` chosen so roughly
+    `sample_fps` frames per second of video are considered; `FrameSampler` then filters them and the survivors are
+    run through the model `batch_size` at a time, each batch inside a `slot()` context (the API passes its
+    LoadShedder's, so videos share the inference slots with image requests). When the slot yields a mode with a
+    different `imgsz`, the batch is resized to it, like image requests are under load.
+    """
+    assert path.split(".")[-1].lower() in VID_FORMATS, f"Unsupported video format, valid formats are {VID_FORMATS}"
+    t0 = time.time()
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    fps = fps if math.isfinite(fps) and fps > 0 else 30  # 30 FPS fallback
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    vid_stride = max(1, round(fps / sample_fps)) if sample_fps > 0 else 1
+    stride = max(int(model.stride), 32)
+    loader = LoadImages(path, img_size=img_size, stride=stride, auto=False, vid_stride=vid_stride)
+    sampler = FrameSampler(mode)
+    frames, stop = queue.Queue(maxsize=2 * batch_size), threading.Event()
+    thread = threading.Thread(target=_decode, args=(loader, sampler, frames, stop), daemon=True)
+    thread.start()
+
+    results, batch, decoded_all = [], [], False
+    try:
+        while not decoded_all:
+            item = frames.get()
+            if isinstance(item, Exception):
+                raise item
+            if item is None:
+                decoded_all = True
+            else:
+                batch.append(item)
+            if batch and (len(batch) == batch_size or decoded_all):
+                idx, ims, shapes0 = zip(*batch)
+                with slot() as shed:
+                    ims = np.stack(ims)
+                    imgsz = shed["imgsz"] if shed else img_size
+                    if imgsz != img_size:  # square letterboxes, so resizing gives the letterbox at imgsz
+                        ims = np.stack([cv2.resize(im.transpose(1, 2, 0), (imgsz, imgsz), interpolation=cv2.INTER_AREA)
+                                        for im in ims]).transpose(0, 3, 1, 2)
+                    results.extend(zip(idx, detect_batch(np.ascontiguousarray(ims), shapes0)))
+                batch = []
+    finally:
+        stop.set()
+        while thread.is_alive():
+            with contextlib.suppress(queue.Empty):
+                frames.get_nowait()  # unblock a producer waiting on a full queue
+            thread.join(0.05)
+        if loader.cap:
+            loader.cap.release()
+
+    counts = Counter(d[0][1] if d else "healthy" for _, d in results)
+    return {
+        "duration": round(total / fps, 2),
+        "fps": round(fps, 2),
+        "frames_total": total,
+        "frames_considered": loader.frame,
+        "frames_analyzed": len(results),
+        "vid_stride": vid_stride,
+        "sampling": mode,
+        "timeline": _timeline(results, fps),
+        "counts": dict(counts),
+        "processing_time": round(time.time() - t0, 2),
+    }
@@ -1,12 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import os, shutil, uuid, logging
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import anyio, asyncio, os, shutil, threading, time, uuid, logging
 
-from app.model.detect import Predictor
+from app.model.detect import MEMORY, SPANS, Predictor, span, warmup, warmup_mode, warmup_threads
+from app.model.quality import QUALITY_MODES
+from app.model.stream import serve_stream
+from app.model.video import analyze_video
 
-app = FastAPI()
+WARMUP = []  # per-thread warmup report, served at GET /stats
+
+# ✅ Warm up the model on the threadpool threads that will serve predictions, before accepting requests
+@asynccontextmanager
+async def lifespan(app):
+    if warmup_mode not in ("0", "false"):
+        t = time.perf_counter()
+        n = min(warmup_threads, int(anyio.to_thread.current_default_thread_limiter().total_tokens))
+        barrier = threading.Barrier(n)  # every call waits for the others, so each one lands on its own thread
+        WARMUP.extend(await asyncio.gather(*(run_in_threadpool(warmup, barrier) for _ in range(n))))
+        logging.info(f"Warmup done on {n} threads in {time.perf_counter() - t:.1f}s: {WARMUP}")
+    yield
+
+app = FastAPI(lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 
 # ✅ Enable CORS (Allow all origins for development)
@@ -21,14 +39,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ✅ Optional: Limit upload file size to 5MB
+# ✅ Optional: Limit upload file size to 5MB (videos: VIDEO_MAX_MB, default 100MB)
+VIDEO_MAX_MB = int(os.getenv("VIDEO_MAX_MB", 100))
+
 @app.middleware("http")
 async def limit_upload_size(request: Request, call_next):
     if request.headers.get("content-length"):
         size = int(request.headers["content-length"])
-        if size > 5 * 1024 * 1024:  # 5MB
+        limit = VIDEO_MAX_MB if request.url.path == "/predict/video" else 5
+        if size > limit * 1024 * 1024:
             return JSONResponse(status_code=413, content={"detail": "File too large"})
-    return await call_next(request)
+    # ✅ Per-endpoint span ("POST predict.video"), parent of the prediction spans when SPANS=1
+    with span(f"{request.method} {request.url.path.strip('/').replace('/', '.')}"):
+        return await call_next(request)
 
 # ✅ Create downloads directory and mount as static
 DOWNLOADS_DIR = os.path.join(os.path.dirname(__file__), "downloads")
@@ -38,12 +61,41 @@ app.mount("/downloads", StaticFiles(directory=DOWNLOADS_DIR), name="downloads")
 # ✅ Predictor instance
 predictor = Predictor()
 
+# ✅ Max inferences per second for each live scouting connection
+SCOUT_MAX_FPS = float(os.getenv("SCOUT_MAX_FPS", 5))
+
 @app.get("/")
 def root():
     return {"message": "🍏 Apple Leaf Disease Detection API is running!"}
 
+@app.get("/stats")
+def stats():
+    return {**predictor.stats(), "warmup": WARMUP}
+
+# ✅ Span statistics recorded with SPANS=1 (count, total, percentiles per nested stage); reset=true starts over
+@app.get("/spans")
+def spans(reset: bool = False):
+    if not SPANS.enabled:
+        raise HTTPException(status_code=404, detail="Span recording is off, start the server with SPANS=1")
+    results = SPANS.results()
+    if reset:
+        SPANS.reset()
+    return {"spans": results}
+
+# ✅ Memory recorded with MEMORY=1|trace: peak RSS, steady-state growth / leak suspicion, per-stage RSS, samples
+@app.get("/memory")
+def memory(reset: bool = False):
+    if not MEMORY.enabled:
+        raise HTTPException(status_code=404, detail="Memory tracking is off, start the server with MEMORY=1")
+    results = MEMORY.results()
+    if reset:
+        trace = MEMORY.trace
+        MEMORY.stop()
+        MEMORY.start(trace=trace)
+    return results
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(file: UploadFile = File(...), quality: str = "fast"):
     # ✅ Validate file type
     if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
         raise HTTPException(status_code=400, detail="Only .jpg/.jpeg/.png files are allowed")
@@ -51,6 +103,9 @@ async def predict(file: UploadFile = File(...)):
     if file.content_type not in ["image/jpeg", "image/png"]:
         raise HTTPException(status_code=400, detail="Invalid image content-type")
 
+    if quality not in QUALITY_MODES:
+        raise HTTPException(status_code=400, detail=f"quality must be one of {', '.join(QUALITY_MODES)}")
+
     # ✅ Save uploaded image to temp directory
     temp_dir = os.path.join(os.path.dirname(__file__), "temp")
     os.makedirs(temp_dir, exist_ok=True)
@@ -60,13 +115,15 @@ async def predict(file: UploadFile = File(...)):
         with open(temp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        # ✅ Run prediction
-        image_path, disease_confidence_list = predictor.annotate(temp_path)
-        logging.info(f"Prediction done: {disease_confidence_list}")
+        # ✅ Run prediction (in the threadpool, so concurrent requests don't block the event loop)
+        image_path, disease_confidence_list, info = await run_in_threadpool(predictor.annotate, temp_path, quality)
+        logging.info(f"Prediction done ({info['quality']['used']}, {info['mode']}): {disease_confidence_list}")
 
+        # ✅ "mode" tells clients when the server degraded (smaller size / no image) so they can retry later
         return {
             "detected_diseases": disease_confidence_list,
-            "annotated_image": f"/downloads/{os.path.basename(image_path)}"
+            "annotated_image": f"/downloads/{os.path.basename(image_path)}" if image_path else None,
+            **info
         }
 
     except Exception as e:
@@ -76,3 +133,46 @@ async def predict(file: UploadFile = File(...)):
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
+
+
+# ✅ Walk-through video analysis: sampled frames -> disease timeline + counts
+@app.post("/predict/video")
+def predict_video(file: UploadFile = File(...), sample_fps: float = 2.0, sampling: str = "scene"):
+    # ✅ Validate file type
+    if not file.filename.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.m4v')):
+        raise HTTPException(status_code=400, detail="Only .mp4/.mov/.avi/.mkv/.m4v files are allowed")
+
+    if not (file.content_type or "").startswith("video/"):
+        raise HTTPException(status_code=400, detail="Invalid video content-type")
+
+    if sampling not in ("scene", "stride") or not 0 < sample_fps <= 30:
+        raise HTTPException(status_code=400, detail="sampling must be 'scene' or 'stride' and 0 < sample_fps <= 30")
+
+    # ✅ Save uploaded video to temp directory
+    temp_dir = os.path.join(os.path.dirname(__file__), "temp")
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}_{os.path.basename(file.filename)}")
+
+    try:
+        with open(temp_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        # ✅ Run analysis (sync endpoint, so it runs in the threadpool and doesn't block the event loop); every batch
+        # waits for an inference slot like image requests, so videos can't oversubscribe the CPU
+        report = analyze_video(temp_path, sample_fps=sample_fps, mode=sampling, slot=predictor.shedder.slot)
+        logging.info(f"Video analysis done: {report['counts']} in {report['processing_time']}s")
+        return report
+
+    except Exception:
+        logging.exception("Video analysis failed")
+        raise HTTPException(status_code=500, detail="Video analysis failed")
+
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# ✅ Live camera scouting: stream JPEG frames in, get detections back per processed frame
+@app.websocket("/ws/scout")
+async def scout(websocket: WebSocket):
+    stats = await serve_stream(websocket, predictor.predict_frame, max_fps=SCOUT_MAX_FPS)
+    logging.info(f"Scouting session closed: {stats}")
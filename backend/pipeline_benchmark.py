@@ -0,0 +1,144 @@
+"""
+Times each stage of the apple-leaf prediction hot path in app/model/detect.py separately:
+bytes -> decode -> resize -> forward -> NMS -> annotate -> encode.
+
+Images are deterministic synthetic leaf photos at phone camera resolutions unless --images points to real ones, and
+every (backend, inference size, image) combination reports per-stage p50/p90 milliseconds. --json appends one JSON
+line per run (commit, host, settings, results) so a file of runs can be plotted as a trend.
+
+Usage:
+    $ python pipeline_benchmark.py  # production model as configured by the env (COMPILE, BF16, ...), shed sizes
+    $ python pipeline_benchmark.py --sizes 640 416 --weights yolov5/best.onnx --json pipeline.jsonl
+    $ python pipeline_benchmark.py --images ~/leaves --n 50
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pandas as pd
+import torch
+
+from app.model.detect import device, draw, forward, model, postprocess, preprocess
+from app.model.shedding import SHED_SIZES
+from models.common import DetectMultiBackend
+
+PHONE_RESOLUTIONS = ((4032, 3024), (3024, 4032), (4000, 2250), (1920, 1080))  # (w, h) 12MP 4:3 both ways, 16:9, FHD
+STAGES = ("decode", "resize", "forward", "nms", "annotate", "encode")
+IMG_FORMATS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def leaf_fixture(w, h, seed=0):
+    """Returns JPEG bytes of a deterministic synthetic leaf photo: a veined green leaf with brown lesions on a
+    textured background, so JPEG decoding and encoding cost about what a real photo does."""
+    rng = np.random.default_rng(seed)
+    im = cv2.resize(rng.integers(50, 130, (h // 16, w // 16, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_CUBIC)
+    im = cv2.add(im, rng.integers(0, 25, (h, w, 3), dtype=np.uint8))  # sensor noise
+    s = min(w, h)
+    center, axes, angle = (w // 2, h // 2), (int(s * 0.45), int(s * 0.24)), int(rng.integers(0, 180))
+    cv2.ellipse(im, center, axes, angle, 0, 360, (40, 135, 55), -1)
+    a = np.deg2rad(angle)
+    tip = np.array([np.cos(a), np.sin(a)]) * axes[0]
+    cv2.line(im, tuple((center - tip).astype(int)), tuple((center + tip).astype(int)), (90, 190, 120), max(2, s // 300))
+    for _ in range(12):  # lesions
+        p = center + rng.uniform(-0.6, 0.6, 2) * tip + rng.uniform(-0.4, 0.4, 2) * axes[1]
+        r = int(s * rng.uniform(0.01, 0.04))
+        cv2.circle(im, tuple(p.astype(int)), r, (30, 60, 110), -1)
+        cv2.circle(im, tuple(p.astype(int)), r, (20, 160, 200), max(1, r // 5))  # yellow halo
+    return cv2.imencode(".jpg", im, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def load_images(images=None):
+    """Returns {name: encoded bytes} of the images in directory `images`, or synthetic phone-resolution fixtures."""
+    if images:
+        files = sorted(f for f in Path(images).iterdir() if f.suffix.lower() in IMG_FORMATS)
+        assert files, f"No images found in {images}"
+        return {f.name: f.read_bytes() for f in files}
+    return {f"leaf_{w}x{h}.jpg": leaf_fixture(w, h, seed=i) for i, (w, h) in enumerate(PHONE_RESOLUTIONS)}
+
+
+def time_pipeline(data, net, imgsz, n=20, warmup=3):
+    """Runs encoded image `data` through the prediction hot path `warmup + n` times; returns the timed milliseconds
+    per stage as {stage: np.ndarray}."""
+    dt = {k: [] for k in STAGES}
+    for i in range(warmup + n):
+        t = [time.perf_counter_ns()]
+        original = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        t.append(time.perf_counter_ns())
+        im = preprocess(original, imgsz)
+        t.append(time.perf_counter_ns())
+        pred = forward(im, net)
+        t.append(time.perf_counter_ns())
+        detections = postprocess(pred, im.shape[2:], [original.shape[:2]], net.names)[0]
+        t.append(time.perf_counter_ns())
+        draw(original, detections)
+        t.append(time.perf_counter_ns())
+        cv2.imencode(".jpg", original)
+        t.append(time.perf_counter_ns())
+        if i >= warmup:
+            for k, t0, t1 in zip(STAGES, t, t[1:]):
+                dt[k].append((t1 - t0) / 1e6)
+    return {k: np.array(v) for k, v in dt.items()}
+
+
+def run(weights=(), sizes=SHED_SIZES, images=None, n=20, warmup=3, json_file=""):
+    """
+    Benchmarks the production model and any extra `weights` (any DetectMultiBackend format) at each inference size in
+    `sizes` on every image; returns a DataFrame with per-stage and total p50 milliseconds plus total p90.
+    """
+    fixtures = load_images(images)
+    backends = {"app": model}  # ✅ exactly what the API serves
+    for w in weights:
+        backends[Path(w).name] = DetectMultiBackend(w, device=device)
+
+    rows = []
+    for backend, net in backends.items():
+        for imgsz in sizes:
+            for name, data in fixtures.items():
+                dt = time_pipeline(data, net, imgsz, n, warmup)
+                total = sum(dt.values())
+                h, w = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape[:2]
+                row = {"backend": backend, "imgsz": imgsz, "image": name, "resolution": f"{w}x{h}"}
+                row.update({f"{k}_ms": round(float(np.median(v)), 2) for k, v in dt.items()})
+                row["total_ms"] = round(float(np.median(total)), 2)
+                row["total_p90_ms"] = round(float(np.percentile(total, 90)), 2)
+                rows.append(row)
+    df = pd.DataFrame(rows)
+    print(f"\nPipeline benchmark (p50 ms, {n} runs after {warmup} warmup, {torch.get_num_threads()} threads)")
+    print(df.to_string(index=False))
+
+    if json_file:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+        meta = {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": commit,
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "threads": torch.get_num_threads(),
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "env": {k: os.environ[k] for k in ("COMPILE", "CHANNELS_LAST", "BF16", "DECODE_CACHE") if k in os.environ},
+            "n": n,
+            "warmup": warmup,
+        }
+        with open(json_file, "a") as f:  # ✅ one line per run, append-only for trends
+            f.write(json.dumps({"meta": meta, "results": rows}) + "\n")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--weights", nargs="*", default=[], help="extra backends to compare, i.e. model.onnx")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SHED_SIZES), help="inference sizes")
+    parser.add_argument("--images", type=str, default=None, help="directory of real leaf photos instead of fixtures")
+    parser.add_argument("--n", type=int, default=20, help="timed runs per image")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed runs per image")
+    parser.add_argument("--json", type=str, default="", help="append results to this JSON lines file")
+    opt = parser.parse_args()
+    run(opt.weights, opt.sizes, opt.images, opt.n, opt.warmup, opt.json)
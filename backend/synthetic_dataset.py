@@ -0,0 +1,147 @@
+"""
+Generates a deterministic synthetic apple-leaf dataset in YOLO format, so data loading, training steps and validation
+can be benchmarked at any scale on hosts without network access (every yolov5 default points at coco128, which
+downloads).
+
+Each image is a textured background with one or more veined leaves carrying lesions. Classes follow the apple-leaf
+model (scab, rust, rot, healthy): every lesion is a labeled box, each disease has its own color and shape, and a leaf
+without lesions is labeled healthy as a whole, so a model can actually learn the dataset and training curves look
+plausible. The number of lesions per image is Poisson distributed around --labels, and some images are empty
+backgrounds, as in the real data. Image i only depends on (--seed, i), so the same settings give the same files on any
+host and with any number of --workers. Re-running with the same settings reuses an existing dataset.
+
+Usage:
+    $ python synthetic_dataset.py --n 1000  # ../datasets/leaf-synth-1000/data.yaml, 640x640, 90/10 train/val
+    $ python synthetic_dataset.py --n 100000 --imgsz 1280 960 --labels 8 --workers 8 --root /data/synth
+    $ cd yolov5 && python val.py --data ../../datasets/leaf-synth-1000/data.yaml --weights best.pt
+"""
+
+import argparse
+import os
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+NAMES = ("scab", "rust", "rot", "healthy")  # class order of app/model/apple_leaf_yolov5.pt
+HEALTHY = NAMES.index("healthy")  # labels a whole lesion-free leaf, every other class is a disease
+STYLES = (  # per disease BGR lesion fill, rim and shape ("blot", "spot" with halo, "ring" or "patch" for extra --nc)
+    ((40, 60, 70), (30, 45, 50), "blot"),
+    ((20, 110, 210), (20, 200, 240), "spot"),
+    ((25, 35, 90), (40, 60, 140), "ring"),
+    ((215, 225, 220), (180, 195, 190), "patch"),
+)
+
+
+def render(i, imgsz=(640, 640), labels=4.0, seed=0, nc=len(NAMES)):
+    """Returns the BGR image and (n, 5) class, normalized xywh labels of synthetic dataset image `i`."""
+    w, h = imgsz
+    rng = np.random.default_rng((seed, i))
+    im = cv2.resize(rng.integers(40, 140, (h // 16, w // 16, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_CUBIC)
+    im = cv2.add(im, rng.integers(0, 25, (h, w, 3), dtype=np.uint8))  # sensor noise
+    n = rng.poisson(labels) if rng.random() > 0.05 else 0  # ~5% empty backgrounds
+    s = min(w, h)
+    leaves = []
+    for _ in range(int(rng.integers(1, 4)) if n else int(rng.integers(0, 3))):  # lesions need a leaf
+        center = rng.uniform(0.25, 0.75, 2) * (w, h)
+        axes = s * rng.uniform(0.2, 0.4), s * rng.uniform(0.1, 0.2)
+        angle = rng.uniform(0, 180)
+        green = tuple(int(c) for c in rng.integers((20, 100, 30), (70, 170, 80)))
+        cv2.ellipse(im, center.astype(int), np.array(axes).astype(int), angle, 0, 360, green, -1)
+        a = np.deg2rad(angle)
+        tip = np.array([np.cos(a), np.sin(a)]) * axes[0]
+        cv2.line(im, (center - tip).astype(int), (center + tip).astype(int), (90, 190, 120), max(2, s // 300))
+        leaves.append((center, tip, np.array([-np.sin(a), np.cos(a)]) * axes[1]))
+
+    diseases = [c for c in range(nc) if c != HEALTHY] or [0]
+    boxes, sick = [], set()
+    for _ in range(n):
+        k = int(rng.integers(len(leaves)))
+        sick.add(k)
+        center, tip, side = leaves[k]
+        p = center + rng.uniform(-0.7, 0.7) * tip + rng.uniform(-0.6, 0.6) * side
+        r = s * rng.uniform(0.015, 0.06)
+        j = int(rng.integers(len(diseases)))
+        c = diseases[j]
+        fill, rim, shape = STYLES[j % len(STYLES)]
+        x, y, ri = int(p[0]), int(p[1]), max(2, int(r))
+        if shape == "patch":  # irregular powdery blotch
+            t = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+            pts = p + rng.uniform(0.5, 1.0, (8, 1)) * r * np.stack((np.cos(t), np.sin(t)), 1)
+            cv2.fillPoly(im, [pts.astype(np.int32)], fill)
+        else:
+            cv2.circle(im, (x, y), ri, fill, -1)
+            if shape == "spot":
+                cv2.circle(im, (x, y), ri, rim, max(1, ri // 4))  # yellow halo
+            elif shape == "ring":
+                cv2.circle(im, (x, y), ri // 2, rim, max(1, ri // 6))  # concentric frog-eye ring
+        x1, y1, x2, y2 = np.clip((p[0] - r, p[1] - r, p[0] + r, p[1] + r), 0, (w, h, w, h))
+        if x2 - x1 > 2 and y2 - y1 > 2:  # skip lesions clipped away at the border
+            boxes.append((c, (x1 + x2) / 2 / w, (y1 + y2) / 2 / h, (x2 - x1) / w, (y2 - y1) / h))
+    if HEALTHY < nc:
+        for k, (center, tip, side) in enumerate(leaves):
+            if k not in sick:  # bounding box of the rotated leaf ellipse
+                half = np.hypot(tip, side)
+                x1, y1, x2, y2 = np.clip((*(center - half), *(center + half)), 0, (w, h, w, h))
+                boxes.append((HEALTHY, (x1 + x2) / 2 / w, (y1 + y2) / 2 / h, (x2 - x1) / w, (y2 - y1) / h))
+    return im, np.array(boxes, dtype=np.float32).reshape(-1, 5)
+
+
+def _write(args):
+    """Renders image `i` and writes its JPEG and label file (multiprocessing worker)."""
+    i, im_file, label_file, imgsz, labels, seed, nc = args
+    im, lb = render(i, imgsz, labels, seed, nc)
+    cv2.imwrite(str(im_file), im, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    label_file.write_text("".join(f"{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, x, y, w, h in lb))
+    return len(lb)
+
+
+def generate(n=1000, root="", imgsz=(640, 640), labels=4.0, nc=len(NAMES), val=0.1, seed=0, workers=None):
+    """
+    Writes `n` synthetic images with labels under `root` (images/{train,val}, labels/{train,val}) and returns the path
+    of its data.yaml. The last `val` fraction of images is the validation split. An existing dataset generated with the
+    same settings is reused as is.
+    """
+    imgsz = tuple(imgsz) * (2 // len(imgsz))  # (w, h)
+    root = Path(root or Path(__file__).resolve().parents[1] / "datasets" / f"leaf-synth-{n}").resolve()
+    names = {i: NAMES[i] if i < len(NAMES) else f"class{i}" for i in range(nc)}
+    settings = {"n": n, "imgsz": list(imgsz), "labels": labels, "nc": nc, "val": val, "seed": seed, "names": dict(names)}
+    data = root / "data.yaml"
+    if data.exists() and yaml.safe_load(data.read_text()).get("synthetic") == settings:
+        print(f"Reusing {data}")
+        return data
+
+    n_val = max(1, round(n * val)) if val and n > 1 else 0
+    jobs = []
+    for split, ids in ("train", range(n - n_val)), ("val", range(n - n_val, n)):
+        (root / "images" / split).mkdir(parents=True, exist_ok=True)
+        (root / "labels" / split).mkdir(parents=True, exist_ok=True)
+        for i in ids:
+            name = f"{i:06d}"
+            jobs.append((i, root / "images" / split / f"{name}.jpg", root / "labels" / split / f"{name}.txt"))
+    for split in "train", "val":  # stale *.cache from a dataset with other settings would skip relabeling
+        (root / "labels" / f"{split}.cache").unlink(missing_ok=True)
+
+    with Pool(workers or os.cpu_count()) as pool:
+        jobs = [(*j, imgsz, labels, seed, nc) for j in jobs]
+        counts = pool.map(_write, jobs, chunksize=max(1, min(256, n // (8 * (workers or os.cpu_count())))))
+    config = {"path": str(root), "train": "images/train", "val": "images/val", "names": names, "synthetic": settings}
+    data.write_text(yaml.safe_dump(config, sort_keys=False))  # written last, so an interrupted run is regenerated
+    print(f"{n} images ({n - n_val} train, {n_val} val), {sum(counts)} labels written to {root}")
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n", type=int, default=1000, help="number of images, i.e. 1000, 10000, 100000")
+    parser.add_argument("--root", type=str, default="", help="output directory, default ../datasets/leaf-synth-<n>")
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640], help="image size, or width height")
+    parser.add_argument("--labels", type=float, default=4.0, help="mean labeled lesions per image")
+    parser.add_argument("--nc", type=int, default=len(NAMES), help="number of classes")
+    parser.add_argument("--val", type=float, default=0.1, help="validation fraction")
+    parser.add_argument("--seed", type=int, default=0, help="dataset seed")
+    parser.add_argument("--workers", type=int, default=None, help="processes, default one per CPU")
+    opt = parser.parse_args()
+    generate(opt.n, opt.root, opt.imgsz, opt.labels, opt.nc, opt.val, opt.seed, opt.workers)
@@ -23,15 +23,32 @@ Requirements:
 
 Usage:
     $ python benchmarks.py --weights yolov5s.pt --img 640
+    $ python benchmarks.py --weights yolov5s.pt --export-cache --workers 4  # parallel exports, reused by later runs
+    $ python benchmarks.py --weights best.pt --data ../../datasets/leaf-synth-1000/data.yaml  # offline, see
+        ../synthetic_dataset.py
+    $ python benchmarks.py --nms  # non_max_suppression() vs batched_non_max_suppression() on synthetic predictions
+    $ python benchmarks.py --nms 0.001 --max-nms 3000  # same at the val.py confidence threshold with a candidate cap
+    $ python benchmarks.py --compile yolov5n.pt yolov5s.pt  # eager vs traced vs torch.compile PyTorch on CPU
+    $ python benchmarks.py --channels-last yolov5n.pt yolov5s.pt  # NCHW vs channels_last vs channels_last + bf16
+    $ python benchmarks.py --openvino yolov5s_openvino_model  # synchronous vs AsyncInferQueue OpenVINO inference
+    $ python benchmarks.py --latency yolov5s.pt --batch-size 8 --json latency.json  # p50/p90/p99, img/s, RSS, load
+    $ python benchmarks.py --latency yolov5s.pt --baseline latency.json  # compare p50 against an earlier run
+    $ python benchmarks.py --hot-paths --json hot_paths.json  # NMS, box_iou, letterbox, val metrics, ... on 1 thread
+    $ python benchmarks.py --hot-paths --baseline hot_paths.json  # the first run saves it, later ones exit 1 if any
+        median is >10% slower, at the thread count recorded in the baseline unless --threads is given
+    $ python benchmarks.py --compare hot_paths.json new.json --tolerance 0.05  # compare two saved runs
 """
 
 import argparse
+import os
 import platform
 import sys
 import time
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import torch
 
 FILE = Path(__file__).resolve()
 ROOT = FILE.parents[0]  # YOLOv5 root directory
@@ -40,12 +57,26 @@ if str(ROOT) not in sys.path:
 # ROOT = ROOT.relative_to(Path.cwd())  # relative
 
 import export
+from models.common import DetectMultiBackend
 from models.experimental import attempt_load
 from models.yolo import SegmentationModel
 from segment.val import run as val_seg
 from utils import notebook_init
-from utils.general import LOGGER, check_yaml, file_size, print_args
-from utils.torch_utils import select_device
+from utils.augmentations import letterbox
+from utils.general import (
+    LOGGER,
+    batched_non_max_suppression,
+    check_yaml,
+    file_size,
+    non_max_suppression,
+    peak_rss_mb,
+    print_args,
+    scale_boxes,
+    xywh2xyxy,
+)
+from utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from utils.torch_utils import cpu_bf16_supported, select_device
+from val import process_batch
 from val import run as val_det
 
 
@@ -59,6 +90,8 @@ def run(
     test=False,  # test exports only
     pt_only=False,  # test PyTorch only
     hard_fail=False,  # throw error on benchmark failure
+    export_cache=False,  # reuse exports cached by weights hash, format and options (True or cache dir)
+    workers=1,  # export formats in parallel processes before benchmarking
 ):
     """
     Run YOLOv5 benchmarks on multiple export formats and log results for model performance evaluation.
@@ -73,6 +106,9 @@ def run(
         test (bool): Test export formats only (default: False).
         pt_only (bool): Test PyTorch format only (default: False).
         hard_fail (bool): Throw an error on benchmark failure if True (default: False).
+        export_cache (bool | str): Export into the export.py artifact cache and reuse unchanged exports, True for the
+            user config dir or a directory (default: False).
+        workers (int): Export all formats up front in this many parallel processes, implies the cache (default: 1).
 
     Returns:
         None. Logs information about the benchmark results, including the format, size, mAP50-95, and inference time.
@@ -99,7 +135,23 @@ def run(
     y, t = [], time.time()
     device = select_device(device)
     model_type = type(attempt_load(weights, fuse=False))  # DetectionModel, SegmentationModel, etc.
-    for i, (name, f, suffix, cpu, gpu) in export.export_formats().iterrows():  # index, (name, file, suffix, CPU, GPU)
+    formats = export.export_formats()
+    export_cache = export_cache or workers > 1
+    if workers > 1 and not pt_only:  # export everything runnable here in parallel, the loop below hits the cache
+        runnable = formats.CPU if device.type == "cpu" else formats.GPU
+        skip = ["-", "edgetpu", "tfjs"] + ([] if platform.system() == "Darwin" else ["coreml"])
+        include = [f for f in formats.Argument[runnable] if f not in skip]
+        export.run(
+            weights=weights,
+            imgsz=[imgsz],
+            include=include,
+            batch_size=batch_size,
+            device=device,
+            half=half,
+            export_cache=export_cache,
+            workers=workers,
+        )
+    for i, (name, f, suffix, cpu, gpu) in formats.iterrows():  # index, (name, file, suffix, CPU, GPU)
         try:
             assert i not in (9, 10), "inference not supported"  # Edge TPU and TF.js are unsupported
             assert i != 5 or platform.system() == "Darwin", "inference only supported on macOS>=10.13"  # CoreML
@@ -113,7 +165,13 @@ def run(
                 w = weights  # PyTorch format
             else:
                 w = export.run(
-                    weights=weights, imgsz=[imgsz], include=[f], batch_size=batch_size, device=device, half=half
+                    weights=weights,
+                    imgsz=[imgsz],
+                    include=[f],
+                    batch_size=batch_size,
+                    device=device,
+                    half=half,
+                    export_cache=export_cache,
                 )[-1]  # all others
             assert suffix in str(w), "export failed"
 
@@ -159,6 +217,8 @@ def test(
     test=False,  # test exports only
     pt_only=False,  # test PyTorch only
     hard_fail=False,  # throw error on benchmark failure
+    export_cache=False,  # reuse exports cached by weights hash, format and options (True or cache dir)
+    workers=1,  # export formats in parallel processes before testing
 ):
     """
     Run YOLOv5 export tests for all supported formats and log the results, including export statuses.
@@ -173,6 +233,8 @@ def test(
         test (bool): Test export formats only without running inference. Default is False.
         pt_only (bool): Test only the PyTorch model if True. Default is False.
         hard_fail (bool): Raise error on export or test failure if True. Default is False.
+        export_cache (bool | str): Export into the export.py artifact cache, reusing unchanged exports. Default is False.
+        workers (int): Export all formats up front in this many parallel processes, implies the cache. Default is 1.
 
     Returns:
         pd.DataFrame: DataFrame containing the results of the export tests, including format names and export statuses.
@@ -196,12 +258,26 @@ def test(
     """
     y, t = [], time.time()
     device = select_device(device)
+    export_cache = export_cache or workers > 1
+    if workers > 1:  # the loop below hits the cache
+        include = list(export.export_formats().Argument[1:])
+        export.run(
+            weights=weights,
+            imgsz=[imgsz],
+            include=include,
+            device=device,
+            half=half,
+            export_cache=export_cache,
+            workers=workers,
+        )
     for i, (name, f, suffix, gpu) in export.export_formats().iterrows():  # index, (name, file, suffix, gpu-capable)
         try:
             w = (
                 weights
                 if f == "-"
-                else export.run(weights=weights, imgsz=[imgsz], include=[f], device=device, half=half)[-1]
+                else export.run(
+                    weights=weights, imgsz=[imgsz], include=[f], device=device, half=half, export_cache=export_cache
+                )[-1]
             )  # weights
             assert suffix in str(w), "export failed"
             y.append([name, True])
@@ -218,6 +294,490 @@ def test(
     return py
 
 
+def synthetic_predictions(batch_size=1, imgsz=640, nc=80, seed=0):
+    """
+    Generates deterministic raw YOLOv5 Detect() outputs of shape (batch_size, anchors, 5 + nc) for NMS benchmarks.
+
+    Boxes are spread over the image with realistic sizes; objectness is skewed towards 0 so that, like a trained model,
+    only ~1% of the anchors pass a 0.25 confidence threshold.
+    """
+    g = torch.Generator().manual_seed(seed)
+    n = 3 * sum((imgsz // s) ** 2 for s in (8, 16, 32))  # anchors, 25200 at 640
+    p = torch.rand(batch_size, n, 5 + nc, generator=g)
+    p[..., :2] *= imgsz  # xy
+    p[..., 2:4] = p[..., 2:4] * imgsz / 4 + 4  # wh
+    p[..., 4] **= 100  # objectness, ~1.4% of anchors above 0.25
+    return p
+
+
+def _same_detections(a, b):
+    """Checks two NMS outputs contain the same detections, ignoring the order of equal-confidence boxes."""
+
+    def _sorted(x):
+        for c in reversed(range(x.shape[1])):  # lexicographic row sort
+            x = x[x[:, c].argsort(stable=True)]
+        return x
+
+    return len(a) == len(b) and all(x.shape == y.shape and torch.equal(_sorted(x), _sorted(y)) for x, y in zip(a, b))
+
+
+def nms(batch_sizes=(1, 2, 4, 8, 16, 32, 64), imgsz=640, nc=80, conf_thres=0.25, iou_thres=0.45, max_nms=30000, n=10):
+    """
+    Benchmarks the per-image non_max_suppression() against batched_non_max_suppression() on synthetic predictions.
+
+    batched_non_max_suppression() is timed with its default NMS dispatch (one offset call on CUDA, one call per image
+    slice on CPU) and, in the "Single-call NMS" column, with one offset call for the whole batch on any device.
+
+    Args:
+        batch_sizes (tuple[int]): Batch sizes to benchmark.
+        imgsz (int): Inference size in pixels, sets the number of anchors per image.
+        nc (int): Number of classes.
+        conf_thres (float): Confidence threshold, i.e. 0.001 to profile the val.py setting.
+        iou_thres (float): NMS IoU threshold.
+        max_nms (int): Per-image candidate cap for batched_non_max_suppression(); outputs only match the reference
+            when it is at least the number of candidates per image.
+        n (int): Timed iterations per batch size (after one warmup).
+
+    Returns:
+        pd.DataFrame: Mean milliseconds per call for each implementation, the speedup of the default batched NMS and
+            whether all outputs match.
+    """
+    y = []
+    for bs in batch_sizes:
+        p = synthetic_predictions(bs, imgsz, nc)
+        t, out = [], []
+        for f in (
+            lambda: non_max_suppression(p, conf_thres, iou_thres),
+            lambda: batched_non_max_suppression(p, conf_thres, iou_thres, max_nms=max_nms),
+            lambda: batched_non_max_suppression(p, conf_thres, iou_thres, max_nms=max_nms, per_image=False),
+        ):
+            out.append(f())  # warmup
+            t0 = time.perf_counter()
+            for _ in range(n):
+                f()
+            t.append((time.perf_counter() - t0) * 1000 / n)
+        same = _same_detections(*out[:2]) and _same_detections(*out[1:])
+        y.append([bs, *(round(x, 2) for x in t), round(t[0] / t[1], 2), same])
+    columns = ["Batch size", "Loop NMS (ms)", "Batched NMS (ms)", "Single-call NMS (ms)", "Speedup", "Same output"]
+    py = pd.DataFrame(y, columns=columns)
+    LOGGER.info(f"\nNMS benchmark ({imgsz}px, {nc} classes, conf {conf_thres}, max_nms {max_nms})\n{py.to_string()}")
+    return py
+
+
+def compiled(weights=("yolov5n.pt", "yolov5s.pt"), imgsz=640, batch_sizes=(1, 8), modes=("trace", "inductor"), n=10):
+    """
+    Benchmarks eager against compiled PyTorch inference with DetectMultiBackend(compile_mode=...) on CPU.
+
+    Args:
+        weights (tuple[str]): PyTorch weights to benchmark, i.e. yolov5n.pt and yolov5s.pt.
+        imgsz (int): Inference size in pixels.
+        batch_sizes (tuple[int]): Batch sizes to compile and time.
+        modes (tuple[str]): Compile modes to compare against eager, 'trace' and/or 'inductor'.
+        n (int): Timed iterations per shape (after one warmup).
+
+    Returns:
+        pd.DataFrame: Load time (including compilation, or the cached trace on a second run), mean milliseconds per
+            batch for each shape and whether outputs match eager.
+    """
+    device = torch.device("cpu")
+    shapes = [(bs, 3, imgsz, imgsz) for bs in batch_sizes]
+    y = []
+    for w in weights:
+        ref = {}
+        for mode in ("eager", *modes):
+            t = time.perf_counter()
+            model = DetectMultiBackend(w, device=device, compile_mode=mode != "eager" and mode, shapes=shapes)
+            load = time.perf_counter() - t
+            for shape in shapes:
+                im = torch.rand(shape, generator=torch.Generator().manual_seed(0))
+                with torch.no_grad():
+                    p = model(im)  # warmup
+                    p = p[0] if isinstance(p, list) else p  # eager also returns the raw head outputs
+                    t = time.perf_counter()
+                    for _ in range(n):
+                        model(im)
+                dt = (time.perf_counter() - t) * 1000 / n
+                ref.setdefault(shape, p)
+                same = torch.allclose(ref[shape], p, atol=1e-3)
+                used = mode if (shape, im.dtype) in getattr(model, "compiled", {}) else "eager"
+                y.append([Path(w).name, mode, used, shape[0], round(load, 2), round(dt, 2), same])
+    columns = ["Weights", "Compile", "Used", "Batch size", "Load (s)", "Inference (ms)", "Same output"]
+    py = pd.DataFrame(y, columns=columns)
+    LOGGER.info(f"\nCompile benchmark ({imgsz}px, {torch.get_num_threads()} CPU threads)\n{py}")
+    return py
+
+
+def memory_formats(weights=("yolov5n.pt", "yolov5s.pt"), imgsz=640, batch_sizes=(1, 8), n=10):
+    """
+    Benchmarks NCHW FP32 against channels_last FP32 and channels_last + bf16 autocast CPU inference.
+
+    Args:
+        weights (tuple[str]): PyTorch weights to benchmark, i.e. yolov5n.pt and yolov5s.pt.
+        imgsz (int): Inference size in pixels.
+        batch_sizes (tuple[int]): Batch sizes to time.
+        n (int): Timed iterations per batch size (after one warmup).
+
+    Returns:
+        pd.DataFrame: Mean milliseconds per batch, speedup over NCHW FP32, the largest absolute difference of boxes
+            (pixels) and confidences against NCHW FP32, and whether post-NMS detections keep the same classes.
+    """
+    device = torch.device("cpu")
+    modes = {"NCHW FP32": {}, "channels_last FP32": {"channels_last": True}}
+    if cpu_bf16_supported():
+        modes["channels_last bf16"] = {"channels_last": True, "bf16": True}
+    y = []
+    for w in weights:
+        ref = {}
+        for name, kwargs in modes.items():
+            model = DetectMultiBackend(w, device=device, **kwargs)
+            for bs in batch_sizes:
+                im = torch.rand(bs, 3, imgsz, imgsz, generator=torch.Generator().manual_seed(0))
+                with torch.no_grad():
+                    p = model(im)  # warmup
+                    t = time.perf_counter()
+                    for _ in range(n):
+                        model(im)
+                dt = (time.perf_counter() - t) * 1000 / n
+                p = (p[0] if isinstance(p, list) else p).float()
+                p0, t0 = ref.setdefault(bs, (p, dt))
+                d = non_max_suppression(p.clone()), non_max_suppression(p0.clone())
+                same = all(len(a) == len(b) and torch.equal(a[:, 5], b[:, 5]) for a, b in zip(*d))
+                box, conf = (p[..., :4] - p0[..., :4]).abs().max(), (p[..., 4:] - p0[..., 4:]).abs().max()
+                y.append([Path(w).name, name, bs, round(dt, 2), round(t0 / dt, 2), f"{box:.3g}", f"{conf:.3g}", same])
+    columns = [
+        "Weights",
+        "Mode",
+        "Batch size",
+        "Inference (ms)",
+        "Speedup",
+        "Max box diff",
+        "Max conf diff",
+        "Same classes",
+    ]
+    py = pd.DataFrame(y, columns=columns)
+    LOGGER.info(f"\nMemory format benchmark ({imgsz}px, {torch.get_num_threads()} CPU threads)\n{py}")
+    return py
+
+
+def openvino_async(weights="yolov5s_openvino_model", imgsz=640, frames=32, hints=(None, "LATENCY", "THROUGHPUT")):
+    """
+    Benchmarks synchronous OpenVINO inference against DetectMultiBackend.submit() on the AsyncInferQueue pool.
+
+    Args:
+        weights (str): OpenVINO model directory or *.xml file.
+        imgsz (int): Inference size in pixels.
+        frames (int): Number of single-image frames per run, all submitted at once in the asynchronous run.
+        hints (tuple[str | None]): OpenVINO performance hints to compile with, None for the device default.
+
+    Returns:
+        pd.DataFrame: Infer requests in the pool and milliseconds per frame of each path for every hint.
+    """
+    ims = [torch.rand(1, 3, imgsz, imgsz) for _ in range(frames)]
+    y = []
+    for hint in hints:
+        model = DetectMultiBackend(weights, device=torch.device("cpu"), ov_hint=hint)
+        model.submit(ims[0]).result()  # warmup
+        t = time.perf_counter()
+        for im in ims:
+            model(im)
+        sync = (time.perf_counter() - t) * 1000 / frames
+        t = time.perf_counter()
+        for f in [model.submit(im) for im in ims]:
+            f.result()
+        dt = (time.perf_counter() - t) * 1000 / frames
+        y.append([hint or "default", len(model.ov_queue), round(sync, 2), round(dt, 2)])
+    py = pd.DataFrame(y, columns=["Hint", "Requests", "Sync (ms/frame)", "Async (ms/frame)"])
+    LOGGER.info(f"\nOpenVINO benchmark ({imgsz}px, {os.cpu_count()} CPUs)\n{py}")
+    return py
+
+
+def _latency_job(w, batch_size, imgsz, threads, warmup, n):
+    """Loads `w` and times single forward passes, run in a fresh process so load time and peak RSS are its own."""
+    torch.set_num_threads(threads)
+    t = time.perf_counter()
+    ort = {"ort_options": {"intra_op_num_threads": threads}, "ort_reuse_outputs": True}  # each output is discarded
+    model = DetectMultiBackend(w, device=torch.device("cpu"), **ort)
+    load = time.perf_counter() - t
+    im = torch.rand(batch_size, 3, imgsz, imgsz, generator=torch.Generator().manual_seed(0))
+    dt = []
+    with torch.no_grad():
+        for i in range(warmup + n):
+            t = time.perf_counter_ns()
+            model(im)
+            dt.append(time.perf_counter_ns() - t)
+    ms = np.array(dt[warmup:]) / 1e6
+    p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+    return {
+        "load_s": round(load, 3),
+        "mean_ms": round(ms.mean(), 3),
+        "p50_ms": round(p50, 3),
+        "p90_ms": round(p90, 3),
+        "p99_ms": round(p99, 3),
+        "img_s": round(batch_size * 1000 / ms.mean(), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def latency(
+    weights=("yolov5s.pt",),
+    include=("torchscript", "onnx", "openvino"),
+    imgsz=640,
+    batch_sizes=(1, 8),
+    threads=(1, os.cpu_count()),
+    warmup=10,
+    n=100,
+    json_file="",
+    baseline="",
+    tolerance=0.1,
+):
+    """
+    Micro-benchmarks warm steady-state CPU latency and throughput of PyTorch weights and their exports.
+
+    Every (model, batch size, thread count) runs in a fresh spawned process that loads the model, runs `warmup`
+    untimed passes and times `n` single passes on a fixed random batch, so neither a dataloader nor another model's
+    allocations skew the numbers. Exports come from the export.py artifact cache, one static model per batch size.
+
+    Args:
+        weights (tuple[str]): PyTorch weights to benchmark along with their exports.
+        include (tuple[str]): export.py formats to benchmark besides PyTorch.
+        imgsz (int): Inference size in pixels.
+        batch_sizes (tuple[int]): Batch sizes to time.
+        threads (tuple[int]): Intra-op thread counts for PyTorch and ONNX Runtime; OpenVINO picks its own.
+        warmup (int): Untimed passes before timing.
+        n (int): Timed passes.
+        json_file (str): Write the results, with host and library versions, to this JSON file.
+        baseline (str): JSON file from an earlier run to compare p50 latency against.
+        tolerance (float): Relative p50 increase over the baseline reported as a regression.
+
+    Returns:
+        pd.DataFrame: Load time, mean/p50/p90/p99 milliseconds per batch, images per second and peak RSS for each
+            model, batch size and thread count, plus baseline p50 and change when `baseline` is given.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    threads = sorted({max(1, t or 1) for t in threads})
+    baseline, json_file = _first_baseline(baseline, json_file)
+    rows = []
+    for w in weights:
+        for bs in batch_sizes:
+            models = {"PyTorch": w}
+            for f in include:
+                exported = export.run(weights=w, imgsz=[imgsz], include=[f], batch_size=bs, export_cache=True)
+                if exported:
+                    models[f] = exported[-1]
+                else:
+                    LOGGER.warning(f"WARNING ⚠️ {f} export of {w} failed, skipping")
+            for fmt, m in models.items():
+                for t in threads if fmt != "openvino" else threads[-1:]:
+                    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                        r = pool.submit(_latency_job, m, bs, imgsz, t, warmup, n).result()
+                    rows.append({"weights": Path(w).name, "format": fmt, "batch_size": bs, "threads": t, **r})
+    py = pd.DataFrame(rows)
+
+    keys = ["weights", "format", "batch_size", "threads"]
+    if baseline:
+        py = _compare(py, baseline, keys, "p50_ms", tolerance)
+    if json_file:
+        _save_results(py, json_file, keys, "p50_ms", imgsz=imgsz, warmup=warmup, n=n)
+    s = f"{imgsz}px, {warmup} warmup + {n} timed passes, {os.cpu_count()} CPUs"
+    LOGGER.info(f"\nLatency benchmark ({s})\n{py.to_string()}")
+    if baseline and py.regression.any():
+        regressed = py[py.regression].to_string()
+        LOGGER.warning(f"WARNING ⚠️ p50 latency regressed over {tolerance:.0%} vs {baseline}:\n{regressed}")
+    return py
+
+
+def _compare(py, baseline, keys, metric, tolerance=0.1):
+    """Merges `metric` of the matching `keys` rows of baseline JSON results into `py` as baseline_<metric>, change_%
+    and regression (over `tolerance` slower)."""
+    import json
+
+    b = pd.DataFrame(json.loads(Path(baseline).read_text())["results"])[keys + [metric]]
+    py = py.merge(b.rename(columns={metric: f"baseline_{metric}"}), on=keys, how="left")
+    py["change_%"] = ((py[metric] / py[f"baseline_{metric}"] - 1) * 100).round(1)
+    py["regression"] = py[metric] > py[f"baseline_{metric}"] * (1 + tolerance)
+    return py
+
+
+def _first_baseline(baseline, json_file):
+    """Returns (baseline, json_file) to use, saving this run as `baseline` when that file doesn't exist yet."""
+    if baseline and not Path(baseline).is_file():
+        LOGGER.info(f"Baseline {baseline} not found, saving this run as the baseline")
+        return "", json_file or baseline
+    return baseline, json_file
+
+
+def _save_results(py, json_file, keys, metric, **meta):
+    """Writes `py` with host and library versions to JSON, recording the `keys` and `metric` that compare() uses."""
+    import json
+
+    meta = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "keys": keys,
+        "metric": metric,
+        **meta,
+    }
+    results = json.loads(py.to_json(orient="records"))  # NaN to null
+    Path(json_file).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+
+
+def _time_calls(f, rounds=20, min_round_ms=5, max_time_s=2):
+    """
+    Times `f()` pytest-benchmark style: one warmup call, then rounds of k calls where k doubles until a round takes
+    `min_round_ms`, so fast functions are not dominated by timer resolution. Slow functions run fewer rounds (at least
+    5) to stay within about `max_time_s`. Returns per-call microsecond statistics.
+    """
+    f()  # warmup
+    k = 1
+    while True:
+        t = time.perf_counter_ns()
+        for _ in range(k):
+            f()
+        dt = time.perf_counter_ns() - t
+        if dt >= min_round_ms * 1e6 or k >= 1 << 16:
+            break
+        k *= 2
+    ts = []
+    for _ in range(min(rounds, max(5, int(max_time_s * 1e9 / dt)))):
+        t = time.perf_counter_ns()
+        for _ in range(k):
+            f()
+        ts.append((time.perf_counter_ns() - t) / k / 1e3)
+    q1, median, q3 = np.percentile(ts, (25, 50, 75))
+    return {
+        "rounds": len(ts),
+        "calls": k,
+        "min_us": round(min(ts), 2),
+        "median_us": round(median, 2),
+        "mean_us": round(float(np.mean(ts)), 2),
+        "iqr_us": round(q3 - q1, 2),
+    }
+
+
+def _hot_path_cases(nc=4, seed=0):
+    """
+    Returns {(function, input): zero-argument callable} for the utilities on every detect.py, val.py and API path, on
+    deterministic synthetic inputs at the sizes those paths run them at: single 640px images and 8-image val batches of
+    25200 anchors (32 images hit the NMS time limit on small CPUs), 300 detections (val --max-det) against 20 labels,
+    100k predictions for ap_per_class() and phone-camera images for letterbox().
+    """
+    g = torch.Generator().manual_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    def boxes(n, size=640):
+        """Returns (n, 4) xyxy boxes spread over a `size` image with realistic sizes."""
+        xy = torch.rand(n, 2, generator=g) * size
+        return torch.cat((xy, xy + torch.rand(n, 2, generator=g) * size / 4 + 4), 1)
+
+    p1, p8 = synthetic_predictions(1, 640, nc, seed), synthetic_predictions(8, 640, nc, seed)
+    det = torch.cat((boxes(300), torch.rand(300, 1, generator=g), torch.randint(0, nc, (300, 1), generator=g)), 1)
+    labels = torch.cat((det[:20, 5:], det[:20, :4] + torch.randn(20, 4, generator=g) * 8), 1)  # near 20 detections
+    iouv = torch.linspace(0.5, 0.95, 10)
+    b3k = boxes(3000)
+    xywh = torch.rand(25200, 4, generator=g) * 640
+    n = 100_000
+    tp = rng.random((n, 10)) < np.linspace(0.7, 0.2, 10)  # fewer true positives at stricter IoU
+    conf, pred_cls, target_cls = rng.random(n), rng.integers(0, nc, n), rng.integers(0, nc, n // 4)
+    phone = rng.integers(0, 255, (3024, 4032, 3), dtype=np.uint8)
+    hd = rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    names = {i: str(i) for i in range(nc)}
+    cm = ConfusionMatrix(nc)
+    return {
+        ("non_max_suppression", "1x25200, conf 0.25"): lambda: non_max_suppression(p1, 0.25, 0.45),
+        ("non_max_suppression", "8x25200, conf 0.001"): lambda: non_max_suppression(
+            p8, 0.001, 0.6, multi_label=True, max_det=300
+        ),
+        ("batched_non_max_suppression", "1x25200, conf 0.25"): lambda: batched_non_max_suppression(p1, 0.25, 0.45),
+        ("batched_non_max_suppression", "8x25200, conf 0.001"): lambda: batched_non_max_suppression(
+            p8, 0.001, 0.6, multi_label=True, max_det=300
+        ),
+        ("box_iou", "20x300"): lambda: box_iou(labels[:, 1:], det[:, :4]),
+        ("box_iou", "3000x3000"): lambda: box_iou(b3k, b3k),
+        ("scale_boxes", "300, 640 -> 4032x3024"): lambda: scale_boxes((640, 640), det[:, :4].clone(), (3024, 4032)),
+        ("xywh2xyxy", "torch 25200"): lambda: xywh2xyxy(xywh),
+        ("xywh2xyxy", "numpy 25200"): lambda: xywh2xyxy(xywh.numpy()),
+        ("letterbox", "4032x3024 -> 640"): lambda: letterbox(phone, 640, auto=False),
+        ("letterbox", "1280x720 -> 640 rect"): lambda: letterbox(hd, 640),
+        ("val.process_batch", "300 det, 20 labels"): lambda: process_batch(det, labels, iouv),
+        ("ap_per_class", f"100k pred, {nc} classes"): lambda: ap_per_class(tp, conf, pred_cls, target_cls, names=names),
+        ("ConfusionMatrix.process_batch", "300 det, 20 labels"): lambda: cm.process_batch(det, labels),
+    }
+
+
+def hot_paths(nc=4, rounds=20, json_file="", baseline="", tolerance=0.1, threads=None):
+    """
+    Micro-benchmarks the utilities every inference and validation call runs through (NMS, box_iou, scale_boxes,
+    xywh2xyxy, letterbox, val.process_batch, ap_per_class, ConfusionMatrix.process_batch) on deterministic synthetic
+    inputs, so optimizations to them are measurable and regressions against a stored baseline are caught.
+
+    Args:
+        nc (int): Number of classes, 4 for the apple-leaf model.
+        rounds (int): Timed rounds per function, fewer for slow ones.
+        json_file (str): Write the results, with host and library versions, to this JSON file (the next baseline).
+        baseline (str): JSON file from an earlier run to compare median time against, created by this run if missing.
+        tolerance (float): Relative median increase over the baseline reported as a regression.
+        threads (int | None): PyTorch intra-op threads for the run, default the baseline's recorded count, else 1.
+
+    Returns:
+        pd.DataFrame: Rounds, calls per round and min/median/mean/IQR microseconds per call for each function and
+            input, plus baseline median and change when `baseline` is given.
+    """
+    import json
+
+    baseline, json_file = _first_baseline(baseline, json_file)
+    recorded = json.loads(Path(baseline).read_text())["meta"].get("threads") if baseline else None
+    threads = threads or recorded or 1
+    if recorded and recorded != threads:
+        LOGGER.warning(f"WARNING ⚠️ {baseline} was recorded with {recorded} threads, this run uses {threads}")
+    n = torch.get_num_threads()
+    torch.set_num_threads(threads)  # multi-threaded kernels scale with the thread count, so it's part of the baseline
+    try:
+        rows = []
+        with torch.inference_mode():
+            for (fn, inputs), f in _hot_path_cases(nc).items():
+                rows.append({"function": fn, "input": inputs, **_time_calls(f, rounds)})
+    finally:
+        torch.set_num_threads(n)
+    py = pd.DataFrame(rows)
+    keys = ["function", "input"]
+    if baseline:
+        py = _compare(py, baseline, keys, "median_us", tolerance)
+    if json_file:
+        _save_results(py, json_file, keys, "median_us", threads=threads, nc=nc)
+    LOGGER.info(f"\nHot path benchmark ({threads} threads, {nc} classes)\n{py.to_string()}")
+    if baseline and py.regression.any():
+        regressed = py[py.regression].to_string()
+        LOGGER.warning(f"WARNING ⚠️ median time regressed over {tolerance:.0%} vs {baseline}:\n{regressed}")
+    return py
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compares two saved --latency or --hot-paths JSON results without rerunning them.
+
+    Returns:
+        pd.DataFrame: Rows of `current` with the baseline metric, change in percent and whether it regressed by more
+            than `tolerance`.
+    """
+    import json
+
+    meta = json.loads(Path(current).read_text())["meta"]
+    keys = meta.get("keys", ["weights", "format", "batch_size", "threads"])  # --latency files predating meta keys
+    metric = meta.get("metric", "p50_ms")
+    py = _compare(pd.DataFrame(json.loads(Path(current).read_text())["results"]), baseline, keys, metric, tolerance)
+    py = py[keys + [f"baseline_{metric}", metric, "change_%", "regression"]]
+    LOGGER.info(f"\n{current} vs {baseline} ({metric}, tolerance {tolerance:.0%})\n{py.to_string()}")
+    if py.regression.any():
+        regressed = py[py.regression].to_string()
+        LOGGER.warning(f"WARNING ⚠️ {py.regression.sum()} regressions over {tolerance:.0%}:\n{regressed}")
+    return py
+
+
 def parse_opt():
     """
     Parses command-line arguments for YOLOv5 model inference configuration.
@@ -251,6 +811,21 @@ def parse_opt():
     parser.add_argument("--test", action="store_true", help="test exports only")
     parser.add_argument("--pt-only", action="store_true", help="test PyTorch only")
     parser.add_argument("--hard-fail", nargs="?", const=True, default=False, help="Exception on error or < min metric")
+    parser.add_argument("--export-cache", nargs="?", const=True, default=False, help="reuse cached exports (in dir)")
+    parser.add_argument("--workers", type=int, default=1, help="export formats in parallel processes first")
+    parser.add_argument("--nms", nargs="?", const=0.25, type=float, help="benchmark batched vs per-image NMS at conf")
+    parser.add_argument("--max-nms", type=int, default=30000, help="--nms per-image candidate cap for batched NMS")
+    parser.add_argument("--compile", nargs="*", help="benchmark eager vs compiled PyTorch for these (or --weights)")
+    parser.add_argument("--channels-last", nargs="*", help="benchmark NCHW vs channels_last (+bf16) for these weights")
+    parser.add_argument("--openvino", type=str, help="benchmark sync vs async inference of this OpenVINO model")
+    parser.add_argument("--latency", nargs="*", help="latency percentiles of these (or --weights) and exports")
+    parser.add_argument("--formats", nargs="*", default=["torchscript", "onnx", "openvino"], help="--latency exports")
+    parser.add_argument("--threads", nargs="+", type=int, help="--latency thread counts or --hot-paths thread count")
+    parser.add_argument("--hot-paths", action="store_true", help="benchmark NMS, box_iou, letterbox, metrics, ...")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two results JSON files")
+    parser.add_argument("--json", type=str, default="", help="--latency/--hot-paths results JSON file")
+    parser.add_argument("--baseline", type=str, default="", help="--latency/--hot-paths JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
     opt = parser.parse_args()
     opt.data = check_yaml(opt.data)  # check YAML
     print_args(vars(opt))
@@ -286,6 +861,41 @@ def main(opt):
         $ python benchmarks.py --weights yolov5s.pt --img 640
         ```
     """
+    if opt.nms is not None:
+        nms(imgsz=opt.imgsz, conf_thres=opt.nms, max_nms=opt.max_nms, n=10 if opt.nms >= 0.1 else 3)
+        return
+    if opt.compile is not None:
+        compiled(opt.compile or [opt.weights], imgsz=opt.imgsz)
+        return
+    if opt.channels_last is not None:
+        memory_formats(opt.channels_last or [opt.weights], imgsz=opt.imgsz)
+        return
+    if opt.openvino:
+        openvino_async(opt.openvino, imgsz=opt.imgsz)
+        return
+    if opt.latency is not None:
+        latency(
+            opt.latency or [opt.weights],
+            opt.formats,
+            imgsz=opt.imgsz,
+            batch_sizes=sorted({1, opt.batch_size}),
+            threads=opt.threads or (1, os.cpu_count()),
+            json_file=opt.json,
+            baseline=opt.baseline,
+            tolerance=opt.tolerance,
+        )
+        return
+    if opt.hot_paths or opt.compare:
+        if opt.compare:
+            py = compare(*opt.compare, tolerance=opt.tolerance)
+        else:
+            threads = opt.threads[0] if opt.threads else None
+            py = hot_paths(json_file=opt.json, baseline=opt.baseline, tolerance=opt.tolerance, threads=threads)
+        if "regression" in py and py.regression.any():
+            sys.exit(1)  # gate CI on regressions
+        return
+    del opt.nms, opt.max_nms, opt.compile, opt.channels_last, opt.openvino
+    del opt.latency, opt.formats, opt.threads, opt.json, opt.baseline, opt.tolerance, opt.hot_paths, opt.compare
     test(**vars(opt)) if opt.test else run(**vars(opt))
 
 
@@ -49,6 +49,8 @@ from models.common import DetectMultiBackend
 from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
 from utils.general import (
     LOGGER,
+    MEMORY,
+    SPANS,
     Profile,
     check_file,
     check_img_size,
@@ -60,10 +62,31 @@ from utils.general import (
     non_max_suppression,
     print_args,
     scale_boxes,
+    span,
     strip_optimizer,
     xyxy2xywh,
 )
-from utils.torch_utils import select_device, smart_inference_mode
+from utils.torch_utils import SamplingProfiler, select_device, smart_inference_mode
+
+
+def infer_ahead(dataset, model, preprocess):
+    """
+    Yields dataset items as (path, im, im0s, vid_cap, s, futures) one frame behind the loader for asynchronous
+    backends.
+
+    Frame N is preprocessed and submitted with `model.submit()`, one request per image of a batch, before frame N-1 is
+    yielded, so its inference runs on the OpenVINO request pool while frame N-1 is post-processed and frame N+1 is
+    decoded and letterboxed.
+    """
+    pending = None
+    for path, im, im0s, vid_cap, s in dataset:
+        im = preprocess(im)
+        item = path, im, im0s, vid_cap, s, [model.submit(x) for x in im.split(1)]
+        if pending is not None:
+            yield pending
+        pending = item
+    if pending is not None:
+        yield pending
 
 
 @smart_inference_mode()
@@ -97,6 +120,10 @@ def run(
     half=False,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
     vid_stride=1,  # video frame-rate stride
+    spans=False,  # record nested timing spans, save to save_dir/spans.json
+    memory="",  # track memory per stage and image, "rss" or "trace" (adds tracemalloc), save to save_dir/memory.json
+    profile="",  # sampling profiler, "stack", "ops" (torch.profiler) or "all", save to save_dir/profile.*
+    profile_window=(1, 0),  # profile after skipping this many images, for this many images (0 for all)
 ):
     """
     Runs YOLOv5 detection inference on various sources like images, videos, directories, streams, etc.
@@ -133,6 +160,16 @@ def run(
         half (bool): If True, use FP16 half-precision inference. Default is False.
         dnn (bool): If True, use OpenCV DNN backend for ONNX inference. Default is False.
         vid_stride (int): Stride for processing video frames, to skip frames between processing. Default is 1.
+        spans (bool): If True, record load, pre-process, inference and NMS spans with nested model spans, log their
+            statistics and save them to 'spans.json' in the results directory. Default is False.
+        memory (str): If "rss", track the RSS each span adds and sample RSS and native heap after every image; "trace"
+            also samples tracemalloc and reports the allocation sites that grew. Logs peak and steady-state growth and
+            saves them to 'memory.json' in the results directory. Default is "" (off).
+        profile (str): If "stack", sample the Python stacks of all threads and save them as 'profile.collapsed' for
+            flamegraphs; "ops" records torch operators with torch.profiler into 'profile_ops.txt'; "all" does both.
+            The configuration is saved to 'profile.json'. Default is "" (off).
+        profile_window (tuple[int, int]): Images to skip before profiling and images to profile, 0 for all remaining.
+            Default is (1, 0).
 
     Returns:
         None
@@ -161,164 +198,206 @@ def run(
     save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
     (save_dir / "labels" if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
-    # Load model
-    device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
-    stride, names, pt = model.stride, model.names, model.pt
-    imgsz = check_img_size(imgsz, s=stride)  # check image size
-
-    # Dataloader
-    bs = 1  # batch_size
-    if webcam:
-        view_img = check_imshow(warn=True)
-        dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
-        bs = len(dataset)
-    elif screenshot:
-        dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
-    else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
-    vid_path, vid_writer = [None] * bs, [None] * bs
-
-    # Run inference
-    model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
-    seen, windows, dt = 0, [], (Profile(device=device), Profile(device=device), Profile(device=device))
-    for path, im, im0s, vid_cap, s in dataset:
-        with dt[0]:
-            im = torch.from_numpy(im).to(model.device)
-            im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            if len(im.shape) == 3:
-                im = im[None]  # expand for batch dim
-            if model.xml and im.shape[0] > 1:
-                ims = torch.chunk(im, im.shape[0], 0)
-
-        # Inference
-        with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            if model.xml and im.shape[0] > 1:
-                pred = None
-                for image in ims:
-                    if pred is None:
-                        pred = model(image, augment=augment, visualize=visualize).unsqueeze(0)
-                    else:
-                        pred = torch.cat((pred, model(image, augment=augment, visualize=visualize).unsqueeze(0)), dim=0)
-                pred = [pred, None]
-            else:
-                pred = model(im, augment=augment, visualize=visualize)
-        # NMS
-        with dt[2]:
-            pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
-
-        # Second-stage classifier (optional)
-        # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
-
-        # Define the path for the CSV file
-        csv_path = save_dir / "predictions.csv"
-
-        # Create or append to the CSV file
-        def write_to_csv(image_name, prediction, confidence):
-            """Writes prediction data for an image to a CSV file, appending if the file exists."""
-            data = {"Image Name": image_name, "Prediction": prediction, "Confidence": confidence}
-            file_exists = os.path.isfile(csv_path)
-            with open(csv_path, mode="a", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=data.keys())
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(data)
-
-        # Process predictions
-        for i, det in enumerate(pred):  # per image
-            seen += 1
-            if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
-                s += f"{i}: "
-            else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
-
-            p = Path(p)  # to Path
-            save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / "labels" / p.stem) + ("" if dataset.mode == "image" else f"_{frame}")  # im.txt
-            s += "{:g}x{:g} ".format(*im.shape[2:])  # print string
-            gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            imc = im0.copy() if save_crop else im0  # for save_crop
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
-            if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
-
-                # Print results
-                for c in det[:, 5].unique():
-                    n = (det[:, 5] == c).sum()  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    c = int(cls)  # integer class
-                    label = names[c] if hide_conf else f"{names[c]}"
-                    confidence = float(conf)
-                    confidence_str = f"{confidence:.2f}"
-
-                    if save_csv:
-                        write_to_csv(p.name, label, confidence_str)
-
-                    if save_txt:  # Write to file
-                        if save_format == 0:
-                            coords = (
-                                (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()
-                            )  # normalized xywh
-                        else:
-                            coords = (torch.tensor(xyxy).view(1, 4) / gn).view(-1).tolist()  # xyxy
-                        line = (cls, *coords, conf) if save_conf else (cls, *coords)  # label format
-                        with open(f"{txt_path}.txt", "a") as f:
-                            f.write(("%g " * len(line)).rstrip() % line + "\n")
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
+    if spans:
+        SPANS.reset()
+        SPANS.enabled = True
+    try:
+        if memory:
+            MEMORY.start(trace=memory == "trace")
+
+        # Load model
+        device = select_device(device)
+        with span("load"):
+            model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+        stride, names, pt = model.stride, model.names, model.pt
+        imgsz = check_img_size(imgsz, s=stride)  # check image size
+        if model.nms:
+            LOGGER.info(
+                "Model includes NMS, ignoring --conf-thres, --iou-thres, --classes, --agnostic-nms and --max-det"
+            )
+
+        # Dataloader
+        bs = 1  # batch_size
+        if webcam:
+            view_img = check_imshow(warn=True)
+            dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+            bs = len(dataset)
+        elif screenshot:
+            dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+        else:
+            auto = pt or bool(model.bundle)  # minimal padding, bundles dispatch to the smallest fitting model
+            dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=auto, vid_stride=vid_stride)
+        vid_path, vid_writer = [None] * bs, [None] * bs
+
+        # Run inference
+        model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
+        profiler = SamplingProfiler(profile, profile_window) if profile else None
+        seen, windows = 0, []
+        # OpenVINO infers asynchronously one frame ahead when there is a spare core to overlap on, else synchronously
+        ahead = model.xml and (os.cpu_count() or 1) > 1
+        infer = "inference wait" if ahead else "inference"  # ahead, dt[1] only times the wait from submit to result
+        dt = (
+            Profile(device=device, name="preprocess"),
+            Profile(device=device, name=infer.replace(" ", "_")),
+            Profile(device=device, name="nms"),
+        )
+
+        def preprocess(im):
+            """Converts a loader image to a normalized (bs, 3, h, w) input tensor."""
+            with dt[0]:
+                im = torch.from_numpy(im).to(model.device)
+                im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
+                im /= 255  # 0 - 255 to 0.0 - 1.0
+                if len(im.shape) == 3:
+                    im = im[None]  # expand for batch dim
+            return im
+
+        frames = infer_ahead(dataset, model, preprocess) if ahead else ((*x, None) for x in dataset)  # futures=None
+        for path, im, im0s, vid_cap, s, futures in frames:
+            if futures is None:
+                im = preprocess(im)
+
+            # Inference
+            with dt[1]:
+                visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
+                if model.xml:  # one request per image on the OpenVINO request pool, maybe submitted by infer_ahead()
+                    futures = futures or [model.submit(x) for x in im.split(1)]
+                    pred = torch.cat([f.result() for f in futures])
+                else:
+                    pred = model(im, augment=augment, visualize=visualize)
+            # NMS
+            with dt[2]:
+                if not model.nms:  # ONNX models exported with --nms return final detections
+                    pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+
+            # Second-stage classifier (optional)
+            # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
+
+            # Define the path for the CSV file
+            csv_path = save_dir / "predictions.csv"
+
+            # Create or append to the CSV file
+            def write_to_csv(image_name, prediction, confidence):
+                """Writes prediction data for an image to a CSV file, appending if the file exists."""
+                data = {"Image Name": image_name, "Prediction": prediction, "Confidence": confidence}
+                file_exists = os.path.isfile(csv_path)
+                with open(csv_path, mode="a", newline="") as f:
+                    writer = csv.DictWriter(f, fieldnames=data.keys())
+                    if not file_exists:
+                        writer.writeheader()
+                    writer.writerow(data)
+
+            # Process predictions
+            for i, det in enumerate(pred):  # per image
+                seen += 1
+                if webcam:  # batch_size >= 1
+                    p, im0, frame = path[i], im0s[i].copy(), dataset.count
+                    s += f"{i}: "
+                else:
+                    p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
+
+                p = Path(p)  # to Path
+                save_path = str(save_dir / p.name)  # im.jpg
+                txt_path = str(save_dir / "labels" / p.stem)  # im.txt
+                txt_path += "" if dataset.mode == "image" else f"_{frame}"
+                s += "{:g}x{:g} ".format(*im.shape[2:])  # print string
+                gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+                imc = im0.copy() if save_crop else im0  # for save_crop
+                annotator = Annotator(im0, line_width=line_thickness, example=str(names))
+                if len(det):
+                    # Rescale boxes from img_size to im0 size
+                    det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+
+                    # Print results
+                    for c in det[:, 5].unique():
+                        n = (det[:, 5] == c).sum()  # detections per class
+                        s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+
+                    # Write results
+                    for *xyxy, conf, cls in reversed(det):
                         c = int(cls)  # integer class
-                        label = None if hide_labels else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
-                        annotator.box_label(xyxy, label, color=colors(c, True))
-                    if save_crop:
-                        save_one_box(xyxy, imc, file=save_dir / "crops" / names[c] / f"{p.stem}.jpg", BGR=True)
-
-            # Stream results
-            im0 = annotator.result()
-            if view_img:
-                if platform.system() == "Linux" and p not in windows:
-                    windows.append(p)
-                    cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
-                    cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
-                cv2.imshow(str(p), im0)
-                cv2.waitKey(1)  # 1 millisecond
-
-            # Save results (image with detections)
-            if save_img:
-                if dataset.mode == "image":
-                    cv2.imwrite(save_path, im0)
-                else:  # 'video' or 'stream'
-                    if vid_path[i] != save_path:  # new video
-                        vid_path[i] = save_path
-                        if isinstance(vid_writer[i], cv2.VideoWriter):
-                            vid_writer[i].release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        else:  # stream
-                            fps, w, h = 30, im0.shape[1], im0.shape[0]
-                        save_path = str(Path(save_path).with_suffix(".mp4"))  # force *.mp4 suffix on results videos
-                        vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
-                    vid_writer[i].write(im0)
-
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1e3:.1f}ms")
-
-    # Print results
-    t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
-    LOGGER.info(f"Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(1, 3, *imgsz)}" % t)
-    if save_txt or save_img:
-        s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ""
-        LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
-    if update:
-        strip_optimizer(weights[0])  # update model (to fix SourceChangeWarning)
+                        label = names[c] if hide_conf else f"{names[c]}"
+                        confidence = float(conf)
+                        confidence_str = f"{confidence:.2f}"
+
+                        if save_csv:
+                            write_to_csv(p.name, label, confidence_str)
+
+                        if save_txt:  # Write to file
+                            if save_format == 0:
+                                coords = (
+                                    (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()
+                                )  # normalized xywh
+                            else:
+                                coords = (torch.tensor(xyxy).view(1, 4) / gn).view(-1).tolist()  # xyxy
+                            line = (cls, *coords, conf) if save_conf else (cls, *coords)  # label format
+                            with open(f"{txt_path}.txt", "a") as f:
+                                f.write(("%g " * len(line)).rstrip() % line + "\n")
+
+                        if save_img or save_crop or view_img:  # Add bbox to image
+                            c = int(cls)  # integer class
+                            label = None if hide_labels else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
+                            annotator.box_label(xyxy, label, color=colors(c, True))
+                        if save_crop:
+                            save_one_box(xyxy, imc, file=save_dir / "crops" / names[c] / f"{p.stem}.jpg", BGR=True)
+
+                # Stream results
+                im0 = annotator.result()
+                if view_img:
+                    if platform.system() == "Linux" and p not in windows:
+                        windows.append(p)
+                        cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
+                        cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
+                    cv2.imshow(str(p), im0)
+                    cv2.waitKey(1)  # 1 millisecond
+
+                # Save results (image with detections)
+                if save_img:
+                    if dataset.mode == "image":
+                        cv2.imwrite(save_path, im0)
+                    else:  # 'video' or 'stream'
+                        if vid_path[i] != save_path:  # new video
+                            vid_path[i] = save_path
+                            if isinstance(vid_writer[i], cv2.VideoWriter):
+                                vid_writer[i].release()  # release previous video writer
+                            if vid_cap:  # video
+                                fps = vid_cap.get(cv2.CAP_PROP_FPS)
+                                w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                                h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                            else:  # stream
+                                fps, w, h = 30, im0.shape[1], im0.shape[0]
+                            save_path = str(Path(save_path).with_suffix(".mp4"))  # force *.mp4 suffix on results videos
+                            vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+                        vid_writer[i].write(im0)
+
+            # Print time (inference-only)
+            LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1e3:.1f}ms{' wait' if ahead else ''}")
+            MEMORY.sample(Path(path).name)
+            if profiler:
+                profiler.step()
+
+        # Print results
+        t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
+        LOGGER.info(f"Speed: %.1fms pre-process, %.1fms {infer}, %.1fms NMS per image at shape {(1, 3, *imgsz)}" % t)
+        if save_txt or save_img:
+            n = len(list(save_dir.glob("labels/*.txt")))
+            s = f"\n{n} labels saved to {save_dir / 'labels'}" if save_txt else ""
+            LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
+        if update:
+            strip_optimizer(weights[0])  # update model (to fix SourceChangeWarning)
+        if memory:
+            MEMORY.stop()
+            MEMORY.print()
+            MEMORY.save(save_dir / "memory.json")
+        if profiler:
+            profiler.save(
+                save_dir, weights=weights, source=source, imgsz=imgsz, device=device, half=half, augment=augment
+            )
+    finally:
+        if spans:  # also when the run fails
+            SPANS.enabled = False
+            SPANS.print()
+            SPANS.save(save_dir / "spans.json")
 
 
 def parse_opt():
@@ -355,6 +434,13 @@ def parse_opt():
         --dnn (bool, optional): Flag to use OpenCV DNN for ONNX inference. Defaults to False.
         --vid-stride (int, optional): Video frame-rate stride, determining the number of frames to skip in between
             consecutive frames. Defaults to 1.
+        --spans (bool, optional): Flag to record nested timing spans and save them to spans.json. Defaults to False.
+        --memory (str, optional): Track memory per stage and image ('rss', or 'trace' with tracemalloc) and save it to
+            memory.json. Defaults to 'rss' when given without a value, else off.
+        --profile (str, optional): Run the sampling profiler ('stack', 'ops' or 'all') and save profile.collapsed,
+            profile_ops.txt and profile.json. Defaults to 'all' when given without a value, else off.
+        --profile-window (int, int, optional): Images to skip before profiling and images to profile (0 for all).
+            Defaults to 1 0.
 
     Returns:
         argparse.Namespace: Parsed command-line arguments as an argparse.Namespace object.
@@ -400,6 +486,14 @@ def parse_opt():
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
     parser.add_argument("--vid-stride", type=int, default=1, help="video frame-rate stride")
+    parser.add_argument("--spans", action="store_true", help="record nested timing spans to save_dir/spans.json")
+    parser.add_argument(
+        "--memory", nargs="?", const="rss", default="", choices=["rss", "trace"], help="track memory, --memory [trace]"
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="all", default="", choices=["stack", "ops", "all"], help="sampling profiler"
+    )
+    parser.add_argument("--profile-window", nargs=2, type=int, default=[1, 0], help="images to skip, then to profile")
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
@@ -70,7 +70,9 @@ if platform.system() != "Windows":
 from models.experimental import attempt_load
 from models.yolo import ClassificationModel, Detect, DetectionModel, SegmentationModel
 from utils.dataloaders import LoadImages
+from utils.downloads import attempt_download
 from utils.general import (
+    CONFIG_DIR,
     LOGGER,
     Profile,
     check_dataset,
@@ -83,6 +85,7 @@ from utils.general import (
     get_default_args,
     print_args,
     url2file,
+    yaml_load,
     yaml_save,
 )
 from utils.torch_utils import select_device, smart_inference_mode
@@ -142,6 +145,108 @@ class iOSModel(torch.nn.Module):
         return cls * conf, xywh * self.normalize  # confidence (3780, 80), coordinates (3780, 4)
 
 
+class BatchedNMS(torch.autograd.Function):
+    """Per-image NMS exported as a single ONNX `NonMaxSuppression` node that loops over the batch dimension itself."""
+
+    @staticmethod
+    def forward(ctx, boxes, scores, iou_thres, conf_thres, max_det):
+        """
+        Runs NMS on each image of the batch independently.
+
+        Args:
+            boxes (torch.Tensor): Boxes with shape (B, N, 4) in xyxy format.
+            scores (torch.Tensor): Scores with shape (B, N).
+            iou_thres (float): IoU threshold for suppression.
+            conf_thres (float): Boxes scoring at or below this threshold are dropped before suppression.
+            max_det (int): Maximum number of boxes kept per image.
+
+        Returns:
+            (torch.Tensor): Kept (image, box) index pairs with shape (K, 2), int64.
+        """
+        import torchvision  # scope for faster 'import export'
+
+        keep = []
+        for b, (x, s) in enumerate(zip(boxes, scores)):
+            i = (s > conf_thres).nonzero().squeeze(1)
+            i = i[torchvision.ops.nms(x[i].float(), s[i].float(), iou_thres)[:max_det]]
+            keep.append(torch.stack((torch.full_like(i, b), i), 1))
+        return torch.cat(keep) if keep else torch.zeros((0, 2), dtype=torch.int64, device=boxes.device)
+
+    @staticmethod
+    def symbolic(g, boxes, scores, iou_thres, conf_thres, max_det):
+        """Emits NonMaxSuppression with batched (B, N, 4) boxes and (B, 1, N) single-class scores."""
+        from torch.onnx import symbolic_opset11 as opset11
+
+        float32 = torch.onnx.TensorProtoDataType.FLOAT
+        out = g.op(
+            "NonMaxSuppression",
+            g.op("Cast", boxes, to_i=float32),
+            g.op("Cast", opset11.unsqueeze(g, scores, 1), to_i=float32),
+            g.op("Constant", value_t=torch.tensor([max_det], dtype=torch.int64)),
+            g.op("Constant", value_t=torch.tensor([iou_thres], dtype=torch.float)),
+            g.op("Constant", value_t=torch.tensor([conf_thres], dtype=torch.float)),
+        )  # (K, 3) batch, class, box
+        return g.op("Gather", out, g.op("Constant", value_t=torch.tensor([0, 2], dtype=torch.int64)), axis_i=1)
+
+
+class ONNXNMSModel(torch.nn.Module):
+    """Wraps a YOLOv5 detection model with batched NMS so the exported ONNX graph returns final detections."""
+
+    def __init__(self, model, topk_all=100, iou_thres=0.45, conf_thres=0.25, agnostic_nms=False):
+        """
+        Initializes the NMS wrapper around an exported (Detect.export=True) YOLOv5 detection model.
+
+        Args:
+            model (torch.nn.Module): The YOLOv5 detection model, returning decoded (B, N, 5 + nc) predictions.
+            topk_all (int): Maximum number of detections kept per image. Default is 100.
+            iou_thres (float): IoU threshold for NMS. Default is 0.45.
+            conf_thres (float): Confidence threshold (objectness * class probability). Default is 0.25.
+            agnostic_nms (bool): Suppress boxes across classes instead of per class. Default is False.
+
+        Notes:
+            Images are suppressed independently by `BatchedNMS`, one ONNX `NonMaxSuppression` node over the batch.
+            Within an image, boxes of different classes are offset apart by class * 7680 pixels as in
+            `non_max_suppression()`. Offset coordinates stay below 2**20, where float32 resolves 1/16 pixel, for up to
+            135 classes at any batch size.
+        """
+        super().__init__()
+        self.model = model
+        self.nc = model.model[-1].nc  # number of classes
+        self.topk_all = topk_all
+        self.iou_thres = iou_thres
+        self.conf_thres = conf_thres
+        self.agnostic = agnostic_nms
+        if not agnostic_nms and (self.nc + 1) * 7680 > 2**20:
+            LOGGER.warning(f"WARNING ⚠️ {self.nc} classes offset NMS boxes past 1/16 pixel float32 precision")
+
+    def forward(self, x):
+        """
+        Runs the model and NMS, returning fixed-size, score-sorted detections padded with zeros.
+
+        Args:
+            x (torch.Tensor): Input images with shape (B, 3, H, W).
+
+        Returns:
+            (tuple[torch.Tensor]): `num_dets` (B, 1) valid detections per image, `boxes` (B, K, 4) xyxy pixels,
+            `scores` (B, K) and `classes` (B, K) int64, where K = min(topk_all, N). Only the first `num_dets` rows
+            of each image are valid.
+        """
+        p = self.model(x)[0]  # (B, N, 5 + nc)
+        n = p.shape[1]
+        scores, classes = (p[..., 5:] * p[..., 4:5]).max(2)  # best class only
+        xy, wh = p[..., :2], p[..., 2:4] / 2
+        boxes = torch.cat((xy - wh, xy + wh), 2)  # xywh to xyxy
+
+        k = min(self.topk_all, n)
+        offset = boxes if self.agnostic else boxes + classes[..., None].to(boxes.dtype) * 7680  # per-class NMS
+        keep = BatchedNMS.apply(offset, scores, self.iou_thres, self.conf_thres, k)  # (K, 2) image, box
+        bi, i = keep.unbind(1)
+        kept = torch.zeros_like(scores).index_put((bi, i), scores[bi, i])  # suppressed boxes score 0
+        scores, j = kept.topk(k, 1)
+        num_dets = (scores > 0).sum(1, keepdim=True)
+        return num_dets, boxes.gather(1, j[..., None].expand(-1, -1, 4)), scores, classes.gather(1, j)
+
+
 def export_formats():
     r"""
     Returns a DataFrame of supported YOLOv5 model export formats and their properties.
@@ -282,9 +387,22 @@ def export_torchscript(model, im, file, optimize, prefix=colorstr("TorchScript:"
 
 
 @try_export
-def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX:")):
+def export_onnx(
+    model,
+    im,
+    file,
+    opset,
+    dynamic,
+    simplify,
+    nms=False,
+    agnostic_nms=False,
+    topk_all=100,
+    iou_thres=0.45,
+    conf_thres=0.25,
+    prefix=colorstr("ONNX:"),
+):
     """
-    Export a YOLOv5 model to ONNX format with dynamic axes support and optional model simplification.
+    Export a YOLOv5 model to ONNX format with dynamic axes support, optional NMS and optional model simplification.
 
     Args:
         model (torch.nn.Module): The YOLOv5 model to be exported.
@@ -293,6 +411,11 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
         opset (int): The ONNX opset version to use for export.
         dynamic (bool): If True, enables dynamic axes for batch, height, and width dimensions.
         simplify (bool): If True, applies ONNX model simplification for optimization.
+        nms (bool): If True, appends NMS to the graph, which then outputs `num_dets`, `boxes`, `scores` and `classes`.
+        agnostic_nms (bool): If True, the appended NMS is class-agnostic.
+        topk_all (int): Maximum detections per image kept by the appended NMS.
+        iou_thres (float): IoU threshold of the appended NMS.
+        conf_thres (float): Confidence threshold of the appended NMS.
         prefix (str): A prefix string for logging messages, defaults to 'ONNX:'.
 
     Returns:
@@ -335,11 +458,20 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
     f = str(file.with_suffix(".onnx"))
 
     output_names = ["output0", "output1"] if isinstance(model, SegmentationModel) else ["output0"]
+    kwargs = {}
+    if nms:
+        assert type(model) is DetectionModel, "ONNX NMS export only supported for detection models"
+        model = ONNXNMSModel(model, topk_all, iou_thres, conf_thres, agnostic_nms).eval()
+        output_names = ["num_dets", "boxes", "scores", "classes"]
+        if check_version(torch.__version__, "2.5.0"):
+            kwargs["dynamo"] = False  # TorchScript exporter maps torchvision.ops.nms to NonMaxSuppression
     if dynamic:
         dynamic = {"images": {0: "batch", 2: "height", 3: "width"}}  # shape(1,3,640,640)
         if isinstance(model, SegmentationModel):
             dynamic["output0"] = {0: "batch", 1: "anchors"}  # shape(1,25200,85)
             dynamic["output1"] = {0: "batch", 2: "mask_height", 3: "mask_width"}  # shape(1,32,160,160)
+        elif nms:
+            dynamic.update({k: {0: "batch"} for k in output_names})  # shape(1,1), (1,100,4), (1,100), (1,100)
         elif isinstance(model, DetectionModel):
             dynamic["output0"] = {0: "batch", 1: "anchors"}  # shape(1,25200,85)
 
@@ -353,6 +485,7 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
         input_names=["images"],
         output_names=output_names,
         dynamic_axes=dynamic or None,
+        **kwargs,
     )
 
     # Checks
@@ -360,7 +493,10 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
     onnx.checker.check_model(model_onnx)  # check onnx model
 
     # Metadata
-    d = {"stride": int(max(model.stride)), "names": model.names}
+    m = model.model if nms else model
+    d = {"stride": int(max(m.stride)), "names": m.names}
+    if nms:
+        d["nms"] = {"agnostic": agnostic_nms, "topk_all": topk_all, "iou_thres": iou_thres, "conf_thres": conf_thres}
     for k, v in d.items():
         meta = model_onnx.metadata_props.add()
         meta.key, meta.value = k, str(v)
@@ -473,6 +609,73 @@ def export_openvino(file, metadata, half, int8, data, prefix=colorstr("OpenVINO:
     return f, None
 
 
+@try_export
+def export_bundle(
+    model,
+    im,
+    file,
+    sizes,
+    opset,
+    simplify,
+    xml,
+    metadata,
+    half,
+    int8,
+    data,
+    nms=False,
+    prefix=colorstr("Bundle:"),
+    **kw,
+):
+    """
+    Export one static-shape ONNX (or OpenVINO) model per input size into a `*_bundle/` directory with a manifest.
+
+    Args:
+        model (torch.nn.Module): The YOLOv5 model, prepared for export (Detect.export=True).
+        im (torch.Tensor): Sample input tensor, its batch size and channels are used for every model.
+        file (Path): Path of the source weights, the bundle is saved as `{file.stem}_bundle/` next to it.
+        sizes (list[tuple[int, int]]): Input (height, width) of each model, stride multiples.
+        opset (int): ONNX opset version.
+        simplify (bool): If True, slims each ONNX model.
+        xml (bool): If True, converts each ONNX model to OpenVINO and lists the OpenVINO models in the manifest.
+        metadata (dict): Model metadata, i.e. stride and names, copied into the manifest.
+        half (bool): OpenVINO FP16 compression.
+        int8 (bool): OpenVINO INT8 quantization.
+        data (str): Dataset YAML path for INT8 calibration.
+        nms (bool): If True, appends NMS to each ONNX model (not to OpenVINO models).
+        prefix (str): Prefix string for logging messages.
+        **kw: ONNX NMS arguments forwarded to `export_onnx()`, i.e. `iou_thres`.
+
+    Returns:
+        (str, None): The bundle directory and None.
+
+    Notes:
+        `DetectMultiBackend` loads the directory and runs each input on the smallest model that fits it, padding the
+        bottom-right edges, so mixed input sizes get static-shape speed without padding everything to the largest size.
+        The manifest lists `{"imgsz": [h, w], "file": ...}` per model and the shared `batch_size`, `stride` and `names`.
+
+    Example:
+        ```
+        $ python export.py --weights yolov5s.pt --include onnx --bundle 320 480 640
+        $ python detect.py --weights yolov5s_bundle --imgsz 480
+        ```
+    """
+    d = file.parent / f"{file.stem}_bundle"
+    LOGGER.info(f"\n{prefix} starting export of {len(sizes)} models to {d}...")
+    d.mkdir(parents=True, exist_ok=True)
+    models = []
+    for h, w in sizes:
+        f = d / f"{file.stem}_{h}x{w}{file.suffix}"
+        x = torch.zeros(*im.shape[:2], h, w).to(im)
+        fo, _ = export_onnx(model, x, f, opset, False, simplify, nms=nms and not xml, **kw)
+        if xml:
+            fo, _ = export_openvino(f, metadata, half, int8, data)
+            f.with_suffix(".onnx").unlink(missing_ok=True)  # intermediate
+        assert fo, f"export failed for size {h}x{w}"
+        models.append({"imgsz": [h, w], "file": Path(fo).relative_to(d).as_posix()})
+    yaml_save(d / "manifest.yaml", {**metadata, "batch_size": im.shape[0], "models": models})
+    return str(d), None
+
+
 @try_export
 def export_paddle(model, im, file, metadata, prefix=colorstr("PaddlePaddle:")):
     """
@@ -1273,6 +1476,137 @@ def pipeline_coreml(model, im, file, names, y, mlmodel, prefix=colorstr("CoreML
     print(f"{prefix} pipeline success ({time.time() - t:.2f}s), saved as {f} ({file_size(f):.1f} MB)")
 
 
+def _export_job(kwargs, threads=0):
+    """Runs one export.run() call, i.e. in a worker process, returning its exported files (none on failure) and
+    duration in seconds.
+    """
+    if threads:
+        torch.set_num_threads(threads)  # share the CPU between parallel workers
+    t = time.time()
+    try:
+        f = run(**kwargs)
+    except Exception as e:
+        LOGGER.warning(f"WARNING ⚠️ {kwargs['include'][0]} export failure: {e}")
+        f = []
+    return f, time.time() - t
+
+
+@contextlib.contextmanager
+def _file_lock(file):
+    """Holds an exclusive inter-process lock on `file`, created if missing; a no-op where fcntl is unavailable."""
+    try:
+        import fcntl
+    except ImportError:  # Windows, manifest writes are still atomic
+        yield
+        return
+    with open(file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def export_cached(kwargs, cache=True, workers=1, prefix=colorstr("Export cache:")):
+    """
+    Exports each format of an export.run() call into its own artifact cache entry, reusing unchanged entries and
+    exporting the missing formats in parallel worker processes.
+
+    Args:
+        kwargs (dict): export.run() arguments.
+        cache (bool | str | Path): Cache directory, True for the user config dir `exports/`. When False, the default
+            directory is used but existing entries are re-exported.
+        workers (int): Maximum number of formats exported in parallel, each in a spawned process with its share of
+            the CPU threads.
+        prefix (str): Prefix string for logging messages.
+
+    Returns:
+        (list[str]): Exported files/dirs in `include` order, failed formats omitted like export.run().
+
+    Notes:
+        Entries are keyed by weights SHA-256, format and a hash of the remaining options (image size, batch size,
+        half, dynamic, NMS, ...), and live in `{cache}/{stem}_{sha16}/{format}_{options hash}/` next to a hard link of
+        the weights, so formats that write the same intermediate files (i.e. ONNX for OpenVINO and TensorRT) never
+        collide. `{cache}/manifest.yaml` records each entry's file, options, export time and size. Only this process
+        writes it, once its exports finish, merging its entries into the current file under a lock and replacing it
+        atomically, so concurrent export_cached() calls sharing a cache don't lose each other's entries.
+
+    Example:
+        ```
+        $ python export.py --weights yolov5s.pt --include torchscript onnx openvino --export-cache --workers 3
+        ```
+    """
+    import hashlib
+    import multiprocessing
+    import shutil
+    from concurrent.futures import ProcessPoolExecutor
+
+    t = time.time()
+    d = Path(cache) if isinstance(cache, (str, Path)) else CONFIG_DIR / "exports"
+    weights = Path(attempt_download(kwargs["weights"]))
+    include = [x.lower() for x in kwargs["include"]]
+    fmts = export_formats()
+    suffixes = dict(zip(fmts.Argument, fmts.Suffix))
+    assert all(x in suffixes for x in include), f"ERROR: Invalid --include {include}"
+    skip = ("weights", "include") if kwargs["int8"] else ("weights", "include", "data")  # data only calibrates INT8
+    options = {k: str(v) for k, v in sorted(kwargs.items()) if k not in skip}
+    sha = hashlib.sha256(weights.read_bytes()).hexdigest()[:16]
+    opt_hash = hashlib.sha256(json.dumps(options).encode()).hexdigest()[:8]
+    manifest = yaml_load(d / "manifest.yaml") if (d / "manifest.yaml").is_file() else {}
+
+    files, jobs = {}, {}
+    for fmt in include:
+        key = f"{weights.stem}_{sha}/{fmt}_{opt_hash}"
+        entry = manifest.get(key)
+        if cache and entry and (d / entry["file"]).exists():
+            files[fmt] = str(d / entry["file"])
+            continue
+        w = d / key / weights.name
+        if not w.exists():
+            w.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(weights, w)  # no copy on the same filesystem
+            except OSError:
+                shutil.copy(weights, w)
+        jobs[fmt] = key, dict(kwargs, weights=str(w), include=[fmt])
+    LOGGER.info(f"\n{prefix} {len(files)} cached, exporting {list(jobs) or 'nothing'} in {d}")
+
+    n = min(workers, len(jobs))
+    if n > 1:
+        threads = max(1, (os.cpu_count() or 1) // n)
+        with ProcessPoolExecutor(n, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = dict(zip(jobs, pool.map(_export_job, [a for _, a in jobs.values()], [threads] * len(jobs))))
+    else:
+        results = {fmt: _export_job(a) for fmt, (_, a) in jobs.items()}
+
+    entries = {}
+    for fmt, (f, dt) in results.items():
+        key, a = jobs[fmt]
+        suffix = "_bundle" if a["bundle"] else suffixes[fmt]
+        f = [x for x in f if suffix in x]
+        if f:  # success
+            files[fmt] = str(Path(f[-1]).resolve())
+            entries[key] = {
+                "format": fmt,
+                "weights": str(weights),
+                "file": Path(files[fmt]).relative_to(d.resolve()).as_posix(),
+                "options": dict(options),  # copy, avoids YAML anchors
+                "seconds": round(dt, 2),
+                "size_mb": round(file_size(files[fmt]), 2),
+                "exported": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+    if entries:
+        with _file_lock(d / "manifest.yaml.lock"):
+            file = d / "manifest.yaml"
+            manifest = yaml_load(file) if file.is_file() else {}  # re-read, other processes may have added entries
+            manifest.update(entries)
+            tmp = file.with_suffix(f".{os.getpid()}.tmp")
+            yaml_save(tmp, manifest)
+            os.replace(tmp, file)  # readers never see a partial file
+    LOGGER.info(f"{prefix} {len(files)}/{len(include)} formats ready ({time.time() - t:.1f}s)")
+    return [files[fmt] for fmt in include if fmt in files]
+
+
 @smart_inference_mode()
 def run(
     data=ROOT / "data/coco128.yaml",  # 'dataset.yaml path'
@@ -1294,12 +1628,15 @@ def run(
     opset=12,  # ONNX: opset version
     verbose=False,  # TensorRT: verbose log
     workspace=4,  # TensorRT: workspace size (GB)
-    nms=False,  # TF: add NMS to model
-    agnostic_nms=False,  # TF: add agnostic NMS to model
+    nms=False,  # TF/ONNX: add NMS to model
+    agnostic_nms=False,  # TF/ONNX: add agnostic NMS to model
     topk_per_class=100,  # TF.js NMS: topk per class to keep
-    topk_all=100,  # TF.js NMS: topk for all classes to keep
-    iou_thres=0.45,  # TF.js NMS: IoU threshold
-    conf_thres=0.25,  # TF.js NMS: confidence threshold
+    topk_all=100,  # TF.js/ONNX NMS: topk for all classes to keep
+    iou_thres=0.45,  # TF.js/ONNX NMS: IoU threshold
+    conf_thres=0.25,  # TF.js/ONNX NMS: confidence threshold
+    bundle=(),  # ONNX/OpenVINO: export one static model per image size (h, w) to a *_bundle/ directory
+    export_cache=False,  # cache exports by weights hash, format and options (True or cache dir)
+    workers=1,  # export formats in parallel processes
 ):
     """
     Exports a YOLOv5 model to specified formats including ONNX, TensorRT, CoreML, and TensorFlow.
@@ -1323,16 +1660,22 @@ def run(
         opset (int): ONNX opset version. Default is 12.
         verbose (bool): Enable verbose logging for TensorRT export. Default is False.
         workspace (int): TensorRT workspace size in GB. Default is 4.
-        nms (bool): Add non-maximum suppression (NMS) to the TensorFlow model. Default is False.
-        agnostic_nms (bool): Add class-agnostic NMS to the TensorFlow model. Default is False.
+        nms (bool): Add non-maximum suppression (NMS) to the TensorFlow or ONNX model. Default is False.
+        agnostic_nms (bool): Add class-agnostic NMS to the TensorFlow or ONNX model. Default is False.
         topk_per_class (int): Top-K boxes per class to keep for TensorFlow.js NMS. Default is 100.
-        topk_all (int): Top-K boxes for all classes to keep for TensorFlow.js NMS. Default is 100.
+        topk_all (int): Top-K boxes for all classes to keep for TensorFlow.js or ONNX NMS. Default is 100.
         iou_thres (float): IoU threshold for NMS. Default is 0.45.
         conf_thres (float): Confidence threshold for NMS. Default is 0.25.
+        bundle (tuple[int | tuple[int, int]]): Image sizes to export one static ONNX/OpenVINO model each for, into a
+            `*_bundle/` directory with a manifest that DetectMultiBackend dispatches inputs by. Default is ().
+        export_cache (bool | str): Export each format into an artifact cache keyed by weights hash, format and
+            options, reusing unchanged entries; True for the user config dir or a directory. Default is False.
+        workers (int): Export up to this many formats in parallel processes, implies a cache entry per format.
+            Default is 1.
         mlmodel (bool): Flag to use *.mlmodel for CoreML export. Default is False.
 
     Returns:
-        None
+        (list[str]): Exported files/dirs, from the artifact cache when `export_cache` or `workers` are set.
 
     Notes:
         - Model export is based on the specified formats in the 'include' argument.
@@ -1369,6 +1712,9 @@ def run(
         )
         ```
     """
+    if export_cache or workers > 1:  # one isolated, cacheable export per format
+        kwargs = {k: v for k, v in locals().items() if k not in ("export_cache", "workers")}
+        return export_cached(kwargs, export_cache, workers)
     t = time.time()
     include = [x.lower() for x in include]  # to lowercase
     fmts = tuple(export_formats()["Argument"][1:])  # --include arguments
@@ -1418,10 +1764,27 @@ def run(
         f[0], _ = export_torchscript(model, im, file, optimize)
     if engine:  # TensorRT required before ONNX
         f[1], _ = export_engine(model, im, file, half, dynamic, simplify, workspace, verbose, cache)
+    nms_args = dict(agnostic_nms=agnostic_nms, topk_all=topk_all, iou_thres=iou_thres, conf_thres=conf_thres)
+    if bundle:  # static models per size, replacing the single ONNX/OpenVINO export
+        assert set(include) <= {"onnx", "openvino"}, "--bundle only supports --include onnx and/or openvino"
+        assert not dynamic, "--bundle exports static shapes, i.e. use either --bundle or --dynamic but not both"
+        sizes = [[check_img_size(x, gs) for x in ((s, s) if isinstance(s, int) else s)] for s in bundle]
+        if onnx and xml:  # one manifest per directory
+            LOGGER.warning(
+                "WARNING ⚠️ --bundle with --include onnx openvino only keeps the OpenVINO bundle, "
+                "use --export-cache to export both"
+            )
+        f[3 if xml else 2], _ = export_bundle(
+            model, im, file, sizes, opset, simplify, xml, metadata, half, int8, data, nms or agnostic_nms, **nms_args
+        )
+        onnx = xml = False
     if onnx or xml:  # OpenVINO requires ONNX
-        f[2], _ = export_onnx(model, im, file, opset, dynamic, simplify)
+        onnx_nms = (nms or agnostic_nms) and not xml  # OpenVINO converts the plain graph
+        f[2], _ = export_onnx(model, im, file, opset, dynamic, simplify, nms=onnx_nms, **nms_args)
     if xml:  # OpenVINO
         f[3], _ = export_openvino(file, metadata, half, int8, data)
+        if onnx and (nms or agnostic_nms):  # OpenVINO converted the plain graph, now overwrite it with the NMS one
+            f[2], _ = export_onnx(model, im, file, opset, dynamic, simplify, nms=True, **nms_args)
     if coreml:  # CoreML
         f[4], ct_model = export_coreml(model, im, file, int8, half, nms, mlmodel)
         if nms:
@@ -1518,12 +1881,15 @@ def parse_opt(known=False):
     parser.add_argument("--opset", type=int, default=17, help="ONNX: opset version")
     parser.add_argument("--verbose", action="store_true", help="TensorRT: verbose log")
     parser.add_argument("--workspace", type=int, default=4, help="TensorRT: workspace size (GB)")
-    parser.add_argument("--nms", action="store_true", help="TF: add NMS to model")
-    parser.add_argument("--agnostic-nms", action="store_true", help="TF: add agnostic NMS to model")
+    parser.add_argument("--nms", action="store_true", help="TF/ONNX: add NMS to model")
+    parser.add_argument("--agnostic-nms", action="store_true", help="TF/ONNX: add agnostic NMS to model")
     parser.add_argument("--topk-per-class", type=int, default=100, help="TF.js NMS: topk per class to keep")
-    parser.add_argument("--topk-all", type=int, default=100, help="TF.js NMS: topk for all classes to keep")
-    parser.add_argument("--iou-thres", type=float, default=0.45, help="TF.js NMS: IoU threshold")
-    parser.add_argument("--conf-thres", type=float, default=0.25, help="TF.js NMS: confidence threshold")
+    parser.add_argument("--topk-all", type=int, default=100, help="TF.js/ONNX NMS: topk for all classes to keep")
+    parser.add_argument("--iou-thres", type=float, default=0.45, help="TF.js/ONNX NMS: IoU threshold")
+    parser.add_argument("--conf-thres", type=float, default=0.25, help="TF.js/ONNX NMS: confidence threshold")
+    parser.add_argument("--bundle", nargs="+", type=int, default=[], help="ONNX/OpenVINO: static models for sizes")
+    parser.add_argument("--export-cache", nargs="?", const=True, default=False, help="cache exports (in this dir)")
+    parser.add_argument("--workers", type=int, default=1, help="export formats in parallel processes")
     parser.add_argument(
         "--include",
         nargs="+",
@@ -3,12 +3,16 @@
 
 import ast
 import contextlib
+import hashlib
 import json
 import math
 import platform
+import threading
+import time
 import warnings
 import zipfile
 from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
 from copy import copy
 from pathlib import Path
 from urllib.parse import urlparse
@@ -19,6 +23,7 @@ import pandas as pd
 import requests
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from PIL import Image
 from torch.cuda import amp
 
@@ -39,6 +44,7 @@ from utils import TryExcept
 from utils.dataloaders import exif_transpose, letterbox
 from utils.general import (
     LOGGER,
+    CONFIG_DIR,
     ROOT,
     Profile,
     check_requirements,
@@ -54,7 +60,7 @@ from utils.general import (
     xyxy2xywh,
     yaml_load,
 )
-from utils.torch_utils import copy_attr, smart_inference_mode
+from utils.torch_utils import copy_attr, cpu_bf16_supported, smart_inference_mode
 
 
 def autopad(k, p=None, d=1):
@@ -459,8 +465,38 @@ class Concat(nn.Module):
 class DetectMultiBackend(nn.Module):
     """YOLOv5 MultiBackend class for inference on various backends including PyTorch, ONNX, TensorRT, and more."""
 
-    def __init__(self, weights="yolov5s.pt", device=torch.device("cpu"), dnn=False, data=None, fp16=False, fuse=True):
-        """Initializes DetectMultiBackend with support for various inference backends, including PyTorch and ONNX."""
+    ort_shapes = 8  # input shapes per thread to keep ONNX Runtime I/O bindings and output buffers for (LRU)
+
+    def __init__(
+        self,
+        weights="yolov5s.pt",
+        device=torch.device("cpu"),
+        dnn=False,
+        data=None,
+        fp16=False,
+        fuse=True,
+        compile_mode=False,
+        shapes=((1, 3, 640, 640),),
+        channels_last=False,
+        bf16=False,
+        ort_options=None,
+        ort_reuse_outputs=False,
+        ov_hint=None,
+        ov_requests=0,
+    ):
+        """Initializes DetectMultiBackend with support for various inference backends, including PyTorch and ONNX.
+
+        For *.pt weights `compile_mode` may be 'trace' (frozen TorchScript) or 'inductor' (torch.compile) to compile the
+        fused model for the input `shapes` at load; other shapes, augmented inference and compile failures run eagerly,
+        with the same outputs. `channels_last` stores the model and inputs NHWC for oneDNN convolutions, and `bf16` runs
+        CPU inference under bfloat16 autocast (eagerly, ignoring `compile_mode`) on CPUs that support it. `ort_options`
+        sets ONNX Runtime SessionOptions attributes, i.e. {"graph_optimization_level": "ORT_ENABLE_ALL",
+        "intra_op_num_threads": 4, "enable_cpu_mem_arena": False}. ONNX Runtime outputs go to buffers preallocated per
+        input shape and thread; forward() returns copies of them unless `ort_reuse_outputs`, for callers that are done
+        with each result before the next call with the same shape on that thread. OpenVINO models compile with the
+        `ov_hint` performance hint ('LATENCY' or 'THROUGHPUT') and serve submit() from a pool of `ov_requests` infer
+        requests (0 for the device's optimum), created on the first submit().
+        """
         #   PyTorch:              weights = *.pt
         #   TorchScript:                    *.torchscript
         #   ONNX Runtime:                   *.onnx
@@ -479,18 +515,34 @@ class DetectMultiBackend(nn.Module):
         w = str(weights[0] if isinstance(weights, list) else weights)
         pt, jit, onnx, xml, engine, coreml, saved_model, pb, tflite, edgetpu, tfjs, paddle, triton = self._model_type(w)
         fp16 &= pt or jit or onnx or engine or triton  # FP16
+        channels_last &= pt  # NHWC memory format
+        bf16 &= pt and not fp16 and device.type == "cpu"  # CPU bfloat16 autocast
+        if bf16 and not cpu_bf16_supported():
+            LOGGER.warning("WARNING ⚠️ bf16 requires a CPU with AVX512 or AMX, using FP32")
+            bf16 = False
         nhwc = coreml or saved_model or pb or tflite or edgetpu  # BHWC formats (vs torch BCWH)
         stride = 32  # default stride
+        nms = False  # model outputs final detections, i.e. ONNX exported with --nms
+        bundle = []  # [((h, w), DetectMultiBackend)] static-shape models from export.py --bundle, smallest first
         cuda = torch.cuda.is_available() and device.type != "cpu"  # use CUDA
         if not (pt or triton):
             w = attempt_download(w)  # download if not local
 
         if pt:  # PyTorch
-            model = attempt_load(weights if isinstance(weights, list) else w, device=device, inplace=True, fuse=fuse)
+            model = attempt_load(
+                weights if isinstance(weights, list) else w,
+                device=device,
+                inplace=True,
+                fuse=fuse,
+                channels_last=channels_last,
+            )
             stride = max(int(model.stride.max()), 32)  # model stride
             names = model.module.names if hasattr(model, "module") else model.names  # get class names
             model.half() if fp16 else model.float()
             self.model = model  # explicitly assign for to(), cpu(), cuda(), half()
+            compiled = {}
+            if compile_mode and not bf16:
+                compiled = self._compile(model, w, compile_mode, shapes, device, channels_last)
         elif jit:  # TorchScript
             LOGGER.info(f"Loading {w} for TorchScript inference...")
             extra_files = {"config.txt": ""}  # model metadata
@@ -512,8 +564,15 @@ class DetectMultiBackend(nn.Module):
             import onnxruntime
 
             providers = ["CUDAExecutionProvider", "CPUExecutionProvider"] if cuda else ["CPUExecutionProvider"]
-            session = onnxruntime.InferenceSession(w, providers=providers)
+            session_options = onnxruntime.SessionOptions()
+            for k, v in (ort_options or {}).items():
+                if k == "graph_optimization_level" and isinstance(v, str):
+                    v = getattr(onnxruntime.GraphOptimizationLevel, v)  # i.e. "ORT_ENABLE_ALL"
+                setattr(session_options, k, v)
+            session = onnxruntime.InferenceSession(w, sess_options=session_options, providers=providers)
             output_names = [x.name for x in session.get_outputs()]
+            nms = {"num_dets", "boxes", "scores", "classes"} <= set(output_names)
+            io_bindings = threading.local()  # per-thread LRU {input shape: (IOBinding, preallocated torch outputs)}
             meta = session.get_modelmeta().custom_metadata_map  # metadata
             if "stride" in meta:
                 stride, names = int(meta["stride"]), eval(meta["names"])
@@ -531,8 +590,19 @@ class DetectMultiBackend(nn.Module):
             batch_dim = get_batch(ov_model)
             if batch_dim.is_static:
                 batch_size = batch_dim.get_length()
-            ov_compiled_model = core.compile_model(ov_model, device_name="AUTO")  # AUTO selects best available device
+            config = {"PERFORMANCE_HINT": ov_hint} if ov_hint else {}  # i.e. THROUGHPUT for many parallel requests
+            ov_compiled_model = core.compile_model(ov_model, device_name="AUTO", config=config)  # AUTO selects device
+            ov_queue, ov_lock = None, threading.Lock()  # pool of infer requests, created by the first submit()
             stride, names = self._load_metadata(Path(w).with_suffix(".yaml"))  # load metadata
+        elif (Path(w) / "manifest.yaml").is_file():  # static-shape model bundle, *_bundle/
+            LOGGER.info(f"Loading {w} bundle for shape-dispatched inference...")
+            d = yaml_load(Path(w) / "manifest.yaml")
+            stride, names, batch_size = d["stride"], d["names"], d["batch_size"]
+            kwargs = dict(ort_options=ort_options, ort_reuse_outputs=ort_reuse_outputs, ov_hint=ov_hint)
+            kwargs["ov_requests"] = ov_requests
+            for m in sorted(d["models"], key=lambda m: m["imgsz"][0] * m["imgsz"][1]):
+                bundle.append((tuple(m["imgsz"]), DetectMultiBackend(Path(w) / m["file"], device, fp16=fp16, **kwargs)))
+            nms = all(m.nms for _, m in bundle)
         elif engine:  # TensorRT
             LOGGER.info(f"Loading {w} for TensorRT inference...")
             import tensorrt as trt  # https://developer.nvidia.com/nvidia-tensorrt-download
@@ -690,14 +760,22 @@ class DetectMultiBackend(nn.Module):
 
     def forward(self, im, augment=False, visualize=False):
         """Performs YOLOv5 inference on input images with options for augmentation and visualization."""
+        if self.bundle:
+            return self._bundle_run(im)
         b, ch, h, w = im.shape  # batch, channel, height, width
         if self.fp16 and im.dtype != torch.float16:
             im = im.half()  # to FP16
         if self.nhwc:
             im = im.permute(0, 2, 3, 1)  # torch BCHW to numpy BHWC shape(1,320,192,3)
+        if self.channels_last:
+            im = im.contiguous(memory_format=torch.channels_last)  # no-op for NHWC inputs, i.e. from AutoShape
 
         if self.pt:  # PyTorch
-            y = self.model(im, augment=augment, visualize=visualize) if augment or visualize else self.model(im)
+            if augment or visualize or self.bf16:
+                with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.bf16):
+                    y = self.model(im, augment=augment, visualize=visualize)
+            else:
+                y = self.compiled.get((tuple(im.shape), im.dtype), self.model)(im)
         elif self.jit:  # TorchScript
             y = self.model(im)
         elif self.dnn:  # ONNX OpenCV DNN
@@ -705,8 +783,13 @@ class DetectMultiBackend(nn.Module):
             self.net.setInput(im)
             y = self.net.forward()
         elif self.onnx:  # ONNX Runtime
-            im = im.cpu().numpy()  # torch to numpy
-            y = self.session.run(self.output_names, {self.session.get_inputs()[0].name: im})
+            y = self._onnx_run(im)
+            if self.nms:  # padded (num_dets, boxes, scores, classes) to per-image (n, 6) like non_max_suppression()
+                y = dict(zip(self.output_names, y))
+                return [
+                    torch.cat((y["boxes"][i, :n], y["scores"][i, :n, None], y["classes"][i, :n, None].float()), 1)
+                    for i, n in enumerate(y["num_dets"].flatten().tolist())
+                ]
         elif self.xml:  # OpenVINO
             im = im.cpu().numpy()  # FP32
             y = list(self.ov_compiled_model(im).values())
@@ -772,17 +855,198 @@ class DetectMultiBackend(nn.Module):
         else:
             return self.from_numpy(y)
 
+    def submit(self, im, callback=None):
+        """
+        Starts inference on `im` and returns a concurrent.futures.Future of the output, calling `callback(output)` when
+        it is ready.
+
+        OpenVINO models run on the AsyncInferQueue request pool, so several submissions overlap with each other and
+        with the caller's work, i.e. preprocessing the next frame; submit() only blocks while every request is busy.
+        Other backends run synchronously and return a completed future.
+        """
+        future = Future()
+        if callback:
+            future.add_done_callback(lambda f: f.exception() or callback(f.result()))
+        if self.xml:
+            with self.ov_lock:
+                if self.ov_queue is None:  # models only used through forward() never allocate the requests
+                    from openvino.runtime import AsyncInferQueue
+
+                    self.ov_queue = AsyncInferQueue(self.ov_compiled_model, self.ov_requests)
+                    self.ov_queue.set_callback(self._ov_done)
+                    LOGGER.info(f"OpenVINO {self.ov_hint or 'default'} hint, {len(self.ov_queue)} infer requests")
+            self.ov_queue.start_async({0: im.cpu().numpy()}, future)
+        else:
+            try:
+                future.set_result(self.forward(im))
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    def _ov_done(self, request, future):
+        """AsyncInferQueue callback, resolves `future` with a copy of the request's outputs as requests are reused."""
+        try:
+            y = [self.from_numpy(x.data.copy()) for x in request.output_tensors]
+            future.set_result(y[0] if len(y) == 1 else y)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _bundle_run(self, im):
+        """
+        Runs `im` on the smallest bundle model whose static (h, w) fits it, padding the bottom-right edges so box
+        coordinates are unchanged. Inputs larger than every model are downscaled into the largest one and their boxes
+        scaled back; batches larger than a batch-1 bundle run image by image.
+        """
+        b, _, h, w = im.shape
+        if b > 1 and self.batch_size == 1:
+            # clone each image's output, member models may return the same reused buffers on every call
+            if self.nms:
+                return [d.clone() for x in im.split(1) for d in self._bundle_run(x)]
+            return torch.cat([self._bundle_run(x).clone() for x in im.split(1)])
+        (mh, mw), m = next(((s, m) for s, m in self.bundle if s[0] >= h and s[1] >= w), self.bundle[-1])
+        gain = min(mh / h, mw / w, 1.0)
+        if gain < 1:
+            im = F.interpolate(im, size=(int(h * gain), int(w * gain)), mode="bilinear", align_corners=False)
+        im = F.pad(im, (0, mw - im.shape[3], 0, mh - im.shape[2]), value=114 / 255)  # letterbox grey
+        y = m(im)
+        if gain < 1:  # out of place, `y` may be the member model's output buffer
+            y = [torch.cat((x[..., :4] / gain, x[..., 4:]), -1) for x in (y if self.nms else [y])]
+            y = y if self.nms else y[0]
+        return y
+
+    def _onnx_run(self, im):
+        """
+        Runs ONNX Runtime with I/O binding, binding the input to `im`'s memory and outputs to torch tensors that are
+        preallocated per input shape and thread, so a call neither copies the input nor allocates outputs. `im` is cast
+        to the model's input dtype first, as the binding reads its memory as that type.
+
+        The returned tensors are overwritten by the next call with the same input shape on the same thread, so they are
+        copied unless `ort_reuse_outputs`. Only the `ort_shapes` most recently used shapes keep their binding and
+        buffers, so varying input sizes don't grow memory without bound.
+        """
+        dtypes = {
+            "tensor(float)": (torch.float32, np.float32),
+            "tensor(float16)": (torch.float16, np.float16),
+            "tensor(int64)": (torch.int64, np.int64),  # NMS num_dets and classes
+        }
+        cuda = "CUDAExecutionProvider" in self.session.get_providers()
+        x = self.session.get_inputs()[0]
+        im = (im if cuda else im.cpu()).to(dtypes[x.type][0]).contiguous()
+        device, index, shape = im.device.type, im.device.index or 0, tuple(im.shape)
+        bound = self.io_bindings.__dict__.setdefault("shapes", OrderedDict())  # LRU, per thread so no lock
+        io, y = bound.pop(shape, None) or (self.session.io_binding(), None)
+        io.bind_input(x.name, device, index, dtypes[x.type][1], shape, im.data_ptr())
+        if y is None:  # first call with this shape, let ORT allocate once to learn the output shapes
+            for name in self.output_names:
+                io.bind_output(name, device, index)
+            self.session.run_with_iobinding(io)
+            shapes = [o.shape() for o in io.get_outputs()]
+            io.clear_binding_outputs()
+            y = []
+            for name, o, s in zip(self.output_names, self.session.get_outputs(), shapes):
+                y.append(torch.empty(s, dtype=dtypes[o.type][0], device=im.device))
+                io.bind_output(name, device, index, dtypes[o.type][1], s, y[-1].data_ptr())
+        bound[shape] = io, y  # most recently used last
+        while len(bound) > self.ort_shapes:
+            bound.popitem(last=False)
+        self.session.run_with_iobinding(io)
+        return y if self.ort_reuse_outputs else [x.clone() for x in y]
+
     def from_numpy(self, x):
         """Converts a NumPy array to a torch tensor, maintaining device compatibility."""
         return torch.from_numpy(x).to(self.device) if isinstance(x, np.ndarray) else x
 
-    def warmup(self, imgsz=(1, 3, 640, 640)):
-        """Performs a single inference warmup to initialize model weights, accepting an `imgsz` tuple for image size."""
-        warmup_types = self.pt, self.jit, self.onnx, self.engine, self.saved_model, self.pb, self.triton
-        if any(warmup_types) and (self.device.type != "cpu" or self.triton):
-            im = torch.empty(*imgsz, dtype=torch.half if self.fp16 else torch.float, device=self.device)  # input
-            for _ in range(2 if self.jit else 1):  #
-                self.forward(im)  # warmup
+    def warmup(self, imgsz=(1, 3, 640, 640), shapes=None, augment=False, n=None):
+        """
+        Runs `n` inferences at each input shape in `shapes` (default just `imgsz`) on the calling thread, CPU included,
+        so one-time costs (CUDA context, oneDNN primitive creation, allocator growth, lazy initialization, the thread's
+        OpenMP team) are paid before the first real input. `n` defaults to 2 for TorchScript and compiled models, which
+        optimize on the second call, else 1. Bundles dispatch each shape to its member model as forward() does, and
+        without `shapes` warm up every member at its own static shape. Returns {shape: [seconds per inference]}.
+        """
+        warmup_types = self.pt, self.jit, self.onnx, self.xml, self.engine, self.saved_model, self.pb, self.triton
+        times = {}
+        if not (any(warmup_types) or self.bundle):
+            return times
+        if self.bundle and not shapes:
+            shapes = [(self.batch_size, 3, *s) for s, _ in self.bundle]
+        n = n or (2 if self.jit or (self.pt and self.compiled) else 1)
+        for shape in shapes or (imgsz,):
+            im = torch.zeros(*shape, dtype=torch.half if self.fp16 else torch.float, device=self.device)  # input
+            times[tuple(shape)] = []
+            for _ in range(n):
+                t = time.perf_counter()
+                with torch.no_grad():
+                    self.forward(im, augment=augment)  # warmup
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                times[tuple(shape)].append(time.perf_counter() - t)
+        return times
+
+    def compile_shapes(self, mode, shapes):
+        """Compiles the PyTorch model for input `shapes` with `mode` ('trace' or 'inductor'), replacing any previously
+        compiled shapes; call it after reconfiguring the Detect heads, which traced models capture."""
+        assert self.pt, "compile_shapes() requires *.pt weights"
+        self.compiled = {}
+        if mode and not self.bf16:
+            self.compiled = self._compile(self.model, self.w, mode, shapes, self.device, self.channels_last)
+        return self.compiled
+
+    @staticmethod
+    def _compile(model, w, mode, shapes, device, channels_last=False):
+        """
+        Compiles a PyTorch `model` for fixed input `shapes`, returning a {(shape, dtype): compiled model} table.
+
+        'trace' runs torch.jit.trace() and torch.jit.freeze(), caching the result in the user config dir keyed by
+        weights hash, torch version, shape, dtype, device and Detect outputs so later loads skip tracing. Both modes
+        keep the Detect heads as configured, so a compiled shape returns the same structure as the eager model.
+        'inductor' uses torch.compile(dynamic=False), which keeps its own kernel cache; it guards on the Detect grids,
+        so it suits a single serving shape and recompiles when shapes alternate. A failing shape logs a warning and
+        stays on the eager model.
+        """
+        from models.yolo import Detect  # scoped to avoid circular import
+
+        assert mode in {"trace", "inductor"}, f"Invalid compile mode {mode}, valid values are 'trace' and 'inductor'"
+        if isinstance(model, nn.ModuleList):  # Ensemble
+            LOGGER.warning("WARNING ⚠️ compile is not supported for ensembles, using eager PyTorch")
+            return {}
+        dtype = next(model.parameters()).dtype
+        raw = any(m.raw and not m.export for m in model.modules() if isinstance(m, Detect))  # (pred, x) outputs
+        compiled = {}
+        if mode == "trace":
+            key = hashlib.sha256(Path(w).read_bytes()).hexdigest()[:16]  # weights hash
+            cache = CONFIG_DIR / "compiled"
+            cache.mkdir(parents=True, exist_ok=True)
+        else:
+            inductor = torch.compile(model, dynamic=False)  # recompiles once per shape
+        for shape in shapes:
+            shape = tuple(shape)
+            im = torch.zeros(shape, dtype=dtype, device=device)
+            if channels_last:
+                im = im.contiguous(memory_format=torch.channels_last)
+            try:
+                if mode == "trace":
+                    f = cache / (
+                        f"{Path(w).stem}_{key}_torch{torch.__version__}_{'x'.join(map(str, shape))}_"
+                        f"{str(dtype).split('.')[-1]}_{device.type}{'_nhwc' * channels_last}{'_raw' * raw}.torchscript"
+                    )
+                    if f.exists():
+                        m = torch.jit.load(str(f), map_location=device)
+                    else:
+                        t = time.perf_counter()
+                        with torch.no_grad():
+                            model(im)  # dry run, builds the Detect grids for this shape
+                            m = torch.jit.freeze(torch.jit.trace(model, im, strict=False))
+                        torch.jit.save(m, str(f))
+                        LOGGER.info(f"Traced {shape} in {time.perf_counter() - t:.1f}s, saved as {f}")
+                else:
+                    m = inductor
+                with torch.no_grad():
+                    m(im)  # compile / optimize for this shape
+                compiled[(shape, dtype)] = m
+            except Exception as e:
+                LOGGER.warning(f"WARNING ⚠️ {mode} compile failed for {shape}, using eager PyTorch: {e}")
+        return compiled
 
     @staticmethod
     def _model_type(p="path/to/model.pt"):
@@ -900,7 +1164,9 @@ class AutoShape(nn.Module):
                 ims[i] = im if im.data.contiguous else np.ascontiguousarray(im)  # update
             shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
             x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
-            x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
+            x = np.array(x).transpose((0, 3, 1, 2))  # stack and BHWC to BCHW
+            if not (self.dmb and self.model.channels_last):
+                x = np.ascontiguousarray(x)  # NCHW, else keep the stacked NHWC memory as a channels_last tensor
             x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
 
         with amp.autocast(autocast):
@@ -910,15 +1176,16 @@ class AutoShape(nn.Module):
 
             # Post-process
             with dt[2]:
-                y = non_max_suppression(
-                    y if self.dmb else y[0],
-                    self.conf,
-                    self.iou,
-                    self.classes,
-                    self.agnostic,
-                    self.multi_label,
-                    max_det=self.max_det,
-                )  # NMS
+                if not (self.dmb and self.model.nms):  # else NMS ran inside the model
+                    y = non_max_suppression(
+                        y if self.dmb else y[0],
+                        self.conf,
+                        self.iou,
+                        self.classes,
+                        self.agnostic,
+                        self.multi_label,
+                        max_det=self.max_det,
+                    )  # NMS
                 for i in range(n):
                     scale_boxes(shape1, y[i][:, :4], shape0[i])
 
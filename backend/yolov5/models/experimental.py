@@ -85,11 +85,12 @@ class Ensemble(nn.ModuleList):
         return y, None  # inference, train output
 
 
-def attempt_load(weights, device=None, inplace=True, fuse=True):
+def attempt_load(weights, device=None, inplace=True, fuse=True, channels_last=False):
     """
     Loads and fuses an ensemble or single YOLOv5 model from weights, handling device placement and model adjustments.
 
-    Example inputs: weights=[a,b,c] or a single model weights=[a] or weights=a.
+    Example inputs: weights=[a,b,c] or a single model weights=[a] or weights=a. With `channels_last=True` conv weights
+    are stored NHWC, which oneDNN convolutions prefer on CPU when inputs are channels_last too.
     """
     from models.yolo import Detect, Model
 
@@ -116,6 +117,8 @@ def attempt_load(weights, device=None, inplace=True, fuse=True):
                 setattr(m, "anchor_grid", [torch.zeros(1)] * m.nl)
         elif t is nn.Upsample and not hasattr(m, "recompute_scale_factor"):
             m.recompute_scale_factor = None  # torch 1.11.0 compatibility
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
 
     # Return model
     if len(model) == 1:
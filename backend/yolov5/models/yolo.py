@@ -4,6 +4,7 @@ YOLO-specific modules.
 
 Usage:
     $ python models/yolo.py --cfg yolov5s.yaml
+    $ python models/yolo.py --weights best.pt --device cpu --line-profile --json layers.json --trace layers.trace.json
 """
 
 import argparse
@@ -12,6 +13,8 @@ import math
 import os
 import platform
 import sys
+import threading
+from collections import OrderedDict
 from copy import deepcopy
 from pathlib import Path
 
@@ -54,19 +57,16 @@ from utils.autoanchor import check_anchor_order
 from utils.general import LOGGER, check_version, check_yaml, colorstr, make_divisible, print_args
 from utils.plots import feature_visualization
 from utils.torch_utils import (
+    LayerProfiler,
     fuse_conv_and_bn,
     initialize_weights,
     model_info,
     profile,
     scale_img,
     select_device,
-    time_sync,
 )
 
-try:
-    import thop  # for FLOPs computation
-except ImportError:
-    thop = None
+_DECODE_LOCK = threading.Lock()  # guards Detect decode constant caches, module level so models stay picklable
 
 
 class Detect(nn.Module):
@@ -75,6 +75,8 @@ class Detect(nn.Module):
     stride = None  # strides computed during build
     dynamic = False  # force grid reconstruction
     export = False  # export mode
+    decode_cache = 0  # per-layer shapes to keep precomputed decode constants for (LRU), 0 to use the reference decode
+    raw = True  # also return the raw per-layer outputs at inference
 
     def __init__(self, nc=80, anchors=(), ch=(), inplace=True):
         """Initializes YOLOv5 detection layer with specified classes, anchors, channels, and inplace operations."""
@@ -91,6 +93,8 @@ class Detect(nn.Module):
 
     def forward(self, x):
         """Processes input through YOLOv5 layers, altering shape for detection: `x(bs, 3, ny, nx, 85)`."""
+        if self.decode_cache and not (self.training or self.export or self.dynamic or isinstance(self, Segment)):
+            return self._forward_cached(x)
         z = []  # inference output
         for i in range(self.nl):
             x[i] = self.m[i](x[i])  # conv
@@ -115,6 +119,59 @@ class Detect(nn.Module):
 
         return x if self.training else (torch.cat(z, 1),) if self.export else (torch.cat(z, 1), x)
 
+    def _forward_cached(self, x):
+        """
+        Inference decode with precomputed per-shape constants, writing every layer into one output tensor.
+
+        Decoding is a polynomial of the sigmoid `s` of each output: xy = 2s * stride + grid * stride, wh = 4s^2 *
+        anchor_grid and conf = s. The constants `a`, `b`, `c` of `c + s * (a + s * b)` are cached per (layer, ny, nx,
+        dtype, device), so each layer costs one permuted copy into its slice of the output, an in-place sigmoid and two
+        fused multiply-adds, instead of the reference's contiguous copy, split, grid arithmetic and two concatenations.
+        Results match the reference decode. The raw `x` list is only returned when `raw` is set. Decoding runs in the
+        model dtype, so under bf16 autocast pixel coordinates keep full precision.
+        """
+        shapes = [(xi.shape[2], xi.shape[3]) for xi in x]
+        bs = x[0].shape[0]
+        z = x[0].new_empty(bs, sum(self.na * ny * nx for ny, nx in shapes), self.no, dtype=self.anchors.dtype)  # output
+        k = 0  # row offset of layer i in z
+        for i, (ny, nx) in enumerate(shapes):
+            x[i] = self.m[i](x[i])  # conv
+            a, b, c = self._decode_constants(i, ny, nx, z.dtype, z.device)
+            n = self.na * ny * nx
+            y = z[:, k : k + n].view(bs, self.na, ny, nx, self.no)
+            y.copy_(x[i].view(bs, self.na, self.no, ny, nx).permute(0, 1, 3, 4, 2)).sigmoid_()  # contiguous sigmoid
+            torch.addcmul(c, y, torch.addcmul(a, y, b), out=y)
+            if self.raw:
+                x[i] = x[i].view(bs, self.na, self.no, ny, nx).permute(0, 1, 3, 4, 2).contiguous()
+            k += n
+        return (z, x) if self.raw else (z,)
+
+    def _decode_constants(self, i, ny, nx, dtype, device):
+        """Returns the cached (a, b, c) decode constants of layer `i` at grid size (ny, nx), building them if needed."""
+        caches = self.__dict__.get("_decode_constants_cache")  # not pickled with older models
+        if caches is None or len(caches) != self.nl:
+            caches = self.__dict__.setdefault("_decode_constants_cache", [OrderedDict() for _ in range(self.nl)])
+        cache = caches[i]  # one LRU per layer, so `decode_cache` counts shapes rather than (layer, shape) pairs
+        key = ny, nx, dtype, device
+        with _DECODE_LOCK:  # concurrent inference threads share the model
+            constants = cache.get(key)
+            if constants is not None:
+                cache.move_to_end(key)
+                return constants
+        grid, anchor_grid = self._make_grid(nx, ny, i)
+        a = torch.ones(self.no, device=device)
+        a[:2], a[2:4] = 2 * self.stride[i], 0  # xy = 2s * stride + ..., conf = s
+        b = torch.zeros(1, self.na, 1, 1, self.no, device=device)
+        b[..., 2:4] = 4 * anchor_grid[:, :, :1, :1]  # wh = 4s^2 * anchor_grid
+        c = torch.zeros(1, self.na, ny, nx, self.no, device=device)
+        c[..., :2] = grid * self.stride[i]  # ... + grid * stride
+        constants = a.to(dtype), b.to(dtype), c.to(dtype)
+        with _DECODE_LOCK:
+            cache[key] = constants
+            while len(cache) > self.decode_cache:
+                cache.popitem(last=False)
+        return constants
+
     def _make_grid(self, nx=20, ny=20, i=0, torch_1_10=check_version(torch.__version__, "1.10.0")):
         """Generates a mesh grid for anchor boxes with optional compatibility for torch versions < 1.10."""
         d = self.anchors[i].device
@@ -160,32 +217,18 @@ class BaseModel(nn.Module):
 
     def _forward_once(self, x, profile=False, visualize=False):
         """Performs a forward pass on the YOLOv5 model, enabling profiling and feature visualization options."""
-        y, dt = [], []  # outputs
+        if profile:  # per-layer time, GFLOPs, params and outputs recorded by forward hooks
+            LayerProfiler(self).run(x).print()
+        y = []  # outputs
         for m in self.model:
             if m.f != -1:  # if not from previous layer
                 x = y[m.f] if isinstance(m.f, int) else [x if j == -1 else y[j] for j in m.f]  # from earlier layers
-            if profile:
-                self._profile_one_layer(m, x, dt)
             x = m(x)  # run
             y.append(x if m.i in self.save else None)  # save output
             if visualize:
                 feature_visualization(x, m.type, m.i, save_dir=visualize)
         return x
 
-    def _profile_one_layer(self, m, x, dt):
-        """Profiles a single layer's performance by computing GFLOPs, execution time, and parameters."""
-        c = m == self.model[-1]  # is final layer, copy input as inplace fix
-        o = thop.profile(m, inputs=(x.copy() if c else x,), verbose=False)[0] / 1e9 * 2 if thop else 0  # FLOPs
-        t = time_sync()
-        for _ in range(10):
-            m(x.copy() if c else x)
-        dt.append((time_sync() - t) * 100)
-        if m == self.model[0]:
-            LOGGER.info(f"{'time (ms)':>10s} {'GFLOPs':>10s} {'params':>10s}  module")
-        LOGGER.info(f"{dt[-1]:10.2f} {o:10.2f} {m.np:10.0f}  {m.type}")
-        if c:
-            LOGGER.info(f"{sum(dt):10.2f} {'-':>10s} {'-':>10s}  Total")
-
     def fuse(self):
         """Fuses Conv2d() and BatchNorm2d() layers in the model to improve inference speed."""
         LOGGER.info("Fusing layers... ")
@@ -218,6 +261,8 @@ class BaseModel(nn.Module):
 class DetectionModel(BaseModel):
     """YOLOv5 detection model class for object detection tasks, supporting custom configurations and anchors."""
 
+    tta_batch = False  # run augmented inference views as one batched forward pass
+
     def __init__(self, cfg="yolov5s.yaml", ch=3, nc=None, anchors=None):
         """Initializes YOLOv5 model with configuration file, input channels, number of classes, and custom anchors."""
         super().__init__()
@@ -270,16 +315,32 @@ class DetectionModel(BaseModel):
         return self._forward_once(x, profile, visualize)  # single-scale inference, train
 
     def _forward_augment(self, x):
-        """Performs augmented inference across different scales and flips, returning combined detections."""
+        """Performs augmented inference across different scales and flips, returning combined detections.
+
+        With `tta_batch=True` the scaled views are padded to the input shape and run as a single batch of `3 * bs`
+        images instead of three sequential forward passes. Predictions whose de-scaled centres fall outside the input,
+        i.e. in the grey padding, get zero objectness so that NMS drops them.
+        """
         img_size = x.shape[-2:]  # height, width
         s = [1, 0.83, 0.67]  # scales
         f = [None, 3, None]  # flips (2-ud, 3-lr)
+        gs = int(self.stride.max())  # grid size (max stride)
+        if self.tta_batch:
+            xb = torch.cat([scale_img(x.flip(fi) if fi else x, si, same_shape=True, gs=gs) for si, fi in zip(s, f)])
+            yb = self._forward_once(xb)[0].chunk(len(s))  # single forward, split back per view
         y = []  # outputs
-        for si, fi in zip(s, f):
-            xi = scale_img(x.flip(fi) if fi else x, si, gs=int(self.stride.max()))
-            yi = self._forward_once(xi)[0]  # forward
+        for k, (si, fi) in enumerate(zip(s, f)):
+            if self.tta_batch:
+                yi = yb[k]
+            else:
+                xi = scale_img(x.flip(fi) if fi else x, si, gs=gs)
+                yi = self._forward_once(xi)[0]  # forward
             # cv2.imwrite(f'img_{si}.jpg', 255 * xi[0].cpu().numpy().transpose((1, 2, 0))[:, :, ::-1])  # save
             yi = self._descale_pred(yi, fi, si, img_size)
+            if self.tta_batch and si != 1:
+                xy = yi[..., :2]
+                outside = (xy < 0).any(-1) | (xy[..., 0] >= img_size[1]) | (xy[..., 1] >= img_size[0])
+                yi = torch.cat((yi[..., :4], yi[..., 4:5].masked_fill(outside[..., None], 0), yi[..., 5:]), -1)
             y.append(yi)
         y = self._clip_augmented(y)  # clip augmented tails
         return torch.cat(y, 1), None  # augmented inference, train
@@ -463,10 +524,14 @@ def parse_model(d, ch):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--cfg", type=str, default="yolov5s.yaml", help="model.yaml")
+    parser.add_argument("--weights", type=str, default="", help="model.pt path, overrides --cfg")
+    parser.add_argument("--imgsz", "--img", "--img-size", type=int, default=640, help="inference size (pixels)")
     parser.add_argument("--batch-size", type=int, default=1, help="total batch size for all GPUs")
     parser.add_argument("--device", default="", help="cuda device, i.e. 0 or 0,1,2,3 or cpu")
     parser.add_argument("--profile", action="store_true", help="profile model speed")
     parser.add_argument("--line-profile", action="store_true", help="profile model speed layer by layer")
+    parser.add_argument("--json", type=str, default="", help="save --line-profile results to JSON file")
+    parser.add_argument("--trace", type=str, default="", help="save --line-profile Chrome trace to JSON file")
     parser.add_argument("--test", action="store_true", help="test all yolo*.yaml")
     opt = parser.parse_args()
     opt.cfg = check_yaml(opt.cfg)  # check YAML
@@ -474,12 +539,22 @@ if __name__ == "__main__":
     device = select_device(opt.device)
 
     # Create model
-    im = torch.rand(opt.batch_size, 3, 640, 640).to(device)
-    model = Model(opt.cfg).to(device)
+    im = torch.rand(opt.batch_size, 3, opt.imgsz, opt.imgsz).to(device)
+    if opt.weights:
+        from models.experimental import attempt_load
+
+        model = attempt_load(opt.weights, device=device, fuse=False)
+    else:
+        model = Model(opt.cfg).to(device)
 
     # Options
     if opt.line_profile:  # profile layer by layer
-        model(im, profile=True)
+        p = LayerProfiler(model).run(im)
+        p.print()
+        if opt.json:
+            p.to_json(opt.json)
+        if opt.trace:
+            p.to_chrome_trace(opt.trace)
 
     elif opt.profile:  # profile forward-backward
         results = profile(input=im, ops=[model], n=3)
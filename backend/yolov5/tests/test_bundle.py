@@ -0,0 +1,47 @@
+"""Checks that batched calls on an export.py --bundle model match per-image calls."""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+pytest.importorskip("onnxruntime")
+
+import export  # noqa: E402
+from models.common import DetectMultiBackend  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+    """Exports a randomly initialized 4-class YOLOv5n to a batch-1 320 ONNX bundle and returns its directory."""
+    torch.manual_seed(0)
+    w = tmp_path_factory.mktemp("bundle") / "yolov5n.pt"
+    model = Model(ROOT / "models/yolov5n.yaml", nc=4).eval()
+    model.names = {i: str(i) for i in range(4)}
+    torch.save({"model": model}, w)
+    export.run(weights=w, include=("onnx",), bundle=(320,), imgsz=(320, 320), device="cpu")
+    return w.parent / f"{w.stem}_bundle"
+
+
+def test_bundle_batch_matches_per_image(bundle):
+    """Each image of a batch larger than the bundle's batch size gets its own predictions, not the last image's."""
+    model = DetectMultiBackend(bundle)
+    im = torch.rand(3, 3, 320, 320, generator=torch.Generator().manual_seed(0))
+    batched = model(im)
+    for i in range(len(im)):
+        torch.testing.assert_close(batched[i : i + 1], model(im[i : i + 1]))
+
+
+def test_bundle_downscale_leaves_model_output(bundle):
+    """Rescaling boxes of inputs larger than the bundle doesn't modify the member model's output in place."""
+    model = DetectMultiBackend(bundle)
+    im = torch.rand(1, 3, 640, 640, generator=torch.Generator().manual_seed(1))
+    y = model(im)
+    small = torch.nn.functional.interpolate(im, size=(320, 320), mode="bilinear", align_corners=False)
+    torch.testing.assert_close(y[..., :4], model.bundle[0][1](small)[..., :4] * 2)
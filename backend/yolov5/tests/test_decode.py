@@ -0,0 +1,60 @@
+"""Checks the cached Detect decode against the reference decode."""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Returns a randomly initialized 4-class YOLOv5n in eval mode."""
+    torch.manual_seed(0)
+    return Model(ROOT / "models/yolov5n.yaml", nc=4).eval()
+
+
+def test_decode_cache_matches_reference(model):
+    """The cached decode returns the reference predictions."""
+    detect = model.model[-1]
+    im = torch.rand(2, 3, 320, 256, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        detect.decode_cache = 0
+        reference = model(im)[0]
+        detect.decode_cache, detect.raw = 4, False
+        torch.testing.assert_close(model(im)[0], reference)
+
+
+def test_decode_cache_limit_is_per_layer(model):
+    """`decode_cache` shapes are kept for every layer, and concurrent calls neither fail nor overgrow the caches."""
+    detect = model.model[-1]
+    detect.decode_cache, detect.raw = 3, False
+    sizes = (64, 96, 128, 160, 192)
+    errors = []
+
+    def run(k):
+        try:
+            with torch.no_grad():
+                for j in range(20):
+                    model(torch.rand(1, 3, sizes[(j + k) % len(sizes)], 64))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    with torch.no_grad():
+        model(torch.rand(1, 3, 224, 64))
+    caches = detect._decode_constants_cache
+    assert [len(c) for c in caches] == [3] * detect.nl
+    assert all(next(reversed(c))[:2] == (224 // s, 64 // s) for c, s in zip(caches, detect.stride.int().tolist()))
@@ -0,0 +1,24 @@
+"""Checks the API's prediction hot path for steady-state memory growth, like backend/memory_check.py does in CI."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parents[2]
+if str(BACKEND) not in sys.path:
+    sys.path.append(str(BACKEND))
+
+if not (BACKEND / "app/model/apple_leaf_yolov5.pt").exists():
+    pytest.skip("apple_leaf_yolov5.pt weights not found", allow_module_level=True)
+
+import memory_check  # noqa: E402
+
+
+def test_prediction_memory_growth():
+    """A short run of predictions at a small size stays under the memory_check.py growth threshold."""
+    r = memory_check.run(n=40, imgsz=320, max_growth_mb=8.0)
+    g = r["growth"]
+    assert g["samples"] >= 20
+    assert not g["leak_suspect"], g
+    assert g["rss_mb"]["last"] - g["rss_mb"]["first"] <= 8.0
@@ -0,0 +1,67 @@
+"""Checks batched_non_max_suppression() against the reference non_max_suppression()."""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from utils.general import batched_non_max_suppression, non_max_suppression  # noqa: E402
+
+
+def predictions(bs=3, n=3000, nc=4, seed=0):
+    """Returns (bs, n, 5 + nc) synthetic model outputs with overlapping boxes around a few objects and tie-free
+    scores."""
+    g = torch.Generator().manual_seed(seed)
+    p = torch.empty(bs, n, 5 + nc)
+    centers = torch.rand(bs, 8, 2, generator=g) * 560 + 40
+    p[..., :2] = centers[:, torch.randint(8, (n,), generator=g)] + torch.randn(bs, n, 2, generator=g) * 12
+    p[..., 2:4] = torch.rand(bs, n, 2, generator=g) * 80 + 20
+    p[..., 4:] = torch.rand(bs, n, 1 + nc, generator=g) ** 2  # mostly low scores, like a real model
+    return p
+
+
+def assert_same(batched, reference):
+    """Asserts per-image detections are equal, compared in confidence order."""
+    assert len(batched) == len(reference)
+    for a, b in zip(batched, reference):
+        assert a.shape == b.shape
+        torch.testing.assert_close(a[a[:, 4].argsort(descending=True)], b[b[:, 4].argsort(descending=True)])
+
+
+@pytest.mark.parametrize("conf_thres", [0.25, 0.001])
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"classes": [0, 2]}, {"agnostic": True}, {"multi_label": True}, {"max_det": 20}],
+    ids=["default", "classes", "agnostic", "multi_label", "max_det"],
+)
+def test_batched_nms_matches_reference(conf_thres, kwargs):
+    """Batched NMS keeps the same detections as the per-image reference."""
+    p = predictions()
+    reference = non_max_suppression(p, conf_thres, **kwargs)
+    assert_same(batched_non_max_suppression(p, conf_thres, **kwargs), reference)
+    assert_same(batched_non_max_suppression(p, conf_thres, per_image=False, **kwargs), reference)  # single call
+
+
+@pytest.mark.parametrize("conf_thres", [0.25, 0.001])
+def test_batched_nms_labels_match_reference(conf_thres):
+    """Apriori labels (autolabelling in val.py --save-hybrid) are merged like the reference, images without any
+    included."""
+    p = predictions()
+    labels = [torch.tensor([[1, 100.0, 100.0, 50.0, 60.0], [3, 300.0, 200.0, 40.0, 40.0]]), torch.zeros((0, 5))]
+    labels.append(torch.tensor([[0, 500.0, 500.0, 80.0, 30.0]]))
+    assert_same(
+        batched_non_max_suppression(p, conf_thres, labels=labels), non_max_suppression(p, conf_thres, labels=labels)
+    )
+
+
+def test_batched_nms_leaves_input_unmodified():
+    """The model output is not modified in place."""
+    p = predictions()
+    q = p.clone()
+    batched_non_max_suppression(p, 0.001)
+    torch.testing.assert_close(p, q)
@@ -0,0 +1,40 @@
+"""Checks the per-thread ONNX Runtime I/O binding cache of DetectMultiBackend."""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+pytest.importorskip("onnxruntime")
+
+import export  # noqa: E402
+from models.common import DetectMultiBackend  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """Exports a randomly initialized 4-class YOLOv5n to a dynamic-shape ONNX model and loads it."""
+    torch.manual_seed(0)
+    w = tmp_path_factory.mktemp("bindings") / "yolov5n.pt"
+    m = Model(ROOT / "models/yolov5n.yaml", nc=4).eval()
+    m.names = {i: str(i) for i in range(4)}
+    torch.save({"model": m}, w)
+    export.run(weights=w, include=("onnx",), imgsz=(320, 320), device="cpu", dynamic=True)
+    return DetectMultiBackend(w.with_suffix(".onnx"))
+
+
+def test_onnx_bindings_are_lru(model):
+    """Only the `ort_shapes` most recently used input shapes keep a binding, and evicted shapes still run correctly."""
+    model.ort_shapes = 2
+    sizes = (128, 160, 192, 128)
+    y = {s: model(torch.rand(1, 3, s, s, generator=torch.Generator().manual_seed(s))) for s in sizes}
+    assert list(model.io_bindings.shapes) == [(1, 3, 192, 192), (1, 3, 128, 128)]
+    im = torch.rand(1, 3, 160, 160, generator=torch.Generator().manual_seed(160))  # evicted, binds again
+    torch.testing.assert_close(model(im), y[160])
+    assert list(model.io_bindings.shapes) == [(1, 3, 128, 128), (1, 3, 160, 160)]
@@ -0,0 +1,40 @@
+"""Checks that an export.py --nms ONNX model suppresses each image of a batch independently."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+ort = pytest.importorskip("onnxruntime")
+
+import export  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def session(tmp_path_factory):
+    """Exports a randomly initialized 4-class YOLOv5n with dynamic batch and NMS, returning an ONNX Runtime session."""
+    torch.manual_seed(0)
+    w = tmp_path_factory.mktemp("nms") / "yolov5n.pt"
+    model = Model(ROOT / "models/yolov5n.yaml", nc=4).eval()
+    model.names = {i: str(i) for i in range(4)}
+    torch.save({"model": model}, w)
+    export.run(weights=w, include=("onnx",), imgsz=(320, 320), device="cpu", dynamic=True, nms=True, conf_thres=0.001)
+    return ort.InferenceSession(str(w.with_suffix(".onnx")), providers=["CPUExecutionProvider"])
+
+
+def test_onnx_nms_batch_matches_per_image(session):
+    """Detections of an image don't depend on the other images of its batch."""
+    im = np.random.default_rng(0).random((3, 3, 320, 320), dtype=np.float32)
+    batched = session.run(None, {"images": im})
+    assert batched[0].min() > 0
+    for i in range(len(im)):
+        single = session.run(None, {"images": im[i : i + 1]})
+        for a, b in zip(batched, single):
+            np.testing.assert_allclose(a[i : i + 1], b, atol=1e-4)
@@ -0,0 +1,55 @@
+"""Checks that the API's QualityController downgrades under load and recovers once load drops."""
+
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[2]
+if str(BACKEND) not in sys.path:
+    sys.path.append(str(BACKEND))
+
+from app.model.quality import QualityController  # noqa: E402
+
+
+class Clock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+
+def observe(controller, mode, seconds):
+    """Records one run at `mode` taking `seconds`."""
+    controller.latency[mode] = seconds
+    controller.updated[mode] = controller.clock()
+
+
+def test_quality_recovers_after_slow_run():
+    """One over-budget "accurate" run downgrades requests until the idle probe re-measures it."""
+    clock = Clock()
+    q = QualityController(budgets={"fast": None, "accurate": 2.0}, available=("fast", "accurate"), clock=clock)
+    observe(q, "accurate", 2.1)  # cold start
+    with q.run("accurate") as mode:
+        assert mode == "fast"  # just measured, over budget
+    clock.t += q.probe_interval
+    with q.run("accurate") as mode:
+        assert mode == "accurate"  # idle and stale: probe
+    assert q.latency["accurate"] < 2.0  # the probe replaced the stale average
+    for _ in range(3):
+        with q.run("accurate") as mode:
+            assert mode == "accurate"
+
+
+def test_quality_downgrades_under_load():
+    """Busy requests are downgraded when queued load pushes the estimate over budget, and never probe."""
+    clock = Clock()
+    q = QualityController(budgets={"fast": None, "accurate": 2.0}, available=("fast", "accurate"), clock=clock)
+    observe(q, "accurate", 0.8)
+    with q.run("accurate", queued=1) as mode:
+        assert mode == "accurate"  # 0.8 * 2 fits
+    observe(q, "accurate", 0.8)
+    clock.t += 10 * q.probe_interval
+    with q.run("accurate", queued=2) as mode:
+        assert mode == "fast"  # 0.8 * 3 doesn't, and it isn't idle
@@ -0,0 +1,47 @@
+"""Checks batched test-time augmentation (DetectionModel.tta_batch) against the sequential views."""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    """Returns the sequential and batched augmented predictions of a randomly initialized 4-class YOLOv5n."""
+    torch.manual_seed(0)
+    model = Model(ROOT / "models/yolov5n.yaml", nc=4).eval()
+    im = torch.rand(2, 3, 320, 256, generator=torch.Generator().manual_seed(0))
+    y = {}
+    with torch.no_grad():
+        for tta_batch in (False, True):
+            model.tta_batch = tta_batch
+            y[tta_batch] = model(im, augment=True)[0]
+    return y
+
+
+def test_tta_batch_drops_padding(outputs):
+    """No prediction of the batched views is centred in the grey padding, i.e. outside the 320x256 input."""
+    y = outputs[True]
+    x, c = y[..., :2], y[..., 4] > 0
+    assert not (c & ((x < 0).any(-1) | (x[..., 0] >= 256) | (x[..., 1] >= 320))).any()
+
+
+@pytest.mark.parametrize("margin", [32, 96])
+def test_tta_batch_matches_sequential(outputs, margin):
+    """Away from the image borders, where the padding differs, batched and sequential TTA predict the same boxes."""
+    for a, b in zip(outputs[False], outputs[True]):
+        kept = []
+        for y in (a, b):
+            x = y[:, :2]
+            y = y[(y[:, 4] > 0) & (x >= margin).all(1) & (x[:, 0] < 256 - margin) & (x[:, 1] < 320 - margin)]
+            kept.append(y[y[:, 4].argsort()])
+        assert len(kept[0]) > 100
+        torch.testing.assert_close(kept[0], kept[1])
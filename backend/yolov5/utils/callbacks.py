@@ -2,6 +2,9 @@
 """Callback utils."""
 
 import threading
+import time
+
+import torch
 
 
 class Callbacks:
@@ -15,6 +18,7 @@ class Callbacks:
             "on_train_start": [],
             "on_train_epoch_start": [],
             "on_train_batch_start": [],
+            "on_train_phase_end": [],  # train.py step phases: data, forward, loss, backward, optimizer, ema
             "optimizer_step": [],
             "on_before_zero_grad": [],
             "on_train_batch_end": [],
@@ -70,3 +74,64 @@ class Callbacks:
                 threading.Thread(target=logger["callback"], args=args, kwargs=kwargs, daemon=True).start()
             else:
                 logger["callback"](*args, **kwargs)
+
+
+class StepProfiler:
+    """
+    Breaks each training step down into phases: dataloader wait and batch preparation ("data"), forward, ComputeLoss,
+    backward, optimizer step, ModelEMA.update and logging, plus the dataloader starvation ratio (share of step time
+    spent in "data") and images per second. Phase boundaries come from the train.py "on_train_phase_end" hook, and
+    logging ends with "on_train_batch_end". results() returns the epoch means as KEYS columns for results.csv.
+    """
+
+    PHASES = ("data", "forward", "loss", "backward", "optimizer", "ema", "log")
+    KEYS = [f"time/{k}_ms" for k in PHASES] + ["time/starvation", "time/img_s"]
+
+    def __init__(self, device=None, logger=None):
+        """Initializes the profiler; CUDA devices are synchronized at each boundary so phases get their own GPU time."""
+        self.cuda = device is not None and torch.device(device).type == "cuda"
+        self.logger = logger
+        self.reset()
+
+    def register(self, callbacks):
+        """Registers the profiler's actions with a Callbacks instance."""
+        for hook in "on_train_epoch_start", "on_train_phase_end", "on_train_batch_end", "on_train_epoch_end":
+            callbacks.register_action(hook, name="step_profiler", callback=getattr(self, hook))
+
+    def reset(self):
+        """Clears the phase totals and restarts the clock."""
+        self.dt = dict.fromkeys(self.PHASES, 0.0)
+        self.steps = self.images = 0
+        self.t = time.perf_counter()
+
+    def on_train_epoch_start(self):
+        """Starts an epoch; the first "data" phase includes starting the dataloader workers."""
+        self.reset()
+
+    def on_train_phase_end(self, phase):
+        """Attributes the time since the previous boundary to `phase`."""
+        if self.cuda:
+            torch.cuda.synchronize()
+        t = time.perf_counter()
+        self.dt[phase] += t - self.t
+        self.t = t
+
+    def on_train_batch_end(self, model, ni, imgs, targets, paths, vals):
+        """Ends the step with its "log" phase (mean losses, progress bar and the other batch-end callbacks)."""
+        self.on_train_phase_end("log")
+        self.steps += 1
+        self.images += imgs.shape[0]
+
+    def results(self):
+        """Returns mean milliseconds per step for each phase, the starvation ratio and images/s for the epoch."""
+        total = sum(self.dt.values())
+        n = max(self.steps, 1)
+        total = total or 1
+        return [self.dt[k] / n * 1e3 for k in self.PHASES] + [self.dt["data"] / total, self.images / total]
+
+    def on_train_epoch_end(self, epoch):
+        """Logs the epoch's step breakdown."""
+        if self.logger and self.steps:
+            *ms, starvation, ips = self.results()
+            s = ", ".join(f"{k} {v:.1f}" for k, v in zip(self.PHASES, ms))
+            self.logger.info(f"Step {sum(ms):.1f}ms: {s}; dataloader starvation {starvation:.1%}, {ips:.1f} img/s")
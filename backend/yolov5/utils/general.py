@@ -2,8 +2,11 @@
 """General utils."""
 
 import contextlib
+import contextvars
+import ctypes
 import glob
 import inspect
+import json
 import logging
 import logging.config
 import math
@@ -14,8 +17,11 @@ import re
 import signal
 import subprocess
 import sys
+import threading
 import time
+import tracemalloc
 import urllib
+from collections import deque
 from copy import deepcopy
 from datetime import datetime
 from itertools import repeat
@@ -186,30 +192,404 @@ def user_config_dir(dir="Ultralytics", env_var="YOLOV5_CONFIG_DIR"):
 CONFIG_DIR = user_config_dir()  # Ultralytics settings dir
 
 
+def rss_mb():
+    """Returns the current resident set size of this process in MB."""
+    statm = Path("/proc/self/statm")
+    if statm.exists():  # Linux, cheap enough to read per stage
+        return int(statm.read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    import psutil
+
+    return psutil.Process().memory_info().rss / (1 << 20)
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB."""
+    status = Path("/proc/self/status")
+    if status.exists():  # Linux, VmHWM unlike ru_maxrss is not inherited from the parent across fork + exec
+        return int(next(x for x in status.read_text().splitlines() if x.startswith("VmHWM:")).split()[1]) / 1024
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / (1 << 20)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20)  # bytes on macOS
+
+
+class _Mallinfo2(ctypes.Structure):
+    """glibc struct mallinfo2 (glibc>=2.33)."""
+
+    _fields_ = [
+        (k, ctypes.c_size_t)
+        for k in "arena ordblks smblks hblks hblkhd usmblks fsmblks uordblks fordblks keepcost".split()
+    ]
+
+
+def heap_mb():
+    """Returns the glibc malloc heap in use in MB, which holds torch CPU tensors and other native buffers, or None
+    where mallinfo2() is unavailable (non-glibc platforms, glibc<2.33)."""
+    global _mallinfo2
+    if _mallinfo2 is None:
+        try:
+            _mallinfo2 = ctypes.CDLL(None).mallinfo2
+            _mallinfo2.restype = _Mallinfo2
+        except (AttributeError, OSError, TypeError):
+            _mallinfo2 = False
+    if not _mallinfo2:
+        return None
+    m = _mallinfo2()
+    return (m.uordblks + m.hblkhd) / (1 << 20)  # allocated arena chunks + mmapped chunks
+
+
+_mallinfo2 = None
+
+
+class MemoryTracker:
+    """
+    Process memory tracker for CPU inference and training.
+
+    While enabled, every named Profile span records how much RSS it added (per stage), and sample() records RSS, the
+    native malloc heap and, with `trace`, Python allocations from tracemalloc (per batch or request). growth() fits the
+    steady-state samples after a warmup fraction, when allocator caches and lazy initialization have settled, so a
+    positive slope over many steps flags a leak suspect. With `trace` the allocation sites that grew most between the
+    start of steady state and stop() are reported too. Only the last `max_samples` samples are kept, so a long-running
+    server tracks memory in bounded memory and growth() fits its most recent window.
+
+    Usage:
+        from utils.general import MEMORY
+        MEMORY.start()
+        for batch in loader:
+            ...
+            MEMORY.sample(i)
+        MEMORY.stop()
+        MEMORY.print()
+        assert not MEMORY.growth()["leak_suspect"]
+    """
+
+    def __init__(self, warmup=0.25, tolerance_mb=8.0, min_samples=10, max_samples=4096):
+        """Initializes a stopped tracker keeping the last `max_samples` samples; growth beyond `tolerance_mb` over at
+        least `min_samples` steady-state samples after the `warmup` fraction is a leak suspect."""
+        self.enabled = False
+        self.warmup = warmup
+        self.tolerance_mb = tolerance_mb
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.trace = False
+        self.steps = None
+        self.reset()
+
+    def reset(self):
+        """Clears samples, stage statistics and tracemalloc snapshots."""
+        self.samples = deque(maxlen=self.max_samples)  # most recent samples
+        self.count = 0  # samples taken since start, including those dropped from the window
+        self.stages = {}  # span path -> [count, total RSS delta MB, max RSS delta MB, max RSS MB]
+        self.snapshot = None  # tracemalloc snapshot at the start of steady state
+        self.top = []  # allocation sites that grew most during steady state
+        self.t0 = time.perf_counter()
+
+    def start(self, trace=False, steps=None):
+        """Clears previous results and starts tracking, with tracemalloc if `trace`; `steps` is the number of samples
+        to expect if known, so the tracemalloc baseline is taken after the warmup fraction instead of the first one."""
+        self.reset()
+        self.steps = steps
+        self.trace = trace and not tracemalloc.is_tracing()  # only stop what we started
+        if self.trace:
+            tracemalloc.start()
+        self.enabled = True
+        self._sample("start", marker=True)
+
+    def stop(self):
+        """Takes a last sample and stops tracking."""
+        self._sample("stop", marker=True)
+        self.enabled = False
+        if self.trace:
+            if self.snapshot is not None:
+                snapshot = tracemalloc.take_snapshot()
+                lines, first = inspect.getsourcelines(self._sample)  # the samples list grows by design
+                own = [tracemalloc.Filter(False, __file__, i) for i in range(first, first + len(lines))]
+                own.append(tracemalloc.Filter(False, tracemalloc.__file__))
+                stats = snapshot.filter_traces(own).compare_to(self.snapshot.filter_traces(own), "lineno")
+                self.top = [
+                    {"site": str(s.traceback), "growth_kb": round(s.size_diff / 1024, 1), "count": s.count_diff}
+                    for s in stats[:10]
+                    if s.size_diff > 0
+                ]
+            tracemalloc.stop()
+            self.trace = False
+
+    def sample(self, label=""):
+        """Records current RSS, peak RSS, native heap and traced Python memory in MB under `label`."""
+        if self.enabled:
+            self._sample(label)
+
+    def _sample(self, label, marker=False):
+        """Records a sample; start/stop `marker` samples are reported but left out of the steady-state fit."""
+        py, py_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        heap = heap_mb()
+        with self.lock:
+            step = self.count
+            self.count += 1
+        row = {
+            "step": step,
+            "label": str(label),
+            "time_s": round(time.perf_counter() - self.t0, 3),
+            "rss_mb": round(rss_mb(), 2),
+            "peak_rss_mb": round(peak_rss_mb(), 2),
+            "heap_mb": None if heap is None else round(heap, 2),
+            "py_mb": None if py is None else round(py / (1 << 20), 2),
+            "py_peak_mb": None if py_peak is None else round(py_peak / (1 << 20), 2),
+            "marker": marker,
+        }
+        with self.lock:
+            self.samples.append(row)
+        if self.trace and not marker and self.snapshot is None and row["step"] > self.warmup * (self.steps or 0):
+            self.snapshot = tracemalloc.take_snapshot()  # steady-state baseline
+
+    def stage(self, path, rss0, rss1):
+        """Records that span `path` went from `rss0` to `rss1` MB."""
+        d = rss1 - rss0
+        with self.lock:
+            s = self.stages.get(path)
+            if s is None:
+                s = self.stages[path] = [0, 0.0, d, rss1]
+            s[0] += 1
+            s[1] += d
+            s[2] = max(s[2], d)
+            s[3] = max(s[3], rss1)
+
+    def growth(self, tolerance_mb=None):
+        """Returns steady-state growth: first/last RSS, growth and least-squares slope per step for RSS, heap and
+        traced Python memory, and `leak_suspect` when RSS or heap grew more than `tolerance_mb` with a positive
+        slope over at least `min_samples` samples."""
+        tolerance_mb = self.tolerance_mb if tolerance_mb is None else tolerance_mb
+        with self.lock:
+            first = self.warmup * self.count  # warmup is a fraction of all steps, not of the kept window
+            steady = [s for s in self.samples if not s["marker"] and s["step"] >= first]
+            count = self.count
+        g = {"samples": len(steady), "steps": count, "tolerance_mb": tolerance_mb, "leak_suspect": False}
+        for k in ("rss_mb", "heap_mb", "py_mb"):
+            v = [s[k] for s in steady if s[k] is not None]
+            if len(v) < 2:
+                continue
+            slope = float(np.polyfit(np.arange(len(v)), v, 1)[0])
+            g[k] = {"first": v[0], "last": v[-1], "growth": round(v[-1] - v[0], 2), "slope_per_step": round(slope, 4)}
+            if k != "py_mb" and len(v) >= self.min_samples and v[-1] - v[0] > tolerance_mb and slope > 0:
+                g["leak_suspect"] = True
+        return g
+
+    def results(self):
+        """Returns samples, per-stage RSS deltas, peak RSS, steady-state growth and top growing allocation sites."""
+        with self.lock:
+            stages = {k: list(v) for k, v in self.stages.items()}
+            samples = list(self.samples)
+        return {
+            "peak_rss_mb": round(peak_rss_mb(), 2),
+            "growth": self.growth(),
+            "stages": [
+                {
+                    "stage": k,
+                    "count": s[0],
+                    "rss_delta_mb": round(s[1], 3),
+                    "mean_rss_delta_mb": round(s[1] / s[0], 4),
+                    "max_rss_delta_mb": round(s[2], 3),
+                    "max_rss_mb": round(s[3], 2),
+                }
+                for k, s in sorted(stages.items())
+            ],
+            "samples": samples,
+            "top_growth": self.top,
+        }
+
+    def print(self):
+        """Logs per-stage RSS deltas, peak RSS and steady-state growth; returns the results."""
+        r = self.results()
+        LOGGER.info(f"{'stage':<40s}{'count':>8s}{'RSS +MB':>10s}{'mean':>10s}{'max':>10s}{'max RSS':>10s}")
+        for s in r["stages"]:
+            LOGGER.info(
+                f"{s['stage']:<40s}{s['count']:>8d}{s['rss_delta_mb']:10.2f}{s['mean_rss_delta_mb']:10.3f}"
+                f"{s['max_rss_delta_mb']:10.2f}{s['max_rss_mb']:10.1f}"
+            )
+        g = r["growth"]
+        s = ", ".join(f"{k[:-3]} {v['first']:.1f}->{v['last']:.1f}MB" for k, v in g.items() if isinstance(v, dict))
+        LOGGER.info(f"Memory: peak RSS {r['peak_rss_mb']:.1f}MB, steady state over {g['samples']} samples: {s}")
+        if g["leak_suspect"]:
+            LOGGER.warning(f"WARNING ⚠️ memory grew more than {g['tolerance_mb']}MB in steady state, possible leak")
+        for t in r["top_growth"][:5]:
+            LOGGER.info(f"  +{t['growth_kb']:.1f}KB ({t['count']:+d} blocks) {t['site']}")
+        return r
+
+    def save(self, file):
+        """Saves the results to JSON `file`."""
+        Path(file).write_text(json.dumps(self.results(), indent=2))
+
+
+MEMORY = MemoryTracker()  # process-wide memory tracker, enabled by --memory (detect.py, val.py) or MEMORY=1 (API)
+
+
+class Spans:
+    """
+    Thread- and asyncio-safe aggregate of named Profile spans across a run.
+
+    Each span path ("parent/child" for nested spans) keeps a count, total, min, max and a log2 histogram of its
+    durations in nanoseconds, from which percentiles are estimated. Recording is off until `enabled` is set, so
+    instrumented code costs one attribute check per span when profiling is not requested.
+
+    Usage:
+        from utils.general import SPANS, span
+        SPANS.enabled = True
+        with span("predict"), span("preprocess"):  # recorded as "predict/preprocess"
+            ...
+        SPANS.print()
+        SPANS.save("spans.json")
+    """
+
+    def __init__(self, enabled=False):
+        """Initializes an empty span aggregate, recording only once `enabled` is True."""
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stats = {}  # path -> [count, total ns, min ns, max ns, {log2 bucket: count}]
+
+    def add(self, path, ns):
+        """Records one `ns` nanosecond duration of span `path`."""
+        b = ns.bit_length()  # bucket b holds [2**(b-1), 2**b) ns
+        with self.lock:
+            s = self.stats.get(path)
+            if s is None:
+                s = self.stats[path] = [0, 0, ns, ns, {}]
+            s[0] += 1
+            s[1] += ns
+            s[2] = min(s[2], ns)
+            s[3] = max(s[3], ns)
+            s[4][b] = s[4].get(b, 0) + 1
+
+    def reset(self):
+        """Clears all recorded spans."""
+        with self.lock:
+            self.stats = {}
+
+    @staticmethod
+    def _percentile(s, q):
+        """Estimates the `q` percentile in ns of span stats `s` from its histogram, clipped to its min and max."""
+        n, k = 0, q / 100 * s[0]
+        for b, c in sorted(s[4].items()):
+            n += c
+            if n >= k:
+                return min(max(1.5 * 2 ** (b - 1) if b else 0, s[2]), s[3])  # bucket midpoint
+        return s[3]
+
+    def results(self):
+        """Returns one dict per span path in tree order with count, total/mean/min/max and p50/p90/p99 milliseconds,
+        share of the parent span's total time and the histogram as {bucket upper bound ms: count}."""
+        with self.lock:
+            stats = {k: [*v[:4], dict(v[4])] for k, v in self.stats.items()}
+        rows = []
+        for path, s in sorted(stats.items()):
+            parent = stats.get(path.rpartition("/")[0])
+            rows.append(
+                {
+                    "span": path,
+                    "depth": path.count("/"),
+                    "count": s[0],
+                    "total_ms": round(s[1] / 1e6, 3),
+                    "mean_ms": round(s[1] / s[0] / 1e6, 4),
+                    "min_ms": round(s[2] / 1e6, 4),
+                    "p50_ms": round(self._percentile(s, 50) / 1e6, 4),
+                    "p90_ms": round(self._percentile(s, 90) / 1e6, 4),
+                    "p99_ms": round(self._percentile(s, 99) / 1e6, 4),
+                    "max_ms": round(s[3] / 1e6, 4),
+                    "parent_%": round(100 * s[1] / parent[1], 1) if parent else None,
+                    "histogram": {f"{2**b / 1e6:.4g}": c for b, c in sorted(s[4].items())},
+                }
+            )
+        return rows
+
+    def print(self):
+        """Logs the span tree as a table and returns its rows."""
+        rows = self.results()
+        LOGGER.info(
+            f"{'span':<40s}{'count':>8s}{'total (ms)':>12s}{'mean':>10s}{'p50':>10s}{'p90':>10s}{'p99':>10s}"
+            f"{'max':>10s}{'parent %':>10s}"
+        )
+        for r in rows:
+            name = "  " * r["depth"] + r["span"].rpartition("/")[2]
+            share = "-" if r["parent_%"] is None else f"{r['parent_%']:.1f}"
+            LOGGER.info(
+                f"{name:<40s}{r['count']:>8d}{r['total_ms']:12.1f}{r['mean_ms']:10.2f}{r['p50_ms']:10.2f}"
+                f"{r['p90_ms']:10.2f}{r['p99_ms']:10.2f}{r['max_ms']:10.2f}{share:>10s}"
+            )
+        return rows
+
+    def save(self, file):
+        """Saves the span results with process metadata to JSON `file`."""
+        meta = {"date": datetime.now().isoformat(), "pid": os.getpid(), "torch": torch.__version__}
+        Path(file).write_text(json.dumps({"meta": meta, "spans": self.results()}, indent=2))
+
+
+SPANS = Spans()  # process-wide span aggregate, enabled by --spans (detect.py, val.py, train.py) or SPANS=1 (API)
+_SPAN_PATH = contextvars.ContextVar("span_path", default="")  # current span path, per thread and asyncio task
+
+
 class Profile(contextlib.ContextDecorator):
-    """Context manager and decorator for profiling code execution time, with optional CUDA synchronization."""
+    """
+    Context manager and decorator for profiling code execution time, with optional CUDA synchronization.
 
-    def __init__(self, t=0.0, device: torch.device = None):
-        """Initializes a profiling context for YOLOv5 with optional timing threshold and device specification."""
+    A Profile with a `name` is also a span: while SPANS is enabled each timed block is recorded under its path, nested
+    inside whichever named spans are open in the current thread or asyncio task, and while MEMORY is enabled so is the
+    RSS it added. Enter one instance from one thread at a time, or use span() for a fresh instance per block.
+    """
+
+    def __init__(self, t=0.0, device: torch.device = None, name=None):
+        """Initializes a profiling context for YOLOv5 with optional timing threshold, device and span name."""
         self.t = t
         self.device = device
         self.cuda = bool(device and str(device).startswith("cuda"))
+        self.name = name
+        self.path = None
+        self.rss = None
 
     def __enter__(self):
         """Initializes timing at the start of a profiling context block for performance measurement."""
-        self.start = self.time()
+        if self.name and (SPANS.enabled or MEMORY.enabled):
+            parent = _SPAN_PATH.get()
+            self.path = f"{parent}/{self.name}" if parent else self.name
+            self.token = _SPAN_PATH.set(self.path)
+            self.rss = rss_mb() if MEMORY.enabled else None
+        self.start = self.time_ns()
         return self
 
     def __exit__(self, type, value, traceback):
         """Concludes timing, updating duration for profiling upon exiting a context block."""
-        self.dt = self.time() - self.start  # delta-time
+        ns = self.time_ns() - self.start
+        self.dt = ns / 1e9  # delta-time
         self.t += self.dt  # accumulate dt
-
-    def time(self):
-        """Measures and returns the current time, synchronizing CUDA operations if `cuda` is True."""
+        if self.path:
+            _SPAN_PATH.reset(self.token)
+            if SPANS.enabled:
+                SPANS.add(self.path, ns)
+            if self.rss is not None and MEMORY.enabled:
+                MEMORY.stage(self.path, self.rss, rss_mb())
+            self.path = None
+
+    def time_ns(self):
+        """Returns monotonic time.perf_counter_ns(), synchronizing CUDA operations first if `cuda` is True."""
         if self.cuda:
             torch.cuda.synchronize(self.device)
-        return time.time()
+        return time.perf_counter_ns()
+
+    def time(self):
+        """Measures and returns the current time in seconds, synchronizing CUDA operations if `cuda` is True."""
+        return self.time_ns() / 1e9
+
+
+def span(name, device=None):
+    """Returns a Profile recording span `name` (no "/", it separates nesting levels) while SPANS or MEMORY is enabled,
+    else a shared no-op context manager.
+    """
+    return Profile(device=device, name=name) if SPANS.enabled or MEMORY.enabled else _NO_SPAN
+
+
+_NO_SPAN = contextlib.nullcontext()
 
 
 class Timeout(contextlib.ContextDecorator):
@@ -1120,6 +1500,126 @@ def non_max_suppression(
     return output
 
 
+def batched_non_max_suppression(
+    prediction,
+    conf_thres=0.25,
+    iou_thres=0.45,
+    classes=None,
+    agnostic=False,
+    multi_label=False,
+    labels=(),
+    max_det=300,
+    nm=0,  # number of masks
+    max_nms=30000,  # maximum number of boxes per image into torchvision.ops.nms()
+    per_image=None,  # one NMS call per image (default on CPU) instead of a single offset call (default on CUDA)
+):
+    """
+    Non-Maximum Suppression (NMS) over a whole batch without a per-image Python loop.
+
+    Candidates are selected on fused scores (obj_conf * cls_conf, computed out of place so the model output is never
+    modified) with a per-image topk() capped at `max_nms`, so only surviving rows are gathered and converted to xyxy.
+    On CUDA boxes are then offset by class and image index and suppressed with one NMS call; on CPU, where the NMS
+    kernel is quadratic in the number of boxes, it runs once per image on contiguous slices (`per_image` overrides the
+    choice; benchmarks.py --nms times both). Results match
+    non_max_suppression() up to the order of equal-confidence boxes: neither sort is stable, so among tied scores a
+    different box may be kept or cut by `max_nms` (real model output at conf 0.001 has many ties). There is no time
+    limit and merge-NMS is not supported. Lowering `max_nms` bounds the work per image at low `conf_thres`; the kept
+    detections are then those of the `max_nms` best candidates.
+
+    Returns:
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls]
+    """
+    # Checks
+    assert 0 <= conf_thres <= 1, f"Invalid Confidence threshold {conf_thres}, valid values are between 0.0 and 1.0"
+    assert 0 <= iou_thres <= 1, f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
+    if isinstance(prediction, (list, tuple)):  # YOLOv5 model in validation model, output = (inference_out, loss_out)
+        prediction = prediction[0]  # select only inference output
+
+    device = prediction.device
+    mps = "mps" in device.type  # Apple MPS
+    if mps:  # MPS not fully supported yet, convert tensors to CPU before NMS
+        prediction = prediction.cpu()
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - nm - 5  # number of classes
+
+    # Settings
+    max_wh = 7680  # (pixels) maximum box width and height
+    multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
+
+    mi = 5 + nc  # mask start index
+    output = [torch.zeros((0, 6 + nm), device=device)] * bs
+
+    # Cat apriori labels if autolabelling, as extra zero-padded rows per image
+    if labels and any(len(lb) for lb in labels):
+        v = torch.zeros((bs, max(len(lb) for lb in labels), nc + nm + 5), device=prediction.device)
+        for xi, lb in enumerate(labels):
+            v[xi, : len(lb), :4] = lb[:, 1:5]  # box
+            v[xi, : len(lb), 4] = 1.0  # conf
+            v[xi, range(len(lb)), lb[:, 0].long() + 5] = 1.0  # cls
+        prediction = torch.cat((prediction, v), 1)
+
+    # Fused scores of objectness candidates (b: image index, a: anchor index, j: class, conf: obj_conf * cls_conf)
+    obj, cls = prediction[..., 4], prediction[..., 5:mi]
+    b, a = (obj > conf_thres).nonzero(as_tuple=True)  # grouped by image
+    if multi_label:
+        s = cls[b, a] * obj[b, a, None]  # (n, nc) scores, computed out of place
+        i, j = (s > conf_thres).nonzero(as_tuple=True)
+        b, a, conf = b[i], a[i], s[i, j]
+    else:  # best class only, obj * max(cls) == max(obj * cls) as obj >= 0
+        conf, j = cls[b, a].max(1)
+        conf *= obj[b, a]
+        k = conf > conf_thres
+        b, a, j, conf = b[k], a[k], j[k], conf[k]
+
+    # Filter by class
+    if classes is not None:
+        k = (j[:, None] == torch.tensor(classes, device=j.device)).any(1)
+        b, a, j, conf = b[k], a[k], j[k], conf[k]
+
+    # Check shape
+    if not len(b):  # no boxes
+        return output
+
+    # Sort by confidence and remove excess boxes with a per-image topk() over a padded (bs, candidates) score matrix
+    n = torch.bincount(b, minlength=bs)  # candidates per image
+    o = n.cumsum(0) - n  # offset of each image
+    padded = torch.full((bs, int(n.max())), -1.0, device=conf.device)
+    padded[b, torch.arange(len(b), device=b.device) - o[b]] = conf
+    v, i = padded.topk(min(padded.shape[1], max_nms), 1)  # sorted by confidence
+    i = (i + o[:, None])[v >= 0]  # drop padding, grouped by image
+    b, a, j, conf, n = b[i], a[i], j[i], conf[i], n.clamp(max=max_nms)
+
+    # Detections matrix nx6 (xyxy, conf, cls), built from surviving rows only
+    mask = prediction[b, a, mi:] * obj[b, a, None]  # zero columns if no masks (scaled by obj like the reference)
+    x = torch.cat((xywh2xyxy(prediction[b, a, :4]), conf[:, None], j[:, None].float(), mask), 1)
+
+    # Batched NMS
+    c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
+    boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
+    if per_image is None:
+        per_image = not boxes.is_cuda
+    if not per_image:  # single NMS call for the whole batch
+        boxes = boxes.double()  # float64 so the image offsets below are exact
+        boxes += b[:, None] * (boxes.max() - boxes.min() + 1)  # offset by image
+        i = torchvision.ops.nms(boxes, scores.double(), iou_thres)  # NMS, sorted by decreasing confidence
+        i = i[b[i].argsort(stable=True)]  # group by image
+    else:  # the CPU kernel is quadratic in the number of boxes, so one call per image slice is faster from bs 8
+        i = torch.cat(
+            [
+                torchvision.ops.nms(boxes[s : s + k], scores[s : s + k], iou_thres) + s
+                for s, k in zip((n.cumsum(0) - n).tolist(), n.tolist())
+            ]
+        )
+    n = torch.bincount(b[i], minlength=bs)  # detections per image
+    rank = torch.arange(len(i), device=i.device) - (n.cumsum(0) - n)[b[i]]
+    i = i[rank < max_det]  # limit detections
+    for xi, xo in enumerate(x[i].split(n.clamp(max=max_det).tolist())):
+        if len(xo):
+            output[xi] = xo.to(device) if mps else xo
+
+    return output
+
+
 def strip_optimizer(f="best.pt", s=""):
     """
     Strips optimizer and optionally saves checkpoint to finalize training; arguments are file path 'f' and save path
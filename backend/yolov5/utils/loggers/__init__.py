@@ -9,6 +9,7 @@ from pathlib import Path
 import pkg_resources as pkg
 import torch
 
+from utils.callbacks import StepProfiler
 from utils.general import LOGGER, colorstr, cv2
 from utils.loggers.clearml.clearml_utils import ClearmlLogger
 from utils.loggers.wandb.wandb_utils import WandbLogger
@@ -102,6 +103,8 @@ class Loggers:
             "x/lr1",
             "x/lr2",
         ]  # params
+        if getattr(opt, "profile_steps", False):
+            self.keys += StepProfiler.KEYS  # train.py --profile-steps phase times, starvation and img/s
         self.best_keys = ["best/epoch", "best/precision", "best/recall", "best/mAP_0.5", "best/mAP_0.5:0.95"]
         for k in LOGGERS:
             setattr(self, k, None)  # init empty logger dictionary
@@ -1,10 +1,14 @@
 # Ultralytics 🚀 AGPL-3.0 License - https://ultralytics.com/license
 """PyTorch utils."""
 
+import contextlib
+import json
 import math
 import os
 import platform
 import subprocess
+import sys
+import threading
 import time
 import warnings
 from contextlib import contextmanager
@@ -148,6 +152,11 @@ def select_device(device="", batch_size=0, newline=True):
     return torch.device(arg)
 
 
+def cpu_bf16_supported():
+    """Returns True if oneDNN can run bfloat16 convolutions on this CPU (AVX512 or AMX), i.e. CPU autocast pays off."""
+    return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+
+
 def time_sync():
     """Synchronizes PyTorch for accurate timing, leveraging CUDA if available, and returns the current time."""
     if torch.cuda.is_available():
@@ -208,6 +217,362 @@ def profile(input, ops, n=10, device=None):
     return results
 
 
+class LayerProfiler:
+    """
+    Hook-based per-layer profiler for YOLOv5 models.
+
+    Forward pre/post hooks on every layer of `model.model` record the wall time of each layer call with
+    time.perf_counter_ns(), without touching the forward loop. Per layer it also captures GFLOPs (thop, computed once
+    after profiling), parameters, output shapes and activation memory. Results are plain dicts that export to JSON and
+    to Chrome trace format (chrome://tracing or https://ui.perfetto.dev).
+
+    Usage:
+        from utils.torch_utils import LayerProfiler
+        p = LayerProfiler(model).run(torch.zeros(1, 3, 640, 640), n=10)  # DetectionModel, i.e. DetectMultiBackend.model
+        p.print()
+        p.to_json("layers.json")
+        p.to_chrome_trace("layers.trace.json")
+    """
+
+    def __init__(self, model, flops=True):
+        """Initializes the profiler for a YOLOv5 model (or any nn.Module, profiled by its direct children)."""
+        self.model = de_parallel(model)
+        layers = getattr(self.model, "model", None)
+        self.layers = list(layers if isinstance(layers, nn.Sequential) else self.model.children())
+        self.flops = flops and thop is not None
+        self.cuda = next(self.model.parameters()).is_cuda
+        self.handles = []
+        self.reset()
+
+    def reset(self):
+        """Clears recorded calls, layer outputs and forward timings."""
+        self.calls = []  # (layer index, start ns, end ns, thread id)
+        self.forwards = []  # (start ns, end ns) of each full forward pass
+        self.outputs = {}  # layer index -> (output shapes, activation bytes) of its first call
+        self.inputs = {}  # layer index -> input of its first call, for FLOPs
+        self.gflops = {}  # layer index -> GFLOPs, computed on first use
+        self._t0 = {}
+
+    def _sync(self):
+        """Waits for queued CUDA kernels so hook timestamps measure the layer, not the launch."""
+        if self.cuda:
+            torch.cuda.synchronize()
+
+    def _pre_hook(self, i):
+        """Returns a forward pre-hook that stamps the start of layer `i`."""
+
+        def hook(m, args):
+            if self.flops and i not in self.inputs:
+                x = args[0] if args else None
+                self.inputs[i] = x.copy() if isinstance(x, list) else x  # copy as Detect inplace fix
+            self._sync()
+            self._t0[i] = time.perf_counter_ns()
+
+        return hook
+
+    def _hook(self, i):
+        """Returns a forward hook that records the call and, once, the outputs of layer `i`."""
+
+        def hook(m, args, out):
+            self._sync()
+            self.calls.append((i, self._t0.pop(i), time.perf_counter_ns(), threading.get_ident()))
+            if i not in self.outputs:
+                self.outputs[i] = (_shapes(out), _nbytes(out))
+
+        return hook
+
+    def __enter__(self):
+        """Registers the hooks."""
+        for i, m in enumerate(self.layers):
+            self.handles += [m.register_forward_pre_hook(self._pre_hook(i)), m.register_forward_hook(self._hook(i))]
+        return self
+
+    def __exit__(self, *args):
+        """Removes the hooks."""
+        for h in self.handles:
+            h.remove()
+        self.handles = []
+
+    def run(self, im, n=10, warmup=1):
+        """Profiles `n` forward passes of `im` after `warmup` untimed ones; returns self."""
+        with torch.no_grad(), self:
+            for _ in range(warmup):
+                self.model(im)
+            self.reset()
+            for _ in range(n):
+                t0 = time.perf_counter_ns()
+                self.model(im)
+                self._sync()
+                self.forwards.append((t0, time.perf_counter_ns()))
+        self.input_shape = list(im.shape)
+        return self
+
+    def _gflops(self, i):
+        """Returns GFLOPs of one call of layer `i` on its recorded input, or None if unavailable."""
+        if i not in self.gflops:
+            x, self.gflops[i] = self.inputs.get(i), None
+            if x is not None:
+                with contextlib.suppress(Exception), torch.no_grad():
+                    self.gflops[i] = thop.profile(deepcopy(self.layers[i]), inputs=(x,), verbose=False)[0] / 1e9 * 2
+        return self.gflops[i]
+
+    def results(self):
+        """Returns one dict per layer: index, from, type, params, GFLOPs, calls, mean/min time, time share, output
+        shapes and activation MB."""
+        times = {}
+        for i, t0, t1, _ in self.calls:
+            times.setdefault(i, []).append((t1 - t0) / 1e6)
+        total = sum(sum(t) for t in times.values()) or 1
+        rows = []
+        for i, m in enumerate(self.layers):
+            t = times.get(i, [])
+            shapes, nbytes = self.outputs.get(i, (None, 0))
+            gflops = self._gflops(i) if self.flops else None
+            rows.append(
+                {
+                    "i": getattr(m, "i", i),
+                    "from": getattr(m, "f", None),
+                    "type": getattr(m, "type", type(m).__name__),
+                    "params": sum(p.numel() for p in m.parameters()),
+                    "gflops": None if gflops is None else round(gflops, 4),
+                    "calls": len(t),
+                    "time_ms": round(sum(t) / len(t), 4) if t else None,
+                    "time_min_ms": round(min(t), 4) if t else None,
+                    "time_%": round(100 * sum(t) / total, 2),
+                    "output_shapes": shapes,
+                    "activation_mb": round(nbytes / 1e6, 3),
+                }
+            )
+        return rows
+
+    def print(self):
+        """Logs the per-layer results as a table, slowest layers stand out in the time % column."""
+        rows = self.results()
+        LOGGER.info(
+            f"{'':>3}{'time (ms)':>10s}{'%':>7s}{'GFLOPs':>10s}{'params':>10s}{'act (MB)':>10s}  {'module':<40s}output"
+        )
+        for r in rows:
+            t, g = ("-" if v is None else f"{v:.2f}" for v in (r["time_ms"], r["gflops"]))
+            LOGGER.info(
+                f"{r['i']:>3}{t:>10s}{r['time_%']:7.1f}{g:>10s}{r['params']:10.0f}{r['activation_mb']:10.2f}  "
+                f"{r['type']:<40s}{r['output_shapes']}"
+            )
+        fwd = [(t1 - t0) / 1e6 for t0, t1 in self.forwards]
+        layers = sum(r["time_ms"] or 0 for r in rows)
+        gflops = sum(r["gflops"] or 0 for r in rows)
+        params = sum(r["params"] for r in rows)
+        LOGGER.info(f"{'':>3}{layers:10.2f}{100:7.1f}{gflops:10.2f}{params:10.0f}{'':>10s}  Total")
+        if fwd:
+            LOGGER.info(f"forward {sum(fwd) / len(fwd):.2f}ms mean, {min(fwd):.2f}ms min over {len(fwd)} runs")
+        return rows
+
+    def to_json(self, file=None):
+        """Returns the results with run metadata as a dict, optionally saved to JSON `file`."""
+        fwd = [(t1 - t0) / 1e6 for t0, t1 in self.forwards]
+        d = {
+            "meta": {
+                "model": type(self.model).__name__,
+                "input_shape": getattr(self, "input_shape", None),
+                "device": str(next(self.model.parameters()).device),
+                "threads": torch.get_num_threads(),
+                "torch": torch.__version__,
+                "runs": len(fwd),
+                "forward_ms": round(sum(fwd) / len(fwd), 4) if fwd else None,
+            },
+            "layers": self.results(),
+        }
+        if file:
+            Path(file).write_text(json.dumps(d, indent=2))
+        return d
+
+    def to_chrome_trace(self, file=None):
+        """Returns every recorded forward pass and layer call as Chrome trace events, optionally saved to `file`."""
+        t = min([t0 for t0, _ in self.forwards] + [t0 for _, t0, _, _ in self.calls], default=0)
+        pid, tid = os.getpid(), threading.get_ident()
+
+        def event(name, cat, t0, t1, tid, args):
+            """Returns a complete ("X") trace event, timestamps in microseconds since the first recorded call."""
+            ts, dur = (t0 - t) / 1e3, (t1 - t0) / 1e3
+            return {"name": name, "cat": cat, "ph": "X", "ts": ts, "dur": dur, "pid": pid, "tid": tid, "args": args}
+
+        events = [event("forward", "model", t0, t1, tid, {"run": k}) for k, (t0, t1) in enumerate(self.forwards)]
+        for i, t0, t1, thread in self.calls:
+            m = self.layers[i]
+            name = f"{getattr(m, 'i', i)} {getattr(m, 'type', type(m).__name__).split('.')[-1]}"
+            shapes, nbytes = self.outputs.get(i, (None, 0))
+            args = {"output_shapes": shapes, "activation_mb": round(nbytes / 1e6, 3)}
+            events.append(event(name, "layer", t0, t1, thread, args))
+        d = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if file:
+            Path(file).write_text(json.dumps(d))
+        return d
+
+
+def _shapes(x):
+    """Returns the shape of tensor `x`, or nested lists of shapes for lists/tuples of tensors."""
+    if isinstance(x, torch.Tensor):
+        return list(x.shape)
+    return [_shapes(xi) for xi in x] if isinstance(x, (list, tuple)) else None
+
+
+def _nbytes(x):
+    """Returns the total bytes of the tensors in `x`, including nested lists/tuples."""
+    if isinstance(x, torch.Tensor):
+        return x.numel() * x.element_size()
+    return sum(_nbytes(xi) for xi in x) if isinstance(x, (list, tuple)) else 0
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler for detect.py and val.py.
+
+    "stack" mode samples the Python stack of every thread each `interval` seconds from a background thread
+    (sys._current_frames(), no tracing hooks, so overhead stays low) and counts collapsed stacks. "ops" mode records
+    every torch operator with torch.profiler for an op-level summary. "all" does both. Profiling covers a window of
+    iterations (images or batches): it starts after `window[0]` calls to step() and stops after `window[1]` more, or
+    at stop() when that is 0.
+
+    save() writes to a run directory:
+        profile.collapsed: "thread;frame;frame count" lines for flamegraph.pl or https://www.speedscope.app.
+        profile_ops.txt: torch operators by self CPU time, overall and by input shape.
+        profile.json: mode, window, interval, sample count, duration, host, versions and the caller's settings.
+
+    Usage:
+        p = SamplingProfiler("all", window=(1, 20))  # skip 1 warmup image, profile the next 20
+        for im in images:
+            model(im)
+            p.step()
+        p.save(save_dir, weights="yolov5s.pt")
+    """
+
+    def __init__(self, mode="all", window=(1, 0), interval=0.005):
+        """Initializes the profiler, starting it right away when the window skips no iterations."""
+        assert mode in {"stack", "ops", "all"}, f"Invalid profile mode {mode}, valid values are 'stack', 'ops', 'all'"
+        self.mode, self.window, self.interval = mode, tuple(window), interval
+        self.stacks = {}  # collapsed stack -> samples
+        self.samples = self.steps = self.profiled = 0
+        self.duration = 0.0
+        self.ops = None  # torch.profiler.profile
+        self._thread, self._stop, self._t0 = None, threading.Event(), None
+        if not self.window[0]:
+            self.start()
+
+    @property
+    def active(self):
+        """Whether the profiler is currently recording."""
+        return self._t0 is not None
+
+    def start(self):
+        """Starts sampling stacks and/or recording torch operators."""
+        if self.active:
+            return
+        if self.mode in {"ops", "all"}:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.ops = torch.profiler.profile(activities=activities, record_shapes=True)
+            self.ops.__enter__()
+        if self.mode in {"stack", "all"}:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="SamplingProfiler", daemon=True)
+            self._thread.start()
+        self._t0 = time.perf_counter()
+
+    def stop(self):
+        """Stops recording; a no-op when not recording."""
+        if not self.active:
+            return
+        self.duration += time.perf_counter() - self._t0
+        self._t0 = None
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self.ops:
+            self.ops.__exit__(None, None, None)
+
+    def step(self):
+        """Ends one iteration (image or batch), starting and stopping the profiler at the window edges."""
+        self.steps += 1
+        self.profiled += self.active
+        skip, n = self.window
+        if self.steps == skip:
+            self.start()
+        elif n and self.steps == skip + n:
+            self.stop()
+
+    def _sample(self):
+        """Counts the collapsed stack of every other thread each `interval` seconds until stopped."""
+        names = {}
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join([names.get(ident, str(ident)), *reversed(stack)])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def top(self, n=10):
+        """Returns the `n` functions with the most self samples (leaf frames) as [(frame, share of samples)], leaving
+        out helper threads idling in threading.py waits (plot and tqdm threads)."""
+        leaves = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if "(threading.py:" in leaf and not stack.startswith("MainThread;"):
+                continue
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        total = sum(leaves.values()) or 1
+        return [(k, v / total) for k, v in sorted(leaves.items(), key=lambda x: -x[1])[:n]]
+
+    def save(self, save_dir, **settings):
+        """Stops the profiler and writes profile.collapsed, profile_ops.txt and profile.json to `save_dir`."""
+        self.stop()
+        save_dir = Path(save_dir)
+        files = []
+        if self.mode in {"stack", "all"}:
+            f = save_dir / "profile.collapsed"
+            f.write_text("".join(f"{k} {v}\n" for k, v in sorted(self.stacks.items())))
+            files.append(f)
+            s = "\n".join(f"{p:8.1%}  {k}" for k, p in self.top())
+            LOGGER.info(f"Top functions by self samples ({self.samples} samples over {self.duration:.1f}s):\n{s}")
+        if self.ops and self.profiled:
+            f = save_dir / "profile_ops.txt"
+            events = self.ops.key_averages()
+            by_shape = self.ops.key_averages(group_by_input_shape=True)
+            f.write_text(
+                f"{events.table(sort_by='self_cpu_time_total', row_limit=40)}\n"
+                f"By input shape:\n{by_shape.table(sort_by='self_cpu_time_total', row_limit=40)}\n"
+            )
+            files.append(f)
+        config = {
+            "mode": self.mode,
+            "window": list(self.window),
+            "interval_s": self.interval,
+            "iterations": self.profiled,
+            "samples": self.samples,
+            "duration_s": round(self.duration, 3),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "settings": settings,
+        }
+        f = save_dir / "profile.json"
+        f.write_text(json.dumps(config, indent=2, default=str))
+        files.append(f)
+        LOGGER.info(f"Profile of {self.profiled} iterations saved to {', '.join(str(x) for x in files)}")
+
+
 def is_parallel(model):
     """Checks if the model is using Data Parallelism (DP) or Distributed Data Parallelism (DDP)."""
     return type(model) in (nn.parallel.DataParallel, nn.parallel.DistributedDataParallel)
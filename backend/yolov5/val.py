@@ -41,6 +41,8 @@ from utils.callbacks import Callbacks
 from utils.dataloaders import create_dataloader
 from utils.general import (
     LOGGER,
+    MEMORY,
+    SPANS,
     TQDM_BAR_FORMAT,
     Profile,
     check_dataset,
@@ -53,12 +55,13 @@ from utils.general import (
     non_max_suppression,
     print_args,
     scale_boxes,
+    span,
     xywh2xyxy,
     xyxy2xywh,
 )
 from utils.metrics import ConfusionMatrix, ap_per_class, box_iou
 from utils.plots import output_to_target, plot_images, plot_val_study
-from utils.torch_utils import select_device, smart_inference_mode
+from utils.torch_utils import SamplingProfiler, select_device, smart_inference_mode
 
 
 def save_one_txt(predn, save_conf, shape, file):
@@ -214,6 +217,10 @@ def run(
     plots=True,
     callbacks=Callbacks(),
     compute_loss=None,
+    spans=False,  # record nested timing spans, save to save_dir/spans.json
+    memory="",  # track memory per stage and batch, "rss" or "trace" (adds tracemalloc), save to save_dir/memory.json
+    profile="",  # sampling profiler, "stack", "ops" (torch.profiler) or "all", save to save_dir/profile.*
+    profile_window=(1, 0),  # profile after skipping this many batches, for this many batches (0 for all)
 ):
     """
     Evaluates a YOLOv5 model on a dataset and logs performance metrics.
@@ -249,222 +256,270 @@ def run(
         plots (bool, optional): Plot validation images and metrics. Default is True.
         callbacks (utils.callbacks.Callbacks, optional): Callbacks for logging and monitoring. Default is Callbacks().
         compute_loss (function, optional): Loss function for training. Default is None.
+        spans (bool, optional): Record pre-process, inference, loss, NMS and metrics spans with nested model spans, log
+            their statistics and save them to 'spans.json' in the results directory. Spans opened by a caller such as
+            train.py are recorded regardless. Default is False.
+        memory (str, optional): If "rss", track the RSS each span adds and sample RSS and native heap after every
+            batch; "trace" also samples tracemalloc and reports the allocation sites that grew. Logs peak and
+            steady-state growth and saves them to 'memory.json' in the results directory. Default is "" (off).
+        profile (str, optional): If "stack", sample the Python stacks of all threads and save them as
+            'profile.collapsed' for flamegraphs; "ops" records torch operators with torch.profiler into
+            'profile_ops.txt'; "all" does both. The configuration is saved to 'profile.json'. Ignored when called by
+            train.py. Default is "" (off).
+        profile_window (tuple[int, int], optional): Batches to skip before profiling and batches to profile, 0 for all
+            remaining. Default is (1, 0).
 
     Returns:
         dict: Contains performance metrics including precision, recall, mAP50, and mAP50-95.
     """
     # Initialize/load model and set device
     training = model is not None
-    if training:  # called by train.py
-        device, pt, jit, engine = next(model.parameters()).device, True, False, False  # get model device, PyTorch model
-        half &= device.type != "cpu"  # half precision only supported on CUDA
-        model.half() if half else model.float()
-    else:  # called directly
-        device = select_device(device, batch_size=batch_size)
-
-        # Directories
-        save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
-        (save_dir / "labels" if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
-
-        # Load model
-        model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
-        stride, pt, jit, engine = model.stride, model.pt, model.jit, model.engine
-        imgsz = check_img_size(imgsz, s=stride)  # check image size
-        half = model.fp16  # FP16 supported on limited backends with CUDA
-        if engine:
-            batch_size = model.batch_size
-        else:
-            device = model.device
-            if not (pt or jit):
-                batch_size = 1  # export.py models default to batch-size 1
-                LOGGER.info(f"Forcing --batch-size 1 square inference (1,3,{imgsz},{imgsz}) for non-PyTorch models")
-
-        # Data
-        data = check_dataset(data)  # check
-
-    # Configure
-    model.eval()
-    cuda = device.type != "cpu"
-    is_coco = isinstance(data.get("val"), str) and data["val"].endswith(f"coco{os.sep}val2017.txt")  # COCO dataset
-    nc = 1 if single_cls else int(data["nc"])  # number of classes
-    iouv = torch.linspace(0.5, 0.95, 10, device=device)  # iou vector for mAP@0.5:0.95
-    niou = iouv.numel()
-
-    # Dataloader
-    if not training:
-        if pt and not single_cls:  # check --weights are trained on --data
-            ncm = model.model.nc
-            assert ncm == nc, (
-                f"{weights} ({ncm} classes) trained on different --data than what you passed ({nc} "
-                f"classes). Pass correct combination of --weights and --data that are trained together."
-            )
-        model.warmup(imgsz=(1 if pt else batch_size, 3, imgsz, imgsz))  # warmup
-        pad, rect = (0.0, False) if task == "speed" else (0.5, pt)  # square inference for benchmarks
-        task = task if task in ("train", "val", "test") else "val"  # path to train/val/test images
-        dataloader = create_dataloader(
-            data[task],
-            imgsz,
-            batch_size,
-            stride,
-            single_cls,
-            pad=pad,
-            rect=rect,
-            workers=workers,
-            prefix=colorstr(f"{task}: "),
-        )[0]
-
-    seen = 0
-    confusion_matrix = ConfusionMatrix(nc=nc)
-    names = model.names if hasattr(model, "names") else model.module.names  # get class names
-    if isinstance(names, (list, tuple)):  # old format
-        names = dict(enumerate(names))
-    class_map = coco80_to_coco91_class() if is_coco else list(range(1000))
-    s = ("%22s" + "%11s" * 6) % ("Class", "Images", "Instances", "P", "R", "mAP50", "mAP50-95")
-    tp, fp, p, r, f1, mp, mr, map50, ap50, map = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-    dt = Profile(device=device), Profile(device=device), Profile(device=device)  # profiling times
-    loss = torch.zeros(3, device=device)
-    jdict, stats, ap, ap_class = [], [], [], []
-    callbacks.run("on_val_start")
-    pbar = tqdm(dataloader, desc=s, bar_format=TQDM_BAR_FORMAT)  # progress bar
-    for batch_i, (im, targets, paths, shapes) in enumerate(pbar):
-        callbacks.run("on_val_batch_start")
-        with dt[0]:
-            if cuda:
-                im = im.to(device, non_blocking=True)
-                targets = targets.to(device)
-            im = im.half() if half else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            nb, _, height, width = im.shape  # batch size, channels, height, width
-
-        # Inference
-        with dt[1]:
-            preds, train_out = model(im) if compute_loss else (model(im, augment=augment), None)
-
-        # Loss
-        if compute_loss:
-            loss += compute_loss(train_out, targets)[1]  # box, obj, cls
-
-        # NMS
-        targets[:, 2:] *= torch.tensor((width, height, width, height), device=device)  # to pixels
-        lb = [targets[targets[:, 0] == i, 1:] for i in range(nb)] if save_hybrid else []  # for autolabelling
-        with dt[2]:
-            preds = non_max_suppression(
-                preds, conf_thres, iou_thres, labels=lb, multi_label=True, agnostic=single_cls, max_det=max_det
-            )
-
-        # Metrics
-        for si, pred in enumerate(preds):
-            labels = targets[targets[:, 0] == si, 1:]
-            nl, npr = labels.shape[0], pred.shape[0]  # number of labels, predictions
-            path, shape = Path(paths[si]), shapes[si][0]
-            correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
-            seen += 1
-
-            if npr == 0:
+    record = spans and not training  # spans opened by train.py are reported there
+    if record:
+        SPANS.reset()
+        SPANS.enabled = True
+    try:
+        if training:  # called by train.py
+            # get model device, PyTorch model
+            device, pt, jit, engine = next(model.parameters()).device, True, False, False
+            half &= device.type != "cpu"  # half precision only supported on CUDA
+            model.half() if half else model.float()
+        else:  # called directly
+            if memory:
+                MEMORY.start(trace=memory == "trace")
+            device = select_device(device, batch_size=batch_size)
+
+            # Directories
+            save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
+            (save_dir / "labels" if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
+
+            # Load model
+            model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+            stride, pt, jit, engine = model.stride, model.pt, model.jit, model.engine
+            imgsz = check_img_size(imgsz, s=stride)  # check image size
+            half = model.fp16  # FP16 supported on limited backends with CUDA
+            if engine:
+                batch_size = model.batch_size
+            else:
+                device = model.device
+                if not (pt or jit):
+                    batch_size = 1  # export.py models default to batch-size 1
+                    LOGGER.info(f"Forcing --batch-size 1 square inference (1,3,{imgsz},{imgsz}) for non-PyTorch models")
+            if model.nms:
+                LOGGER.warning("WARNING ⚠️ model includes NMS, mAP uses its export --conf-thres and --iou-thres")
+
+            # Data
+            data = check_dataset(data)  # check
+
+        # Configure
+        model.eval()
+        cuda = device.type != "cpu"
+        is_coco = isinstance(data.get("val"), str) and data["val"].endswith(f"coco{os.sep}val2017.txt")  # COCO dataset
+        nc = 1 if single_cls else int(data["nc"])  # number of classes
+        iouv = torch.linspace(0.5, 0.95, 10, device=device)  # iou vector for mAP@0.5:0.95
+        niou = iouv.numel()
+
+        # Dataloader
+        if not training:
+            if pt and not single_cls:  # check --weights are trained on --data
+                ncm = model.model.nc
+                assert ncm == nc, (
+                    f"{weights} ({ncm} classes) trained on different --data than what you passed ({nc} "
+                    f"classes). Pass correct combination of --weights and --data that are trained together."
+                )
+            model.warmup(imgsz=(1 if pt else batch_size, 3, imgsz, imgsz))  # warmup
+            pad, rect = (0.0, False) if task == "speed" else (0.5, pt)  # square inference for benchmarks
+            task = task if task in ("train", "val", "test") else "val"  # path to train/val/test images
+            dataloader = create_dataloader(
+                data[task],
+                imgsz,
+                batch_size,
+                stride,
+                single_cls,
+                pad=pad,
+                rect=rect,
+                workers=workers,
+                prefix=colorstr(f"{task}: "),
+            )[0]
+
+        seen = 0
+        confusion_matrix = ConfusionMatrix(nc=nc)
+        names = model.names if hasattr(model, "names") else model.module.names  # get class names
+        if isinstance(names, (list, tuple)):  # old format
+            names = dict(enumerate(names))
+        class_map = coco80_to_coco91_class() if is_coco else list(range(1000))
+        s = ("%22s" + "%11s" * 6) % ("Class", "Images", "Instances", "P", "R", "mAP50", "mAP50-95")
+        tp, fp, p, r, f1, mp, mr, map50, ap50, map = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+        dt = (
+            Profile(device=device, name="preprocess"),
+            Profile(device=device, name="inference"),
+            Profile(device=device, name="nms"),
+        )  # profiling times
+        loss = torch.zeros(3, device=device)
+        jdict, stats, ap, ap_class = [], [], [], []
+        callbacks.run("on_val_start")
+        profiler = SamplingProfiler(profile, profile_window) if profile and not training else None
+        pbar = tqdm(dataloader, desc=s, bar_format=TQDM_BAR_FORMAT)  # progress bar
+        for batch_i, (im, targets, paths, shapes) in enumerate(pbar):
+            callbacks.run("on_val_batch_start")
+            with dt[0]:
+                if cuda:
+                    im = im.to(device, non_blocking=True)
+                    targets = targets.to(device)
+                im = im.half() if half else im.float()  # uint8 to fp16/32
+                im /= 255  # 0 - 255 to 0.0 - 1.0
+                nb, _, height, width = im.shape  # batch size, channels, height, width
+
+            # Inference
+            with dt[1]:
+                preds, train_out = model(im) if compute_loss else (model(im, augment=augment), None)
+
+            # Loss
+            if compute_loss:
+                with span("loss"):
+                    loss += compute_loss(train_out, targets)[1]  # box, obj, cls
+
+            # NMS
+            targets[:, 2:] *= torch.tensor((width, height, width, height), device=device)  # to pixels
+            lb = [targets[targets[:, 0] == i, 1:] for i in range(nb)] if save_hybrid else []  # for autolabelling
+            with dt[2]:
+                if not getattr(model, "nms", False):  # ONNX models exported with --nms return final detections
+                    preds = non_max_suppression(
+                        preds, conf_thres, iou_thres, labels=lb, multi_label=True, agnostic=single_cls, max_det=max_det
+                    )
+
+            # Metrics
+            for si, pred in enumerate(preds):
+                labels = targets[targets[:, 0] == si, 1:]
+                nl, npr = labels.shape[0], pred.shape[0]  # number of labels, predictions
+                path, shape = Path(paths[si]), shapes[si][0]
+                correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
+                seen += 1
+
+                if npr == 0:
+                    if nl:
+                        stats.append((correct, *torch.zeros((2, 0), device=device), labels[:, 0]))
+                        if plots:
+                            confusion_matrix.process_batch(detections=None, labels=labels[:, 0])
+                    continue
+
+                # Predictions
+                if single_cls:
+                    pred[:, 5] = 0
+                predn = pred.clone()
+                scale_boxes(im[si].shape[1:], predn[:, :4], shape, shapes[si][1])  # native-space pred
+
+                # Evaluate
                 if nl:
-                    stats.append((correct, *torch.zeros((2, 0), device=device), labels[:, 0]))
+                    tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
+                    scale_boxes(im[si].shape[1:], tbox, shape, shapes[si][1])  # native-space labels
+                    labelsn = torch.cat((labels[:, 0:1], tbox), 1)  # native-space labels
+                    correct = process_batch(predn, labelsn, iouv)
                     if plots:
-                        confusion_matrix.process_batch(detections=None, labels=labels[:, 0])
-                continue
-
-            # Predictions
-            if single_cls:
-                pred[:, 5] = 0
-            predn = pred.clone()
-            scale_boxes(im[si].shape[1:], predn[:, :4], shape, shapes[si][1])  # native-space pred
-
-            # Evaluate
-            if nl:
-                tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
-                scale_boxes(im[si].shape[1:], tbox, shape, shapes[si][1])  # native-space labels
-                labelsn = torch.cat((labels[:, 0:1], tbox), 1)  # native-space labels
-                correct = process_batch(predn, labelsn, iouv)
-                if plots:
-                    confusion_matrix.process_batch(predn, labelsn)
-            stats.append((correct, pred[:, 4], pred[:, 5], labels[:, 0]))  # (correct, conf, pcls, tcls)
-
-            # Save/log
-            if save_txt:
-                (save_dir / "labels").mkdir(parents=True, exist_ok=True)
-                save_one_txt(predn, save_conf, shape, file=save_dir / "labels" / f"{path.stem}.txt")
-            if save_json:
-                save_one_json(predn, jdict, path, class_map)  # append to COCO-JSON dictionary
-            callbacks.run("on_val_image_end", pred, predn, path, names, im[si])
-
-        # Plot images
-        if plots and batch_i < 3:
-            plot_images(im, targets, paths, save_dir / f"val_batch{batch_i}_labels.jpg", names)  # labels
-            plot_images(im, output_to_target(preds), paths, save_dir / f"val_batch{batch_i}_pred.jpg", names)  # pred
-
-        callbacks.run("on_val_batch_end", batch_i, im, targets, paths, shapes, preds)
-
-    # Compute metrics
-    stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*stats)]  # to numpy
-    if len(stats) and stats[0].any():
-        tp, fp, p, r, f1, ap, ap_class = ap_per_class(*stats, plot=plots, save_dir=save_dir, names=names)
-        ap50, ap = ap[:, 0], ap.mean(1)  # AP@0.5, AP@0.5:0.95
-        mp, mr, map50, map = p.mean(), r.mean(), ap50.mean(), ap.mean()
-    nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
-
-    # Print results
-    pf = "%22s" + "%11i" * 2 + "%11.3g" * 4  # print format
-    LOGGER.info(pf % ("all", seen, nt.sum(), mp, mr, map50, map))
-    if nt.sum() == 0:
-        LOGGER.warning(f"WARNING ⚠️ no labels found in {task} set, can not compute metrics without labels")
-
-    # Print results per class
-    if (verbose or (nc < 50 and not training)) and nc > 1 and len(stats):
+                        confusion_matrix.process_batch(predn, labelsn)
+                stats.append((correct, pred[:, 4], pred[:, 5], labels[:, 0]))  # (correct, conf, pcls, tcls)
+
+                # Save/log
+                if save_txt:
+                    (save_dir / "labels").mkdir(parents=True, exist_ok=True)
+                    save_one_txt(predn, save_conf, shape, file=save_dir / "labels" / f"{path.stem}.txt")
+                if save_json:
+                    save_one_json(predn, jdict, path, class_map)  # append to COCO-JSON dictionary
+                callbacks.run("on_val_image_end", pred, predn, path, names, im[si])
+
+            # Plot images
+            if plots and batch_i < 3:
+                plot_images(im, targets, paths, save_dir / f"val_batch{batch_i}_labels.jpg", names)  # labels
+                f = save_dir / f"val_batch{batch_i}_pred.jpg"
+                plot_images(im, output_to_target(preds), paths, f, names)  # pred
+
+            callbacks.run("on_val_batch_end", batch_i, im, targets, paths, shapes, preds)
+            MEMORY.sample(batch_i)
+            if profiler:
+                profiler.step()
+
+        # Compute metrics
+        stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*stats)]  # to numpy
+        if len(stats) and stats[0].any():
+            with span("metrics"):
+                tp, fp, p, r, f1, ap, ap_class = ap_per_class(*stats, plot=plots, save_dir=save_dir, names=names)
+            ap50, ap = ap[:, 0], ap.mean(1)  # AP@0.5, AP@0.5:0.95
+            mp, mr, map50, map = p.mean(), r.mean(), ap50.mean(), ap.mean()
+        nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
+
+        # Print results
+        pf = "%22s" + "%11i" * 2 + "%11.3g" * 4  # print format
+        LOGGER.info(pf % ("all", seen, nt.sum(), mp, mr, map50, map))
+        if nt.sum() == 0:
+            LOGGER.warning(f"WARNING ⚠️ no labels found in {task} set, can not compute metrics without labels")
+
+        # Print results per class
+        if (verbose or (nc < 50 and not training)) and nc > 1 and len(stats):
+            for i, c in enumerate(ap_class):
+                LOGGER.info(pf % (names[c], seen, nt[c], p[i], r[i], ap50[i], ap[i]))
+
+        # Print speeds
+        t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
+        if not training:
+            shape = (batch_size, 3, imgsz, imgsz)
+            LOGGER.info(f"Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {shape}" % t)
+
+        # Plots
+        if plots:
+            confusion_matrix.plot(save_dir=save_dir, names=list(names.values()))
+            callbacks.run("on_val_end", nt, tp, fp, p, r, f1, ap, ap50, ap_class, confusion_matrix)
+
+        # Save JSON
+        if save_json and len(jdict):
+            w = weights[0] if isinstance(weights, list) else weights
+            w = Path(w).stem if weights is not None else ""  # weights
+            anno_json = str(Path("../datasets/coco/annotations/instances_val2017.json"))  # annotations
+            if not os.path.exists(anno_json):
+                anno_json = os.path.join(data["path"], "annotations", "instances_val2017.json")
+            pred_json = str(save_dir / f"{w}_predictions.json")  # predictions
+            LOGGER.info(f"\nEvaluating pycocotools mAP... saving {pred_json}...")
+            with open(pred_json, "w") as f:
+                json.dump(jdict, f)
+
+            try:  # https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocoEvalDemo.ipynb
+                check_requirements("pycocotools>=2.0.6")
+                from pycocotools.coco import COCO
+                from pycocotools.cocoeval import COCOeval
+
+                anno = COCO(anno_json)  # init annotations api
+                pred = anno.loadRes(pred_json)  # init predictions api
+                eval = COCOeval(anno, pred, "bbox")
+                if is_coco:
+                    # image IDs to evaluate
+                    eval.params.imgIds = [int(Path(x).stem) for x in dataloader.dataset.im_files]
+                eval.evaluate()
+                eval.accumulate()
+                eval.summarize()
+                map, map50 = eval.stats[:2]  # update results (mAP@0.5:0.95, mAP@0.5)
+            except Exception as e:
+                LOGGER.info(f"pycocotools unable to run: {e}")
+
+        # Return results
+        model.float()  # for training
+        if not training:
+            n = len(list(save_dir.glob("labels/*.txt")))
+            s = f"\n{n} labels saved to {save_dir / 'labels'}" if save_txt else ""
+            LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
+            if memory:
+                MEMORY.stop()
+                MEMORY.print()
+                MEMORY.save(save_dir / "memory.json")
+            if profiler:
+                profiler.save(save_dir, weights=weights, data=data, batch_size=batch_size, imgsz=imgsz, device=device)
+        maps = np.zeros(nc) + map
         for i, c in enumerate(ap_class):
-            LOGGER.info(pf % (names[c], seen, nt[c], p[i], r[i], ap50[i], ap[i]))
-
-    # Print speeds
-    t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
-    if not training:
-        shape = (batch_size, 3, imgsz, imgsz)
-        LOGGER.info(f"Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {shape}" % t)
-
-    # Plots
-    if plots:
-        confusion_matrix.plot(save_dir=save_dir, names=list(names.values()))
-        callbacks.run("on_val_end", nt, tp, fp, p, r, f1, ap, ap50, ap_class, confusion_matrix)
-
-    # Save JSON
-    if save_json and len(jdict):
-        w = Path(weights[0] if isinstance(weights, list) else weights).stem if weights is not None else ""  # weights
-        anno_json = str(Path("../datasets/coco/annotations/instances_val2017.json"))  # annotations
-        if not os.path.exists(anno_json):
-            anno_json = os.path.join(data["path"], "annotations", "instances_val2017.json")
-        pred_json = str(save_dir / f"{w}_predictions.json")  # predictions
-        LOGGER.info(f"\nEvaluating pycocotools mAP... saving {pred_json}...")
-        with open(pred_json, "w") as f:
-            json.dump(jdict, f)
-
-        try:  # https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocoEvalDemo.ipynb
-            check_requirements("pycocotools>=2.0.6")
-            from pycocotools.coco import COCO
-            from pycocotools.cocoeval import COCOeval
-
-            anno = COCO(anno_json)  # init annotations api
-            pred = anno.loadRes(pred_json)  # init predictions api
-            eval = COCOeval(anno, pred, "bbox")
-            if is_coco:
-                eval.params.imgIds = [int(Path(x).stem) for x in dataloader.dataset.im_files]  # image IDs to evaluate
-            eval.evaluate()
-            eval.accumulate()
-            eval.summarize()
-            map, map50 = eval.stats[:2]  # update results (mAP@0.5:0.95, mAP@0.5)
-        except Exception as e:
-            LOGGER.info(f"pycocotools unable to run: {e}")
-
-    # Return results
-    model.float()  # for training
-    if not training:
-        s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ""
-        LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
-    maps = np.zeros(nc) + map
-    for i, c in enumerate(ap_class):
-        maps[c] = ap[i]
-    return (mp, mr, map50, map, *(loss.cpu() / len(dataloader)).tolist()), maps, t
+            maps[c] = ap[i]
+        return (mp, mr, map50, map, *(loss.cpu() / len(dataloader)).tolist()), maps, t
+    finally:
+        if record:  # also when validation fails
+            SPANS.enabled = False
+            SPANS.print()
+            SPANS.save(save_dir / "spans.json")
 
 
 def parse_opt():
@@ -494,6 +549,13 @@ def parse_opt():
         exist_ok (bool, optional): If set, existing directory will not be incremented. Default is False.
         half (bool, optional): If set, uses FP16 half-precision inference. Default is False.
         dnn (bool, optional): If set, uses OpenCV DNN for ONNX inference. Default is False.
+        spans (bool, optional): If set, records nested timing spans and saves them to spans.json. Default is False.
+        memory (str, optional): Tracks memory per stage and batch ('rss', or 'trace' with tracemalloc) and saves it
+            to memory.json. Default is 'rss' when given without a value, else off.
+        profile (str, optional): Runs the sampling profiler ('stack', 'ops' or 'all') and saves profile.collapsed,
+            profile_ops.txt and profile.json. Default is 'all' when given without a value, else off.
+        profile_window (int, int, optional): Batches to skip before profiling and batches to profile (0 for all).
+            Default is 1 0.
 
     Returns:
         argparse.Namespace: Parsed command-line options.
@@ -537,6 +599,14 @@ def parse_opt():
     parser.add_argument("--exist-ok", action="store_true", help="existing project/name ok, do not increment")
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
+    parser.add_argument("--spans", action="store_true", help="record nested timing spans to save_dir/spans.json")
+    parser.add_argument(
+        "--memory", nargs="?", const="rss", default="", choices=["rss", "trace"], help="track memory, --memory [trace]"
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="all", default="", choices=["stack", "ops", "all"], help="sampling profiler"
+    )
+    parser.add_argument("--profile-window", nargs=2, type=int, default=[1, 0], help="batches to skip, then to profile")
     opt = parser.parse_args()
     opt.data = check_yaml(opt.data)  # check YAML
     opt.save_json |= opt.data.endswith("coco.yaml")